@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+"""
+增量警示規則（每份快照只看有變動的列、只跑跟變動欄位有關的規則）
+規則檔（JSON）：
+  [
+    {"name": "價差過大", "when": "買賣價差比 > 3"},
+    {"name": "隱波跳升", "when": "chg(買價隱波) >= 5", "cooldown": 600},
+    {"name": "標的動權證沒跟", "when": "abs(pct(標的價)) >= 1 and chg(買價) == 0", "wids": ["03111U"]}
+  ]
+- when：欄位名（HEADER_ORDER 裡的欄位 + 下面的衍生欄位）、數字 / 字串、+ - * /、比較、and / or / not，
+  函式 chg(欄位)（跟上一份的差）、pct(欄位)（變動 %）、prev(欄位)（上一份的值）、abs / min / max
+- 衍生欄位：標的價（標的現價，沒有就用標的股價）、中價、價差、隱波價差
+- 數值欄位（core.FLOAT_FIELDS）自動轉 float；缺值參與運算或比較時整條規則視為不成立
+- 索引：規則依「用到的欄位」（有 wids 的再依 WID）建索引；某列只有成交價變了，
+  就只跑用到成交價的規則
+- 向量化：一份快照裡有變動的列組成 numpy 欄陣列，每條規則對「相關欄位有變的那些列」一次算完
+  （and / or / not 轉成 & | ~，比較鏈拆開）；Python 迴圈只跑在真的成立的列上
+- 去重：
+    只看目前值的規則 → 由不成立變成立才觸發，持續成立不重複；
+    用到 chg / pct / prev 的規則 → 每次相關欄位真的變動且成立就觸發（本身就是事件）；
+    兩者都受 cooldown（秒）限制，同一規則同一檔在這段時間內最多觸發一次
+可用環境變數：
+  - ALERT_RULES=rules.json   website.py 設了才啟用（/api/alerts）
+  - ALERT_KEEP=1000          保留最近幾筆觸發紀錄
+"""
+
+import ast
+import json
+import os
+import threading
+import time
+from collections import deque
+from functools import reduce
+
+import numpy as np
+
+import metrics
+from core import FLOAT_FIELDS, HEADER_ORDER, to_float
+
+ALERT_KEEP = int(os.getenv("ALERT_KEEP", "1000"))
+METRIC_LEVELS = ("info", "warning", "critical")   # warrant_alerts_total 的 level label 只用這幾種，其他算 other
+
+
+def _pick(a, b):
+    return np.where(np.isnan(a), b, a)
+
+
+DERIVED = {
+    "標的價": (("標的現價", "標的股價"), lambda v: _pick(v("標的現價"), v("標的股價"))),
+    "中價": (("買價", "賣價"), lambda v: (v("買價") + v("賣價")) / 2),
+    "價差": (("買價", "賣價"), lambda v: v("賣價") - v("買價")),
+    "隱波價差": (("買價隱波", "賣價隱波"), lambda v: v("賣價隱波") - v("買價隱波")),
+}
+FIELDS = set(HEADER_ORDER) | {"標的現價"} | set(DERIVED)
+SERIES_FUNCS = {"chg", "pct", "prev"}
+PLAIN_FUNCS = {
+    "abs": np.abs,
+    "min": lambda *a: reduce(np.minimum, a),
+    "max": lambda *a: reduce(np.maximum, a),
+}
+
+_ALLOWED = (
+    ast.Expression, ast.BoolOp, ast.And, ast.Or, ast.UnaryOp, ast.Not, ast.USub, ast.UAdd,
+    ast.BinOp, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Compare, ast.Eq, ast.NotEq,
+    ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.Name, ast.Load, ast.Constant, ast.Call,
+)
+
+
+def _is_numeric(name):
+    return name in FLOAT_FIELDS or name in DERIVED
+
+
+def _base_fields(name):
+    return DERIVED[name][0] if name in DERIVED else (name,)
+
+
+class _Vectorize(ast.NodeTransformer):
+    """布林運算改成逐元素：and → &、or → |、not → ~、a < b < c → (a < b) & (b < c)。"""
+
+    def visit_BoolOp(self, node):
+        self.generic_visit(node)
+        op = ast.BitAnd() if isinstance(node.op, ast.And) else ast.BitOr()
+        return reduce(lambda a, b: ast.BinOp(a, op, b), node.values)
+
+    def visit_UnaryOp(self, node):
+        self.generic_visit(node)
+        if isinstance(node.op, ast.Not):
+            return ast.UnaryOp(ast.Invert(), node.operand)
+        return node
+
+    def visit_Compare(self, node):
+        self.generic_visit(node)
+        terms = [node.left, *node.comparators]
+        parts = [ast.Compare(terms[i], [op], [terms[i + 1]]) for i, op in enumerate(node.ops)]
+        return reduce(lambda a, b: ast.BinOp(a, ast.BitAnd(), b), parts)
+
+
+class Rule:
+    def __init__(self, spec):
+        self.name = str(spec.get("name") or spec.get("when"))
+        self.when = str(spec["when"])
+        self.wids = set(spec["wids"]) if spec.get("wids") else None
+        self.cooldown = float(spec.get("cooldown", 0))
+        self.level = str(spec.get("level", "warning"))
+        self.deps = set()        # 相關的原始欄位（決定要不要跑）
+        self.leaves = set()      # (函式或 None, 欄位)：值缺的列整條規則不成立
+        tree = ast.parse(self.when, mode="eval")
+        for node in ast.walk(tree):
+            if not isinstance(node, _ALLOWED):
+                raise ValueError(f"規則「{self.name}」不支援的語法：{type(node).__name__}")
+            if isinstance(node, ast.Call):
+                fn = getattr(node.func, "id", None)
+                if fn in SERIES_FUNCS:
+                    if len(node.args) != 1 or not isinstance(node.args[0], ast.Name):
+                        raise ValueError(f"規則「{self.name}」：{fn}() 只能放一個欄位名")
+                    # chg(成交價) → chg("成交價")，欄位名不要被當成目前值
+                    field = node.args[0].id
+                    node.args[0] = ast.copy_location(ast.Constant(field), node.args[0])
+                    self._dep(fn, field)
+                elif fn not in PLAIN_FUNCS:
+                    raise ValueError(f"規則「{self.name}」不支援的函式：{fn}")
+            elif isinstance(node, ast.Name) and node.id not in SERIES_FUNCS and node.id not in PLAIN_FUNCS:
+                self._dep(None, node.id)
+        self.relative = any(fn for fn, _ in self.leaves)
+        tree = ast.fix_missing_locations(_Vectorize().visit(tree))
+        self.code = compile(tree, f"<rule {self.name}>", "eval")
+
+    def _dep(self, fn, name):
+        if name not in FIELDS:
+            raise ValueError(f"規則「{self.name}」用到未知的欄位：{name}")
+        self.deps.update(_base_fields(name))
+        self.leaves.add((fn, name))
+
+
+class _Batch(dict):
+    """一份快照中有變動的列；eval 的 locals，欄陣列用到才建（之後各規則共用）。"""
+
+    def __init__(self, rows, prevs):
+        super().__init__(PLAIN_FUNCS)
+        self.rows, self.prevs = rows, prevs
+        self.n = len(rows)
+        self._cols = {}
+        self._missing = {}
+        self["chg"] = lambda f: self.col(f) - self.col(f, prev=True)
+        self["pct"] = self._pct
+        self["prev"] = lambda f: self.col(f, prev=True)
+
+    def __missing__(self, name):
+        v = self[name] = self.col(name)
+        return v
+
+    def col(self, name, prev=False):
+        key = (name, prev)
+        c = self._cols.get(key)
+        if c is None:
+            if name in DERIVED:
+                with np.errstate(invalid="ignore"):
+                    c = DERIVED[name][1](lambda f: self.col(f, prev))
+            else:
+                src = self.prevs if prev else self.rows
+                if name in FLOAT_FIELDS:
+                    c = np.array([np.nan if r is None or (v := to_float(r.get(name))) is None else v for r in src])
+                else:
+                    c = np.array(["" if r is None else str(r.get(name) or "") for r in src], dtype=object)
+            c = self._cols[key] = c
+        return c
+
+    def _pct(self, f):
+        a, b = self.col(f), self.col(f, prev=True)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(b == 0, np.nan, (a - b) / b * 100)
+
+    def missing(self, fn, name):
+        """這個值缺的列（文字欄位不算缺）。"""
+        key = (fn, name)
+        m = self._missing.get(key)
+        if m is None:
+            if not _is_numeric(name):
+                m = np.zeros(self.n, dtype=bool)
+            else:
+                m = np.isnan(self.col(name))
+                if fn:
+                    m = m | np.isnan(self.col(name, prev=True))
+            self._missing[key] = m
+        return m
+
+
+def load_rules(path):
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return [Rule(s) for s in (data["rules"] if isinstance(data, dict) else data)]
+
+
+class AlertEngine:
+    def __init__(self, rules, keep=ALERT_KEEP):
+        self.rules = list(rules)
+        self.by_field = {}       # 欄位 -> [規則索引]（不限 WID 的規則）
+        self.by_field_wid = {}   # (欄位, WID) -> [規則索引]
+        for i, rule in enumerate(self.rules):
+            for f in rule.deps:
+                if rule.wids is None:
+                    self.by_field.setdefault(f, []).append(i)
+                else:
+                    for wid in rule.wids:
+                        self.by_field_wid.setdefault((f, wid), []).append(i)
+        self._last = {}          # WID -> 上一份的列
+        self._active = {}        # 規則索引 -> 目前成立中的 WID（只看目前值的規則）
+        self._fired_at = {}      # (規則索引, WID) -> 上次觸發時間
+        self._broken = set()     # 算不出來（型別不合）的規則，只警告一次
+        self.recent = deque(maxlen=keep)
+        self.listeners = []      # fn(alert)
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def update(self, rows, ts=None):
+        """一份快照進來；回傳這次觸發的警示 list。"""
+        ts = time.time() if ts is None else ts
+        with self._lock:
+            fired = self._update(rows, ts)
+        for a in fired:
+            # 規則可能上千條，用規則名當 label 會炸出上千條時間序列；level 也是自由填的，只收固定幾種
+            metrics.inc("warrant_alerts_total", level=a["level"] if a["level"] in METRIC_LEVELS else "other")
+            for fn in list(self.listeners):
+                fn(a)
+        return fired
+
+    def _update(self, rows, ts):
+        batch_rows, prevs, wids = [], [], []
+        changed = {}             # 欄位 -> 有變的列（batch 內索引）
+        cand = set()
+        for r in rows:
+            wid = r.get("WID")
+            if not wid or "成交價" not in r:
+                continue
+            prev = self._last.get(wid)
+            self._last[wid] = r
+            fields = list(r) if prev is None else [k for k, v in r.items() if prev.get(k) != v]
+            if not fields:
+                continue
+            j = len(batch_rows)
+            batch_rows.append(r)
+            prevs.append(prev)
+            wids.append(wid)
+            for f in fields:
+                changed.setdefault(f, []).append(j)
+                cand.update(self.by_field.get(f, ()))
+                cand.update(self.by_field_wid.get((f, wid), ()))
+        if not cand:
+            return []
+        batch = _Batch(batch_rows, prevs)
+        masks = {}
+        for f, idx in changed.items():
+            m = masks[f] = np.zeros(batch.n, dtype=bool)
+            m[idx] = True
+        pos = {w: j for j, w in enumerate(wids)}
+        fired = []
+        for i in sorted(cand):
+            rule = self.rules[i]
+            todo = reduce(np.logical_or, (masks[f] for f in rule.deps if f in masks))
+            if rule.wids is not None:
+                only = np.zeros(batch.n, dtype=bool)
+                only[[pos[w] for w in rule.wids if w in pos]] = True
+                todo &= only
+            fired.extend(self._eval(i, rule, batch, todo, wids, pos, ts))
+        return fired
+
+    def _eval(self, i, rule, batch, todo, wids, pos, ts):
+        try:
+            with np.errstate(invalid="ignore", divide="ignore"):
+                ok = np.broadcast_to(np.asarray(eval(rule.code, {"__builtins__": {}}, batch), dtype=bool), todo.shape)
+        except TypeError as e:
+            if i not in self._broken:
+                self._broken.add(i)
+                print(f"[ALERT] 規則「{rule.name}」算不出來：{e}", flush=True)
+            return []
+        for leaf in rule.leaves:
+            ok = ok & ~batch.missing(*leaf)
+        active = self._active.setdefault(i, set())
+        if active:  # 相關欄位變了、現在不成立的 → 解除
+            for wid in list(active):
+                j = pos.get(wid)
+                if j is not None and todo[j] and not ok[j]:
+                    active.discard(wid)
+        out = []
+        for j in np.flatnonzero(ok & todo):
+            wid = wids[j]
+            if not rule.relative:
+                if wid in active:
+                    continue
+                active.add(wid)
+            key = (i, wid)
+            if ts - self._fired_at.get(key, float("-inf")) < rule.cooldown:
+                continue
+            self._fired_at[key] = ts
+            self._seq += 1
+            row = batch.rows[j]
+            alert = {
+                "id": self._seq, "ts": ts, "rule": rule.name, "level": rule.level, "wid": wid, "when": rule.when,
+                "values": {f: row.get(f) for f in sorted(rule.deps)},
+            }
+            self.recent.append(alert)
+            out.append(alert)
+        return out
+
+    def publish_snapshot(self, snap):
+        """SnapshotStore 的 listener。"""
+        self.update(snap.items, ts=snap.created)
+
+    def since(self, alert_id=0):
+        with self._lock:
+            return [a for a in self.recent if a["id"] > alert_id]
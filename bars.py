@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+"""
+歷史 K 棒（給 /api/warrants/<wid>/history 用）
+- 成交價 / 買價 / 賣價：OHLC；買價隱波 / Delta / 買賣價差比：最後值 + 平均
+- Rollups：每份快照進來就更新記憶體裡 1m / 5m / 1d 的當根 K 棒（增量，不回頭重算），
+  換根時寫進 SQLite 的 bars 表，還沒收的當根每 ROLLUP_FLUSH 秒存一次
+- 查詢：bar 剛好是 1m / 5m / 1d 直接讀表；其他長度（15m、1h…）從最接近的細 K 棒合併；
+  表裡沒有資料（例如開 rollup 前的歷史）才從差異歷史重播計算（平均值只算有變動的點，為近似值）
+- 分桶、合併都是 numpy 向量化（排序後找組界 + reduceat）
+- 同一檔同一個樣本只算一次：重疊的快照（不同 WID 組合、快取重發）會帶著同一列再進來，
+  以列的抓取時間（沒有就用快照時間）去重，否則 tick 數與平均會被重複計入
+- 查詢的起點先對齊到要的 K 棒長度，第一根不會只合併到半根的資料
+可用環境變數：
+  - ROLLUP_FLUSH=10   秒
+  - BAR_TZ_OFFSET=28800   日 K 的換日時區（秒，預設台灣 UTC+8）
+"""
+
+import json
+import os
+import re
+import time
+
+import numpy as np
+
+from core import to_float
+
+OHLC_FIELDS = ["成交價", "買價", "賣價"]
+MEAN_FIELDS = ["買價隱波", "Delta", "買賣價差比"]
+RESOLUTIONS = {"1m": 60, "5m": 300, "1d": 86400}
+ROLLUP_FLUSH = float(os.getenv("ROLLUP_FLUSH", "10"))
+BAR_TZ_OFFSET = int(os.getenv("BAR_TZ_OFFSET", str(8 * 3600)))
+
+_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_bar(text):
+    """'1m' / '15m' / '1h' / '1d' → 秒數。"""
+    m = re.fullmatch(r"\s*(\d+)\s*([smhd])\s*", str(text or ""))
+    if not m or int(m.group(1)) <= 0:
+        raise ValueError(f"看不懂的 bar：{text}（例：1m、5m、15m、1h、1d）")
+    return int(m.group(1)) * _UNITS[m.group(2)]
+
+
+def bucket(ts, res):
+    """ts（可為陣列）所在 K 棒的開始時間；日以上的 K 棒依 BAR_TZ_OFFSET 換日。"""
+    off = BAR_TZ_OFFSET if res >= 86400 else 0
+    return np.floor((np.asarray(ts, dtype=float) + off) / res) * res - off
+
+
+# ====== 向量化計算 ======
+def _groups(keys):
+    """已排序的 keys → (各組開頭索引, 各組的 key)。"""
+    if not len(keys):
+        return np.array([], dtype=int), keys
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    return starts, keys[starts]
+
+
+def _first_valid(v, starts, from_end=False):
+    """每組第一個（或最後一個）非 NaN 值。"""
+    n = len(v)
+    idx = np.arange(n, dtype=float)
+    idx[np.isnan(v)] = np.nan
+    if from_end:
+        # 每組取最大的有效索引
+        filled = np.where(np.isnan(idx), -1, idx)
+        pick = np.maximum.reduceat(filled, starts) if n else filled
+        ok = pick >= 0
+    else:
+        filled = np.where(np.isnan(idx), n, idx)
+        pick = np.minimum.reduceat(filled, starts) if n else filled
+        ok = pick < n
+    out = np.full(len(starts), np.nan)
+    out[ok] = v[pick[ok].astype(int)]
+    return out
+
+
+def _nan_reduce(fn, v, starts, fill):
+    if not len(v):
+        return np.array([])
+    r = fn.reduceat(np.where(np.isnan(v), fill, v), starts)
+    r[r == fill] = np.nan
+    return r
+
+
+def bars_from_samples(ts, values, res):
+    """原始樣本 → K 棒。ts：長度 N；values：{欄位: 長度 N 陣列（NaN = 沒值）}。"""
+    ts = np.asarray(ts, dtype=float)
+    order = np.argsort(ts, kind="stable")
+    ts = ts[order]
+    if len(ts):   # 同一時間點的重複樣本只留最後一筆
+        keep = np.r_[ts[1:] != ts[:-1], True]
+        order, ts = order[keep], ts[keep]
+    keys = bucket(ts, res)
+    starts, t = _groups(keys)
+    out = {"t": t}
+    for k in OHLC_FIELDS:
+        v = np.asarray(values.get(k, np.full(len(ts), np.nan)), dtype=float)[order]
+        out[k] = {
+            "o": _first_valid(v, starts),
+            "h": _nan_reduce(np.maximum, v, starts, -np.inf),
+            "l": _nan_reduce(np.minimum, v, starts, np.inf),
+            "c": _first_valid(v, starts, from_end=True),
+        }
+    for k in MEAN_FIELDS:
+        v = np.asarray(values.get(k, np.full(len(ts), np.nan)), dtype=float)[order]
+        ok = ~np.isnan(v)
+        s = np.add.reduceat(np.where(ok, v, 0.0), starts) if len(v) else np.array([])
+        n = np.add.reduceat(ok.astype(float), starts) if len(v) else np.array([])
+        out[k] = {"last": _first_valid(v, starts, from_end=True), "sum": s, "n": n}
+    return out
+
+
+def merge_bars(bars, res):
+    """細 K 棒 → 較粗的 K 棒（bars 的格式同 bars_from_samples 的輸出）。"""
+    keys = bucket(bars["t"], res)
+    starts, t = _groups(keys)
+    out = {"t": t}
+    for k in OHLC_FIELDS:
+        b = bars[k]
+        out[k] = {
+            "o": _first_valid(b["o"], starts),
+            "h": _nan_reduce(np.maximum, b["h"], starts, -np.inf),
+            "l": _nan_reduce(np.minimum, b["l"], starts, np.inf),
+            "c": _first_valid(b["c"], starts, from_end=True),
+        }
+    for k in MEAN_FIELDS:
+        b = bars[k]
+        out[k] = {
+            "last": _first_valid(b["last"], starts, from_end=True),
+            "sum": np.add.reduceat(b["sum"], starts) if len(t) else np.array([]),
+            "n": np.add.reduceat(b["n"], starts) if len(t) else np.array([]),
+        }
+    return out
+
+
+def to_json(bars):
+    """K 棒 → 欄式 JSON（NaN 轉 null，平均值 = sum / n）。"""
+    def col(a):
+        return [None if x != x else round(float(x), 6) for x in a]
+
+    out = {"t": [float(x) for x in bars["t"]]}
+    for k in OHLC_FIELDS:
+        out[k] = {p: col(bars[k][p]) for p in "ohlc"}
+    for k in MEAN_FIELDS:
+        b = bars[k]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(b["n"] > 0, b["sum"] / np.where(b["n"] > 0, b["n"], 1), np.nan)
+        out[k] = {"last": col(b["last"]), "mean": col(mean)}
+    return out
+
+
+# ====== 增量 rollup ======
+class Rollups:
+    """跟 History 共用同一個 SQLite 連線與鎖。"""
+
+    def __init__(self, db, lock):
+        self._db = db
+        self._lock = lock
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS bars ("
+            " wid TEXT NOT NULL, res INTEGER NOT NULL, t REAL NOT NULL, data TEXT NOT NULL,"
+            " PRIMARY KEY (wid, res, t)) WITHOUT ROWID"
+        )
+        self._db.commit()
+        self._open = {}        # (wid, res) -> [t, {欄位: 聚合值}, dirty, 最新樣本時間]
+        self._sample = {}      # wid -> 最後計入的樣本（抓取時間或快照時間），重疊快照去重用
+        self._last_flush = time.time()
+
+    @staticmethod
+    def _new_agg():
+        agg = {k: [None, None, None, None] for k in OHLC_FIELDS}        # o h l c
+        agg.update({k: [None, 0.0, 0] for k in MEAN_FIELDS})           # last sum n
+        return agg
+
+    @staticmethod
+    def _fold(agg, vals):
+        for k in OHLC_FIELDS:
+            v = vals[k]
+            if v is None:
+                continue
+            a = agg[k]
+            if a[0] is None:
+                a[0] = a[1] = a[2] = v
+            a[1], a[2], a[3] = max(a[1], v), min(a[2], v), v
+        for k in MEAN_FIELDS:
+            v = vals[k]
+            if v is not None:
+                a = agg[k]
+                a[0], a[1], a[2] = v, a[1] + v, a[2] + 1
+
+    @staticmethod
+    def _fold_late(agg, vals):
+        """比當根還舊的樣本：只併進高低點與平均，開盤 / 收盤 / last 保留原本的。"""
+        for k in OHLC_FIELDS:
+            v = vals[k]
+            if v is None:
+                continue
+            a = agg[k]
+            if a[0] is None:
+                a[0] = a[1] = a[2] = a[3] = v
+            a[1], a[2] = max(a[1], v), min(a[2], v)
+        for k in MEAN_FIELDS:
+            v = vals[k]
+            if v is not None:
+                a = agg[k]
+                a[0] = v if a[0] is None else a[0]
+                a[1], a[2] = a[1] + v, a[2] + 1
+
+    def update(self, rows, ts):
+        """一份快照的每一列（含沒變動的）都要進來，平均值才是依快照加權。呼叫端需持有鎖。"""
+        done, late = [], {}
+        starts = {res: float(bucket(ts, res)) for res in RESOLUTIONS.values()}
+        for r in rows:
+            wid = r.get("WID")
+            if not wid or "成交價" not in r:
+                continue
+            sample = r.get("抓取時間") or ts
+            if self._sample.get(wid) == sample:
+                continue
+            self._sample[wid] = sample
+            vals = {k: to_float(r.get(k)) for k in OHLC_FIELDS + MEAN_FIELDS}
+            for res, t in starts.items():
+                cur = self._open.get((wid, res))
+                if cur is not None and t < cur[0]:
+                    # 晚到的舊樣本：讀回已存的那根合併，不要重開舊桶蓋掉它
+                    key = (wid, res, t)
+                    if key not in late:
+                        late[key] = self._stored(wid, res, t) or self._new_agg()
+                        done.append((wid, res, t, late[key]))
+                    self._fold_late(late[key], vals)
+                    continue
+                if cur is None or cur[0] != t:
+                    if cur is not None and cur[2]:
+                        done.append((wid, res, cur[0], cur[1]))
+                    # 重啟後接續表裡已存的當根，不要蓋掉
+                    agg = self._stored(wid, res, t) if cur is None else None
+                    cur = self._open[(wid, res)] = [t, agg or self._new_agg(), False, ts]
+                if ts < cur[3]:
+                    self._fold_late(cur[1], vals)
+                else:
+                    self._fold(cur[1], vals)
+                    cur[3] = ts
+                cur[2] = True
+        if done or time.time() - self._last_flush >= ROLLUP_FLUSH:
+            self._flush(done)
+
+    def _stored(self, wid, res, t):
+        row = self._db.execute("SELECT data FROM bars WHERE wid = ? AND res = ? AND t = ?", (wid, res, t)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _flush(self, done):
+        items = list(done)
+        for (wid, res), cur in self._open.items():
+            if cur[2]:
+                items.append((wid, res, cur[0], cur[1]))
+                cur[2] = False
+        if items:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO bars (wid, res, t, data) VALUES (?, ?, ?, ?)",
+                [(w, r, t, json.dumps(a, separators=(",", ":"))) for w, r, t, a in items],
+            )
+            self._db.commit()
+        self._last_flush = time.time()
+
+    def flush(self):
+        with self._lock:
+            self._flush([])
+
+    def load(self, wid, res, t0, t1):
+        """讀 [t0, t1] 內的 K 棒（bars_from_samples 的格式）；沒有資料回傳 None。"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT t, data FROM bars WHERE wid = ? AND res = ? AND t >= ? AND t <= ? ORDER BY t",
+                (wid, res, float(bucket(t0, res)), t1),
+            ).fetchall()
+        if not rows:
+            return None
+        out = {"t": np.array([t for t, _ in rows], dtype=float)}
+        datas = [json.loads(d) for _, d in rows]
+
+        def arr(k, i):
+            return np.array([np.nan if d[k][i] is None else d[k][i] for d in datas], dtype=float)
+
+        for k in OHLC_FIELDS:
+            out[k] = {p: arr(k, i) for i, p in enumerate("ohlc")}
+        for k in MEAN_FIELDS:
+            out[k] = {"last": arr(k, 0), "sum": arr(k, 1), "n": arr(k, 2)}
+        return out
+
+
+def samples_from_replay(points):
+    """History.replay 的 [(ts, 列)] → (ts 陣列, {欄位: 陣列})。"""
+    ts = np.array([t for t, _ in points], dtype=float)
+    values = {}
+    for k in OHLC_FIELDS + MEAN_FIELDS:
+        values[k] = np.array([np.nan if (v := to_float(r.get(k))) is None else v for _, r in points], dtype=float)
+    return ts, values
+
+
+def query(history, wid, t0, t1, res):
+    """[t0, t1] 內長度 res 秒的 K 棒：能用 rollup 就用 rollup，否則重播差異歷史。"""
+    history.rollups.flush()  # 當根也要算進去
+    t0 = float(bucket(t0, res))   # 對齊到要的長度，第一根才是完整的
+    base = max((r for r in RESOLUTIONS.values() if res % r == 0), default=None)
+    if base is not None:
+        bars = history.rollups.load(wid, base, t0, t1)
+        if bars is not None:
+            return bars if base == res else merge_bars(bars, res)
+    points = history.replay(wid, t0, t1)
+    if not points:
+        return bars_from_samples([], {}, res)
+    ts, values = samples_from_replay(points)
+    return bars_from_samples(ts, values, res)
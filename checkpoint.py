@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+批次抓取的檢查點（SQLite，標準庫即可）
+- 每抓完一檔就寫進檢查點並 commit，Chrome 當掉 / 程式被砍也不會丟掉已完成的列
+- resume：狀態為 OK 且在新鮮度時間內的 WID 直接跳過
+- assemble：最後依 WID 清單順序從檢查點組出 xlsx / csv / parquet…
+每個 WID 只留最新一筆。
+"""
+
+import json
+import re
+import sqlite3
+import time
+
+_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_duration(text):
+    """'90' / '30m' / '2h' / '1d' → 秒數；空字串回傳 None（不限新鮮度）。"""
+    if text is None or str(text).strip() == "":
+        return None
+    m = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([smhd]?)\s*", str(text))
+    if not m:
+        raise ValueError(f"看不懂的時間長度：{text}（例：90、30m、2h、1d）")
+    return float(m.group(1)) * _UNITS[m.group(2) or "s"]
+
+
+class Checkpoint:
+    def __init__(self, path):
+        self.path = path
+        self._db = sqlite3.connect(path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS rows ("
+            " wid TEXT PRIMARY KEY, status TEXT NOT NULL, row TEXT NOT NULL, saved_at REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def save(self, row):
+        self._db.execute(
+            "INSERT OR REPLACE INTO rows (wid, status, row, saved_at) VALUES (?, ?, ?, ?)",
+            (row.get("WID", ""), row.get("狀態", ""), json.dumps(row, ensure_ascii=False, default=str), time.time()),
+        )
+        self._db.commit()
+
+    def completed(self, wids, fresh_within=None):
+        """回傳 wids 裡已完成（狀態 OK，且在 fresh_within 秒內）的 WID 集合。"""
+        cutoff = 0 if fresh_within is None else time.time() - fresh_within
+        done = set()
+        wids = list(wids)
+        for i in range(0, len(wids), 500):  # SQLite 參數數量有上限
+            chunk = wids[i : i + 500]
+            q = ",".join("?" * len(chunk))
+            done.update(w for (w,) in self._db.execute(
+                f"SELECT wid FROM rows WHERE status = 'OK' AND saved_at >= ? AND wid IN ({q})",
+                [cutoff, *chunk],
+            ))
+        return done
+
+    def rows(self, wids=None):
+        """依 wids 順序回傳檢查點裡的列（沒抓過的略過）；wids 為 None 時回傳全部。"""
+        if wids is None:
+            return [json.loads(r) for (r,) in self._db.execute("SELECT row FROM rows ORDER BY saved_at")]
+        got = {}
+        for w, r in self._db.execute("SELECT wid, row FROM rows"):
+            got[w] = r
+        return [json.loads(got[w]) for w in wids if w in got]
+
+    def close(self):
+        self._db.close()
+
+
+def assemble(ckpt, outputs, wids=None):
+    """從檢查點組出最終輸出檔；回傳寫入的列數。"""
+    from sinks import open_sinks
+
+    rows = ckpt.rows(wids)
+    sink = open_sinks(outputs)
+    try:
+        for r in rows:
+            sink.write(r)
+    finally:
+        sink.close()
+    print(f"✅ 已從檢查點 {ckpt.path} 組出 {len(rows)} 列：{', '.join(sink.paths)}")
+    return len(rows)
@@ -0,0 +1,516 @@
+# -*- coding: utf-8 -*-
+"""
+單一入口（重的套件到子命令真的要用時才 import）
+  python cli.py scrape 03111U 03162U [--headless] [--out a.xlsx --out a.parquet --out jsonl:-]
+  python cli.py scrape --checkpoint run.db --resume --fresh 2h …   # 中斷後接著跑
+  python cli.py assemble run.db [WID…] --out a.xlsx                  # 只從檢查點組檔
+  python cli.py scrape 03111U --books books.npz                     # 標的 + 權證五檔另存
+  python cli.py price 2330 2317 [--depth]  # 只打報價 API，不載入 Selenium / openpyxl
+  python cli.py export rows.jsonl --out 檔名.xlsx [--out 檔名.parquet]   # 不載入 Selenium
+  python cli.py serve [--host 0.0.0.0] [--port 5000]
+  python cli.py publish [WID…] --table /dev/shm/warrant_quotes.bin [--interval 30] [--history h.db]
+  python cli.py history h.db [WID…] --at "2026-10-19 13:30" --out 當時.xlsx   # 重建任一時間點
+  python cli.py risk positions.csv [--rows rows.jsonl | --history h.db --at …] [--json]   # 部位風險
+  python cli.py surface [WID…] [--rows rows.jsonl | --history h.db] [--out 偏離.csv]   # 隱波曲面
+  python cli.py alerts rules.json [WID…] [--rows 第1份.jsonl --rows 第2份.jsonl | --interval 30]   # 警示規則
+  python cli.py coordinator queue.db [--enqueue WID… | --universe default] [--host-limit boxA=8]   # 分散式抓取
+  python cli.py worker http://協調者:5100 [--slots 2]      # 任何主機上跑，租任務 → 抓 → 回報
+  python cli.py coordinator queue.db --collect RUN --out 結果.xlsx
+  python cli.py loadtest --clients 16 --duration 60 --wid-set 03111U,03162U*3 --out lt.json [--compare 上次.json]
+  python cli.py bench [--repeat 5]          # 量各子命令的啟動（import）時間
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+# 各子命令實際會載入的模組；bench 與 --import-only 用
+COMMAND_IMPORTS = {
+    "scrape": ["yuanta"],
+    "price": ["core", "orderbook", "requests"],
+    "export": ["sinks", "openpyxl"],
+    "assemble": ["checkpoint", "sinks", "openpyxl"],
+    "serve": ["website"],
+    "publish": ["scraper", "quotetable"],
+    "history": ["history", "sinks", "openpyxl"],
+    "risk": ["risk", "numpy"],
+    "surface": ["volsurface", "numpy"],
+    "alerts": ["alerts"],
+    "coordinator": ["workqueue", "flask"],
+    "worker": ["workqueue", "scraper"],
+    "loadtest": ["loadtest", "requests"],
+}
+
+
+def cmd_scrape(args):
+    import yuanta
+
+    from checkpoint import parse_duration
+
+    wids = args.wids or yuanta.wid_list
+    yuanta.run(wids, headless=args.headless, outputs=args.out, checkpoint=args.checkpoint,
+               resume=args.resume, fresh_within=parse_duration(args.fresh), books=args.books)
+
+
+def cmd_assemble(args):
+    from checkpoint import Checkpoint, assemble
+
+    ckpt = Checkpoint(args.checkpoint)
+    try:
+        assemble(ckpt, args.out, args.wids or None)
+    finally:
+        ckpt.close()
+
+
+def cmd_price(args):
+    if args.depth:
+        return _print_depth(args.codes)
+    from core import get_udly_best_ask_from_api
+
+    for code in args.codes:
+        px = get_udly_best_ask_from_api(code)
+        print(f"{code}\t{'' if px is None else px}")
+
+
+def _print_depth(codes):
+    import orderbook
+
+    table = orderbook.BookTable(capacity=len(codes))
+    for code in codes:
+        levels = orderbook.fetch_ta5(code)
+        if levels is not None:
+            table.add(code, levels)
+    m = table.summary()
+    for i, code in enumerate(table.symbols):
+        row = table.data[i]
+        print(f"== {code} ==")
+        for lv in range(orderbook.LEVELS):
+            print(f"  買{lv + 1} {row[lv]:>10g} x {row[10 + lv]:<8g}  賣{lv + 1} {row[5 + lv]:>10g} x {row[15 + lv]:g}")
+        print("  " + "  ".join(f"{k}={m[k][i]:.4g}" for k in ("mid", "microprice", "spread", "depth_spread", "quoted_size", "imbalance")))
+
+
+def _load_rows(path):
+    with open(path, encoding="utf-8") as f:
+        if path.endswith((".jsonl", ".ndjson")):
+            return [json.loads(line) for line in f if line.strip()]
+        data = json.load(f)
+        return data["items"] if isinstance(data, dict) else data  # 也吃 /api/warrants 的回應
+
+
+def cmd_export(args):
+    from sinks import open_sinks
+
+    rows = _load_rows(args.rows)
+    sink = open_sinks(args.out)
+    try:
+        for r in rows:
+            sink.write(r)
+    finally:
+        sink.close()
+    print(f"✅ 已寫入：{', '.join(sink.paths)}")
+
+
+def cmd_serve(args):
+    from website import app
+
+    app.run(host=args.host, port=args.port, debug=args.debug)
+
+
+def cmd_publish(args):
+    """獨立的抓取行程：定期抓一輪寫進共享報價表，web worker 只讀（QUOTE_TABLE 指向同一個檔）。"""
+    import scraper
+    from quotetable import QuoteTable
+
+    wids = args.wids
+    if not wids:
+        from core import DEFAULT_WIDS as wids
+    table = QuoteTable(args.table)
+    hist = None
+    if args.history:
+        from history import History
+
+        hist = History(args.history)
+    while True:
+        t0 = time.perf_counter()
+        rows = scraper.scrape_batch(wids, batch_size=4, deadline=args.deadline)
+        for r in rows:
+            if "成交價" in r:
+                table.write(r)
+        if hist:
+            hist.record(rows)
+        took = time.perf_counter() - t0
+        print(f"[PUB] {len(rows)} rows → {args.table} in {took:.1f}s", flush=True)
+        if args.once:
+            return
+        time.sleep(max(args.interval - took, 0))
+
+
+def cmd_history(args):
+    from history import History, parse_time
+
+    hist = History(args.db)
+    try:
+        if args.stats or not args.out:
+            print(json.dumps(hist.stats(), ensure_ascii=False, indent=2))
+            if not args.out:
+                return
+        ts = parse_time(args.at) or time.time()
+        state = hist.state_at(ts, args.wids or None)
+        rows = [state[w] for w in (args.wids or sorted(state)) if w in state]
+        from sinks import open_sinks
+
+        sink = open_sinks(args.out)
+        try:
+            for r in rows:
+                sink.write(r)
+        finally:
+            sink.close()
+        print(f"✅ {len(rows)} 檔在 {args.at or '現在'} 的狀態：{', '.join(sink.paths)}")
+    finally:
+        hist.close()
+
+
+def _source_rows(args, wids):
+    """資料列來自 --rows 檔、--history 歷史庫（--at 時間點），都沒給就現抓一輪；wids 為 None 表示全部。"""
+    if args.rows:
+        return _load_rows(args.rows)
+    if args.history:
+        from history import History, parse_time
+
+        hist = History(args.history)
+        try:
+            state = hist.state_at(parse_time(args.at) or time.time(), wids)
+        finally:
+            hist.close()
+        return list(state.values())
+    import scraper
+
+    if not wids:
+        from core import DEFAULT_WIDS as wids
+    return scraper.scrape_batch(wids, batch_size=4, deadline=args.deadline)
+
+
+def _add_source_args(s):
+    s.add_argument("--rows", help="用這個 .jsonl / JSON 的資料列（不抓取）")
+    s.add_argument("--history", help="用歷史庫在 --at 時間點的狀態（不抓取）")
+    s.add_argument("--at", help="搭配 --history，例：2026-10-19 13:30；留空為最新")
+    s.add_argument("--deadline", type=float, help="現抓時的期限（秒）")
+
+
+def cmd_risk(args):
+    """部位風險。"""
+    from risk import GREEKS, RiskBook, load_positions
+
+    book = RiskBook(load_positions(args.positions))
+    book.update(_source_rows(args, book.wids))
+    data = book.summary()
+    if args.json:
+        print(json.dumps(data, ensure_ascii=False, indent=2))
+        return
+    print(f"{'標的':<12}{'部位':>4}" + "".join(f"{g:>16}" for g in GREEKS))
+    for d in data["by_underlying"]:
+        print(f"{d['標的']:<12}{d['部位數']:>4}" + "".join(f"{d[g]:>16,.0f}" for g in GREEKS))
+    print(f"{'合計':<12}{data['positions']:>4}" + "".join(f"{data['total'][g]:>16,.0f}" for g in GREEKS))
+    if data["missing"]:
+        print(f"[RISK] 沒有報價或欄位不完整，未計入：{', '.join(data['missing'])}")
+
+
+def cmd_surface(args):
+    """各標的隱波曲面，列出偏離曲面的權證。"""
+    from volsurface import OUTPUT_FIELDS, fit
+
+    rows = _source_rows(args, args.wids or None)
+    t0 = time.perf_counter()
+    out, summary = fit(rows, z=args.z, min_gap=args.min_gap)
+    took = time.perf_counter() - t0
+    flagged = sorted((r for r in out if r["標記"]), key=lambda r: -abs(r["z"]))
+    if args.json:
+        print(json.dumps({"underlyings": summary, "flagged": flagged}, ensure_ascii=False, indent=2))
+    else:
+        for d in sorted(summary, key=lambda d: -d["點數"]):
+            if d["擬合"]:
+                print(f"{d['標的']:<12}{d['點數']:>5} 檔  平價(3M) {d['平價隱波']:7.2f}  偏斜 {d['偏斜']:8.2f}"
+                      f"  尺度 {d['尺度']:5.2f}  標記 {d['標記數']}")
+        print(f"{'WID':<10}{'標的':<12}{'隱波':>8}{'曲面':>8}{'偏離':>8}{'z':>7}  標記")
+        for r in flagged:
+            print(f"{r['WID']:<10}{r['標的代碼']:<12}{r['隱波']:>8.2f}{r['曲面隱波']:>8.2f}{r['偏離']:>8.2f}{r['z']:>7.1f}  {r['標記']}")
+    fitted = sum(d["擬合"] for d in summary)
+    print(f"[SURFACE] {len(out)} 檔 / {fitted} 個標的擬合 / {len(flagged)} 檔標記，{took * 1000:.0f} ms", file=sys.stderr)
+    if args.out:
+        from sinks import open_sinks
+
+        sink = open_sinks(args.out, fields=OUTPUT_FIELDS)
+        try:
+            for r in out:
+                sink.write(r)
+        finally:
+            sink.close()
+        print(f"✅ 已寫入：{', '.join(sink.paths)}")
+
+
+def cmd_alerts(args):
+    """依序把每份 --rows 當成一份快照餵給規則；沒給 --rows 就定期現抓。"""
+    from alerts import AlertEngine, load_rules
+
+    engine = AlertEngine(load_rules(args.rules))
+    engine.listeners.append(lambda a: print(json.dumps(a, ensure_ascii=False, default=str), flush=True))
+    if args.rows:
+        for path in args.rows:
+            engine.update(_load_rows(path))
+        return
+    import scraper
+
+    wids = args.wids
+    if not wids:
+        from core import DEFAULT_WIDS as wids
+    while True:
+        t0 = time.perf_counter()
+        rows = scraper.scrape_batch(wids, batch_size=4, deadline=args.deadline)
+        fired = engine.update(rows)
+        took = time.perf_counter() - t0
+        print(f"[ALERT] {len(rows)} rows, {len(fired)} fired in {took:.1f}s", file=sys.stderr, flush=True)
+        if args.once:
+            return
+        time.sleep(max(args.interval - took, 0))
+
+
+def cmd_coordinator(args):
+    """持有佇列檔並提供 HTTP 介面給 worker；--enqueue / --universe 先放一輪，--collect 只輸出某輪結果。"""
+    from workqueue import WorkQueue, create_app
+
+    queue = WorkQueue(args.queue)
+    for spec in args.host_limit or []:
+        host, _, n = spec.partition("=")
+        queue.set_host_limit(host, int(n))
+    if args.collect:
+        from sinks import open_sinks
+
+        rows = queue.rows(args.collect)
+        sink = open_sinks(args.out or [f"{args.collect}.xlsx"])
+        try:
+            for r in rows:
+                sink.write(r)
+        finally:
+            sink.close()
+        print(f"✅ run {args.collect}：{len(rows)} 列 → {', '.join(sink.paths)}")
+        return
+    from core import DEFAULT_WIDS
+
+    if args.enqueue or args.universe:
+        from jobs import load_universe
+
+        wids = args.enqueue or load_universe(args.universe, DEFAULT_WIDS)
+        print(f"[QUEUE] run {queue.enqueue(wids)}: {len(wids)} WIDs queued", flush=True)
+    create_app(queue, DEFAULT_WIDS).run(host=args.host, port=args.port, threaded=True)
+
+
+def cmd_worker(args):
+    import scraper
+    from workqueue import open_queue, run_worker
+
+    run_worker(open_queue(args.target), scraper.scrape_batch, slots=args.slots, host=args.host,
+               batch=args.batch, idle_exit=args.once)
+
+
+def cmd_loadtest(args):
+    """假上游 + 子行程的 serve（或 --target 既有服務）+ N 個用戶端；結果可存 JSON 跨 commit 比較。"""
+    from loadtest import LoadTest, StandIn, parse_wid_set, print_compare, print_report, start_server
+
+    stand_in = StandIn(port=args.upstream_port, delay=args.upstream_delay, jitter=args.upstream_jitter,
+                       error_rate=args.upstream_errors).start()
+    print(f"[LOAD] stand-in upstream at {stand_in.url}", flush=True)
+    if args.standin_only:
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            return
+    proc = None
+    target, pid = args.target, args.pid
+    if not target:
+        proc, target, log = start_server(args.port, stand_in.url, args.env or [])
+        pid = proc.pid
+        print(f"[LOAD] serving at {target} (pid {pid}, log {log.name})", flush=True)
+    try:
+        wid_sets = [parse_wid_set(s) for s in args.wid_set] if args.wid_set else None
+        rep = LoadTest(target, clients=args.clients, duration=args.duration, page_ratio=args.page_ratio,
+                       wid_sets=wid_sets, think=args.think, deadline=args.deadline, pid=pid).run()
+    finally:
+        if proc:
+            proc.terminate()
+            proc.wait(timeout=30)
+            log.close()
+        stand_in.stop()
+    rep["upstream"] = {"delay": args.upstream_delay, "jitter": args.upstream_jitter,
+                       "error_rate": args.upstream_errors, "hits": stand_in.hits}
+    print_report(rep)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(rep, f, ensure_ascii=False, indent=2)
+        print(f"✅ 已寫入：{args.out}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print_compare(json.load(f), rep)
+
+
+def cmd_bench(args):
+    """每個子命令開新的 python 只做 import，取中位數。"""
+    here = os.path.abspath(__file__)
+    base = None
+    for name in ["(python)", *COMMAND_IMPORTS]:
+        cmd = [sys.executable, "-c", "pass"] if name == "(python)" else [sys.executable, here, "--import-only", name]
+        times = []
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            subprocess.run(cmd, check=True)
+            times.append(time.perf_counter() - t0)
+        med = sorted(times)[len(times) // 2]
+        if base is None:
+            base = med
+        print(f"{name:<10} {med * 1000:8.1f} ms  (扣掉直譯器本身 {max(med - base, 0) * 1000:7.1f} ms)")
+
+
+def build_parser():
+    p = argparse.ArgumentParser(prog="cli.py", description="元大權證工具")
+    p.add_argument("--import-only", metavar="CMD", choices=sorted(COMMAND_IMPORTS),
+                   help=argparse.SUPPRESS)
+    sub = p.add_subparsers(dest="cmd")
+
+    s = sub.add_parser("scrape", help="用 Chrome 抓權證並寫 Excel")
+    s.add_argument("wids", nargs="*", help="權證代號；留空用 yuanta.py 的預設清單")
+    s.add_argument("--headless", action="store_true")
+    s.add_argument("--out", action="append",
+                   help="輸出檔，可重複；依副檔名 .xlsx/.csv/.jsonl/.parquet 或寫成 格式:路徑（預設桌面 xlsx）")
+    s.add_argument("--checkpoint", help="檢查點 SQLite 檔；每檔完成就寫入，最後再組輸出")
+    s.add_argument("--resume", action="store_true", help="跳過檢查點裡已成功的 WID")
+    s.add_argument("--fresh", default="", help="resume 時只沿用這段時間內的結果，例：30m、2h、1d")
+    s.add_argument("--books", help="把標的與權證的完整五檔存成這個 .npz")
+    s.set_defaults(func=cmd_scrape)
+
+    s = sub.add_parser("assemble", help="從檢查點組出輸出檔")
+    s.add_argument("checkpoint")
+    s.add_argument("wids", nargs="*", help="要組的 WID（依此順序）；留空為檢查點全部")
+    s.add_argument("--out", action="append", required=True, help="輸出檔，可重複")
+    s.set_defaults(func=cmd_assemble)
+
+    s = sub.add_parser("price", help="查標的賣一價（mem_ta5 API）")
+    s.add_argument("codes", nargs="+", help="標的代碼，例如 2330")
+    s.add_argument("--depth", action="store_true", help="印出完整五檔與 mid / microprice / 深度價差…")
+    s.set_defaults(func=cmd_price)
+
+    s = sub.add_parser("export", help="把 JSON / JSONL 資料列轉成 xlsx（含試算表）/ csv / parquet")
+    s.add_argument("rows", help="scrape 輸出的 .jsonl，或 /api/warrants 存下來的 JSON")
+    s.add_argument("--out", action="append", required=True, help="輸出檔，可重複")
+    s.set_defaults(func=cmd_export)
+
+    s = sub.add_parser("serve", help="啟動 Flask 看板")
+    s.add_argument("--host", default="127.0.0.1")
+    s.add_argument("--port", type=int, default=5000)
+    s.add_argument("--debug", action="store_true")
+    s.set_defaults(func=cmd_serve)
+
+    s = sub.add_parser("publish", help="定期抓取並寫進跨行程共用的報價表")
+    s.add_argument("wids", nargs="*", help="權證代號；留空用看板的預設清單")
+    s.add_argument("--table", default=os.getenv("QUOTE_TABLE") or "/dev/shm/warrant_quotes.bin")
+    s.add_argument("--interval", type=float, default=30, help="每輪間隔秒數")
+    s.add_argument("--deadline", type=float, help="每輪的抓取期限（秒）")
+    s.add_argument("--once", action="store_true", help="只跑一輪")
+    s.add_argument("--history", default=os.getenv("HISTORY_DB") or None, help="同時寫進這個歷史庫（差異編碼）")
+    s.set_defaults(func=cmd_publish)
+
+    s = sub.add_parser("history", help="從歷史庫重建任一時間點的狀態")
+    s.add_argument("db")
+    s.add_argument("wids", nargs="*", help="只要這些 WID；留空為全部")
+    s.add_argument("--at", help="時間點，例：2026-10-19 13:30；留空為最新")
+    s.add_argument("--out", action="append", help="輸出檔，可重複；不給就只印統計")
+    s.add_argument("--stats", action="store_true", help="印出筆數 / 關鍵幀 / 檔案大小")
+    s.set_defaults(func=cmd_history)
+
+    s = sub.add_parser("risk", help="部位依標的彙總的金額 Delta / Gamma / Vega / Theta")
+    s.add_argument("positions", help="部位檔：CSV（WID,張數）或 JSON")
+    _add_source_args(s)
+    s.add_argument("--json", action="store_true", help="輸出 JSON")
+    s.set_defaults(func=cmd_risk)
+
+    s = sub.add_parser("surface", help="各標的隱波曲面，找出偏貴 / 偏便宜的權證")
+    s.add_argument("wids", nargs="*", help="只看這些 WID；留空為資料裡全部（現抓時用看板的預設清單）")
+    _add_source_args(s)
+    s.add_argument("--z", type=float, default=None, help="標記門檻（穩健 z 值，預設 SURFACE_Z）")
+    s.add_argument("--min-gap", type=float, default=None, help="最少偏離幾個百分點才標記（預設 SURFACE_MIN_GAP）")
+    s.add_argument("--out", action="append", help="每檔的曲面值與偏離寫到這些檔，可重複")
+    s.add_argument("--json", action="store_true", help="輸出 JSON")
+    s.set_defaults(func=cmd_surface)
+
+    s = sub.add_parser("alerts", help="對連續的快照跑警示規則（JSON 規則檔，見 alerts.py）")
+    s.add_argument("rules")
+    s.add_argument("wids", nargs="*", help="現抓時的權證代號；留空用看板的預設清單")
+    s.add_argument("--rows", action="append", help="依序當成一份份快照的資料列檔，可重複（不抓取）")
+    s.add_argument("--interval", type=float, default=30, help="現抓時每輪間隔秒數")
+    s.add_argument("--deadline", type=float, help="每輪的抓取期限（秒）")
+    s.add_argument("--once", action="store_true", help="只抓一輪")
+    s.set_defaults(func=cmd_alerts)
+
+    s = sub.add_parser("coordinator", help="分散式抓取的協調者（SQLite 佇列 + HTTP 介面）")
+    s.add_argument("queue", help="佇列檔（SQLite）")
+    s.add_argument("--host", default="0.0.0.0")
+    s.add_argument("--port", type=int, default=5100)
+    s.add_argument("--enqueue", nargs="+", metavar="WID", help="啟動時先放這些 WID")
+    s.add_argument("--universe", help="啟動時先放整個 universe（default / file，見 jobs.py）")
+    s.add_argument("--host-limit", action="append", metavar="主機=數量", help="該主機同時最多幾個租約，可重複")
+    s.add_argument("--collect", metavar="RUN", help="不啟動服務，只把這輪的結果寫到 --out")
+    s.add_argument("--out", action="append", help="搭配 --collect 的輸出檔，可重複")
+    s.set_defaults(func=cmd_coordinator)
+
+    s = sub.add_parser("worker", help="分散式抓取的 worker")
+    s.add_argument("target", help="協調者網址（http://…:5100）或同一台機器上的佇列檔")
+    s.add_argument("--slots", type=int, default=1, help="同時跑幾批（每批一個 Chrome）")
+    s.add_argument("--batch", type=int, default=None, help="每次租幾檔（預設 WORKER_BATCH）")
+    s.add_argument("--host", help="回報的主機名（預設 hostname），主機租約上限依此計算")
+    s.add_argument("--once", action="store_true", help="佇列空了就結束")
+    s.set_defaults(func=cmd_worker)
+
+    s = sub.add_parser("loadtest", help="對 / 與 /api/warrants 壓測（本機假上游）")
+    s.add_argument("--clients", type=int, default=8, help="同時幾個用戶端")
+    s.add_argument("--duration", type=float, default=30, help="秒")
+    s.add_argument("--page-ratio", type=float, default=0.1, help="打 / 的比例，其餘打 /api/warrants")
+    s.add_argument("--wid-set", action="append", metavar="WID,WID[*權重]", help="/api/warrants 的 WID 組合，可重複")
+    s.add_argument("--think", type=float, default=0.0, help="每個用戶端兩次請求之間等幾秒")
+    s.add_argument("--deadline", type=float, help="/api/warrants 的 deadline 參數")
+    s.add_argument("--target", help="打既有的服務（不自己起 serve）")
+    s.add_argument("--pid", type=int, help="搭配 --target：受測服務的 pid（量 Chrome 數與記憶體）")
+    s.add_argument("--port", type=int, default=5055, help="自己起 serve 時用的埠")
+    s.add_argument("--env", action="append", metavar="KEY=VALUE", help="傳給受測服務的環境變數，可重複")
+    s.add_argument("--upstream-port", type=int, default=0, help="假上游的埠（0 = 隨機）")
+    s.add_argument("--upstream-delay", type=float, default=0.05, help="假上游每個回應的延遲（秒）")
+    s.add_argument("--upstream-jitter", type=float, default=0.05)
+    s.add_argument("--upstream-errors", type=float, default=0.0, help="假上游回 500 的機率")
+    s.add_argument("--standin-only", action="store_true", help="只跑假上游（手動指 WARRANT_SITE 用）")
+    s.add_argument("--out", help="結果存成 JSON")
+    s.add_argument("--compare", help="跟這份舊結果比較")
+    s.set_defaults(func=cmd_loadtest)
+
+    s = sub.add_parser("bench", help="量各子命令的啟動時間")
+    s.add_argument("--repeat", type=int, default=5)
+    s.set_defaults(func=cmd_bench)
+    return p
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.import_only:
+        import importlib
+
+        for mod in COMMAND_IMPORTS[args.import_only]:
+            importlib.import_module(mod)
+        return
+    if not args.cmd:
+        build_parser().print_help()
+        return
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
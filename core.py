@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+共用核心（website.py / yuanta.py / cli.py 共用）
+只放欄位定義、數字清理、標的報價 API、寫 Excel 這類不需要瀏覽器的東西；
+requests / openpyxl 都在函式裡才 import，報價或匯出時不必載入 Selenium 全家桶。
+"""
+
+import os
+import re
+from datetime import datetime
+
+# 元大權證網站；壓測（loadtest.py）時指到本機的假站
+WARRANT_SITE = os.getenv("WARRANT_SITE", "https://www.warrantwin.com.tw").rstrip("/")
+
+# 為了避免第一次進頁面就超久，預設清單縮小；要抓一整包可在前端輸入或用 query 參數
+DEFAULT_WIDS = [
+    "03111U", "03162U", "03485U", "03616U", "03662U",
+    "03281U", "03864U", "05831P", "063866", "065413", "071599",
+    "07879P", "079683", "085398", "08700P", "08769P", "08992P",
+    "71280U", "71286U", "71289U", "71344U", "71974U"
+]
+
+# ======= 欄位 =======
+BASIC_LABELS = [
+    "上市日期","最後交易日","到期日期","發行型態","最新發行張數",
+    "流通在外張數/比例","最新履約價","最新行使比例",
+    "買價隱波","賣價隱波","Delta","Theta",
+    "剩餘天數","價內外程度","實質槓桿","買賣價差比"
+]
+
+HEADER_ORDER = [
+    "WID","狀態","成交價","買價","賣價",
+    "標的名稱","標的股價","標的代碼",
+    *BASIC_LABELS, "抓取時間","來源網址"
+]
+
+
+def warrant_url(wid):
+    return f"{WARRANT_SITE}/eyuanta/Warrant/Info.aspx?WID={wid}"
+
+
+def is_warrant_code(code: str) -> bool:
+    return code.endswith(("U", "P")) or code.isdigit()
+
+
+def ensure_all_keys(row: dict) -> dict:
+    for k in HEADER_ORDER:
+        row.setdefault(k, "")
+    return row
+
+
+# ======= NEW：從 Yuanta API 取「標的股價＝賣一(ask1)」 =======
+def get_udly_best_ask_from_api(udly_code: str, timeout=8):
+    """
+    /ws/Quote.ashx?type=mem_ta5&symbol={udly_code}
+    鍵位：
+      101=買一, 102=賣一, 103=買二, 104=賣二, ..., 110=賣五
+      113..117=買一~買五量, 118..122=賣一~賣五量
+    回傳 float 或 None（完整五檔由 orderbook.fetch_ta5 取得，擷取中會一併記下）
+    """
+    import orderbook
+
+    levels = orderbook.fetch_ta5(udly_code, timeout=timeout, kind="udly")
+    if levels is None:
+        return None
+    ask1 = levels[orderbook.ASK_PX.start]
+    return None if ask1 != ask1 else ask1  # NaN → None
+
+# ======= 寫 Excel + 試算 =======
+def clean_number(val):
+    """把文字轉成純數字字串，去掉 %, 天, 逗號等雜字"""
+    if val is None:
+        return ""
+    s = str(val).strip()
+    s = s.replace(",", "")
+    s = s.replace("%", "")
+    s = re.sub(r"[^\d.]", "", s)  # 保留數字和小數點
+    return s
+
+# ======= 型別（給 Parquet / 風險 / 歷史這類需要數字的地方）=======
+# 其他欄位一律當字串；「價內外程度」「流通在外張數/比例」格式不固定，不硬轉
+FLOAT_FIELDS = {
+    "成交價", "買價", "賣價", "標的股價", "標的現價",
+    "最新發行張數", "最新履約價", "最新行使比例",
+    "買價隱波", "賣價隱波", "Delta", "Theta",
+    "剩餘天數", "實質槓桿", "買賣價差比",
+}
+DATE_FIELDS = {"上市日期", "最後交易日", "到期日期"}
+TIMESTAMP_FIELDS = {"抓取時間"}
+
+
+def to_float(val):
+    """文字轉 float（保留負號），抓不到數字回傳 None。"""
+    if val is None or val == "":
+        return None
+    if isinstance(val, (int, float)):
+        return float(val)
+    m = re.search(r"-?\d+(?:\.\d+)?", str(val).replace(",", ""))
+    return float(m.group(0)) if m else None
+
+
+def to_date(val):
+    m = re.search(r"(\d{4})[/-](\d{1,2})[/-](\d{1,2})", str(val or ""))
+    if not m:
+        return None
+    try:
+        return datetime(int(m.group(1)), int(m.group(2)), int(m.group(3))).date()
+    except ValueError:
+        return None
+
+
+def to_timestamp(val):
+    try:
+        return datetime.strptime(str(val), "%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        return None
+
+
+def typed_value(field, val):
+    if field in FLOAT_FIELDS:
+        return to_float(val)
+    if field in DATE_FIELDS:
+        return to_date(val)
+    if field in TIMESTAMP_FIELDS:
+        return to_timestamp(val)
+    return "" if val is None else str(val)
+
+
+# ======= 試算表內容 =======
+def call_formula_str(S="B2", K="G2", DAYS="G3", R="B6", IV="B3", CR="G4"):
+    d1 = f"(LN({S}/{K}) + ({R} + (({IV}/100)^2)/2)*({DAYS}/365)) / (({IV}/100)*SQRT({DAYS}/365))"
+    d2 = f"{d1} - ({IV}/100)*SQRT({DAYS}/365)"
+    return (f"=({S}*NORMDIST({d1},0,1,TRUE) - {K}*EXP(-{R}*({DAYS}/365))*NORMDIST({d2},0,1,TRUE))*{CR}")
+
+def put_formula_str(S="B2", K="G2", DAYS="G3", R="B6", IV="B3", CR="G4"):
+    d1 = f"(LN({S}/{K}) + ({R} + (({IV}/100)^2)/2)*({DAYS}/365)) / (({IV}/100)*SQRT({DAYS}/365))"
+    d2 = f"{d1} - ({IV}/100)*SQRT({DAYS}/365)"
+    return (f"=({K}*EXP(-{R}*({DAYS}/365))*NORMDIST(-({d2}),0,1,TRUE) - {S}*NORMDIST(-({d1}),0,1,TRUE))*{CR}")
+
+CALC_BOLD = ["A1","A2","A3","A4","A6","F2","F3","F4","A8"]
+CALC_WIDTHS = [("A",16),("B",14),("C",28),("F",22),("G",18)]
+
+def calc_sheet_cells(r):
+    """每檔一張試算表的內容 {儲存格: 值}（公式參照 B2/G2… 這些位置）。"""
+    issue_type = str(r.get("發行型態", "")) + str(r.get("認購/認售", ""))
+    is_put = "認售" in issue_type
+    return {
+        # ===== 標籤與輸入 =====
+        "A1": "WID", "B1": r.get("WID", ""),
+        "A2": "標的股價", "B2": clean_number(r.get("標的股價", "")),
+        "A3": "買價隱波（％）", "B3": clean_number(r.get("買價隱波", "")),
+        "A4": "評價日", "B4": datetime.now().strftime("%Y/%m/%d"),
+        "A6": "無風險利率 r（年化）", "B6": 0.02,
+        "F1": "（以下自動帶入）",
+        "F2": "履約價 K", "G2": clean_number(r.get("最新履約價", "")),
+        "F3": "剩餘天數", "G3": clean_number(r.get("剩餘天數", "")),
+        "F4": "行使比例（數值）", "G4": clean_number(r.get("最新行使比例", "")),
+        # ===== Excel 公式 =====
+        "A8": "理論價 (BS)", "B8": put_formula_str() if is_put else call_formula_str(),
+        # 成交價顯示
+        "C10": f"成交價: {r.get('成交價', '')}",
+    }
+
+def save_rows_to_excel(rows, filename="yuanta_warrants.xlsx", out_path=None):
+    """寫主表 + 每檔一張試算表；沒給 out_path 就存到桌面。"""
+    from sinks import XlsxSink
+
+    # 儲存到桌面
+    if not out_path:
+        desktop = os.path.join(os.path.expanduser("~"), "Desktop")
+        out_path = os.path.join(desktop, filename)
+    sink = XlsxSink(out_path)
+    for r in rows:
+        sink.write(r)
+    sink.close()
+    print(f"✅ 已寫入 Excel：{out_path}")
+    return out_path
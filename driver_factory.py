@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""
+統一的 Chrome driver 工廠（website.py / yuanta.py / info_excel.py 共用）
+- chromedriver 與 Chrome 主程式的路徑每台機器只解析一次，結果存在 DRIVER_CACHE，
+  之後啟動直接用，不再每次跑 Selenium Manager / ChromeDriverManager().install()
+- 離線模式：指定 CHROMEDRIVER_PATH（+ BROWSER_BIN）就完全不碰網路；
+  DRIVER_OFFLINE=1 時只用指定路徑或快取，兩者都沒有就直接報錯
+- REUSE_PROFILE=1：PROFILE_ROOT 下固定的 chrome-0、chrome-1… 資料夾輪流借用（第一次啟動時先建好
+  PROFILE_POOL 個），省掉每次建新 profile 的時間，頁面靜態檔也能吃到磁碟快取；
+  借用時對 chrome-N.lock 拿 flock，別的行程 / 執行緒只會挑沒被鎖住的，行程結束鎖自動釋放，
+  所以每個服務 / CLI 行程都會重用同一批暖好的資料夾，不會越積越多
+- Chrome 升級後快取的 chromedriver 版本不合（SessionNotCreatedException）：自動重新解析路徑再試一次
+- 每次啟動印出「解析 / 啟動」耗時，並記進 metrics（driver_resolve / driver_create）
+可用環境變數：
+  - CHROMEDRIVER_PATH=/path/to/chromedriver
+  - BROWSER_BIN=/path/to/chrome
+  - DRIVER_OFFLINE=1
+  - DRIVER_CACHE=~/.cache/warrant_info/driver_paths.json
+  - REUSE_PROFILE=1、PROFILE_ROOT=~/.cache/warrant_info/chrome-profiles、PROFILE_POOL=4
+直接執行可量測啟動時間：python driver_factory.py --bench 3
+"""
+
+import json
+import os
+import socket
+import threading
+import time
+
+import metrics
+import profiling
+
+try:
+    import fcntl
+except ImportError:   # Windows：只在行程內排隊
+    fcntl = None
+
+CHROMEDRIVER_PATH = os.getenv("CHROMEDRIVER_PATH", "").strip()
+BROWSER_BIN = os.getenv("BROWSER_BIN", "").strip()
+DRIVER_OFFLINE = os.getenv("DRIVER_OFFLINE", "0") == "1"
+DRIVER_CACHE = os.path.expanduser(os.getenv("DRIVER_CACHE", "~/.cache/warrant_info/driver_paths.json"))
+REUSE_PROFILE = os.getenv("REUSE_PROFILE", "0") == "1"
+PROFILE_ROOT = os.path.expanduser(os.getenv("PROFILE_ROOT", "~/.cache/warrant_info/chrome-profiles"))
+PROFILE_POOL = int(os.getenv("PROFILE_POOL", "4"))
+
+_lock = threading.Lock()
+_resolved = None          # (driver_path, browser_path)
+_leased = {}              # 本行程借出中的 profile 路徑 -> lock 檔 fd
+_prepared = False
+
+
+# ====== 路徑解析（每台機器一次）======
+def _usable(path):
+    return bool(path) and os.path.isfile(path) and os.access(path, os.X_OK)
+
+
+def _load_cache():
+    try:
+        with open(DRIVER_CACHE, encoding="utf-8") as f:
+            entry = json.load(f).get(socket.gethostname(), {})
+    except (OSError, ValueError):
+        return None
+    drv, bro = entry.get("driver_path", ""), entry.get("browser_path", "")
+    if _usable(drv) and (not bro or os.path.exists(bro)):
+        return drv, bro
+    return None
+
+
+def _save_cache(driver_path, browser_path):
+    try:
+        with open(DRIVER_CACHE, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        data = {}
+    data[socket.gethostname()] = {
+        "driver_path": driver_path,
+        "browser_path": browser_path,
+        "resolved_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    os.makedirs(os.path.dirname(DRIVER_CACHE), exist_ok=True)
+    tmp = DRIVER_CACHE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, DRIVER_CACHE)
+
+
+def _selenium_manager(browser_bin):
+    from selenium.webdriver.common.selenium_manager import SeleniumManager
+
+    args = ["--browser", "chrome"]
+    if browser_bin:
+        args += ["--browser-path", browser_bin]
+    if DRIVER_OFFLINE:
+        args.append("--offline")
+    out = SeleniumManager().binary_paths(args)
+    return out["driver_path"], out.get("browser_path", "") or browser_bin
+
+
+def resolve_paths(refresh=False):
+    """回傳 (chromedriver 路徑, Chrome 路徑)。順序：指定路徑 → 本機快取 → Selenium Manager。"""
+    global _resolved
+    with _lock:
+        if _resolved and not refresh:
+            return _resolved
+        with metrics.stage("driver_resolve"):
+            if CHROMEDRIVER_PATH:
+                if not _usable(CHROMEDRIVER_PATH):
+                    raise RuntimeError(f"CHROMEDRIVER_PATH 不是可執行檔：{CHROMEDRIVER_PATH}")
+                _resolved = (CHROMEDRIVER_PATH, BROWSER_BIN)
+                return _resolved
+            cached = None if refresh else _load_cache()
+            if cached and (not BROWSER_BIN or cached[1] == BROWSER_BIN):
+                _resolved = cached
+                return _resolved
+            if DRIVER_OFFLINE and not cached:
+                # Selenium Manager --offline 只看它自己的快取，仍試一次；失敗再給清楚的錯誤
+                try:
+                    drv_path, bro_path = _selenium_manager(BROWSER_BIN)
+                except Exception as e:
+                    raise RuntimeError(
+                        "DRIVER_OFFLINE=1 但沒有 CHROMEDRIVER_PATH，也沒有本機快取的 driver 路徑"
+                    ) from e
+            else:
+                drv_path, bro_path = _selenium_manager(BROWSER_BIN)
+            print(f"[DRV] Resolved chromedriver={drv_path} chrome={bro_path or '(default)'}", flush=True)
+            try:
+                _save_cache(drv_path, bro_path)
+            except OSError as e:
+                print(f"[DRV] 無法寫入 driver 快取 {DRIVER_CACHE}: {e}", flush=True)
+            _resolved = (drv_path, bro_path)
+            return _resolved
+
+
+# ====== 可重用的 profile 資料夾 ======
+def prepare_profiles(n=PROFILE_POOL):
+    """預先建好 chrome-0 … chrome-(n-1)（已存在的直接沿用）。"""
+    global _prepared
+    os.makedirs(PROFILE_ROOT, exist_ok=True)
+    for i in range(n):
+        os.makedirs(os.path.join(PROFILE_ROOT, f"chrome-{i}"), exist_ok=True)
+    _prepared = True
+
+
+def _try_lock(path):
+    """拿到 path 的獨佔鎖回傳 fd，被別人（其他行程或本行程其他執行緒）用著回傳 None。"""
+    if path in _leased:
+        return None
+    fd = os.open(path + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+    if fcntl is not None:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return None
+    return fd
+
+
+def _lease_profile():
+    """借編號最小、沒人用的 chrome-N；都被用著就往後建新的（同一個 user-data-dir 不能兩個 Chrome 同時用）。"""
+    with _lock:
+        if not _prepared:
+            prepare_profiles()
+        i = 0
+        while True:
+            path = os.path.join(PROFILE_ROOT, f"chrome-{i}")
+            fd = _try_lock(path)
+            if fd is not None:
+                break
+            i += 1
+        os.makedirs(path, exist_ok=True)
+        _leased[path] = fd
+    return path
+
+
+def _release_profile(path):
+    with _lock:
+        fd = _leased.pop(path, None)
+    if fd is not None:
+        os.close(fd)   # 關掉 fd 就釋放 flock
+
+
+# ====== 建立 driver ======
+def create_driver(options):
+    """依呼叫端給的 ChromeOptions 建立 driver；路徑 / profile / 計時由這裡統一處理。"""
+    from selenium import webdriver
+    from selenium.common.exceptions import SessionNotCreatedException
+    from selenium.webdriver.chrome.service import Service
+
+    t0 = time.perf_counter()
+    driver_path, browser_path = resolve_paths()
+    t_resolve = time.perf_counter() - t0
+    auto_bin = not options.binary_location
+    if browser_path and auto_bin:
+        options.binary_location = browser_path
+
+    profile_dir = None
+    if REUSE_PROFILE:
+        profile_dir = _lease_profile()
+        options.add_argument(f"--user-data-dir={profile_dir}")
+
+    t1 = time.perf_counter()
+    try:
+        try:
+            with metrics.stage("driver_create"):
+                drv = webdriver.Chrome(service=Service(executable_path=driver_path), options=options)
+        except SessionNotCreatedException as e:
+            # 多半是 Chrome 升級了、快取的 chromedriver 版本不合：重新解析一次再試
+            print(f"[DRV] Session not created ({str(e).splitlines()[0]}), re-resolving driver paths", flush=True)
+            driver_path, browser_path = resolve_paths(refresh=True)
+            if browser_path and auto_bin:
+                options.binary_location = browser_path
+            with metrics.stage("driver_create"):
+                drv = webdriver.Chrome(service=Service(executable_path=driver_path), options=options)
+    except Exception:
+        if profile_dir:
+            _release_profile(profile_dir)
+        raise
+    t_launch = time.perf_counter() - t1
+    metrics.inc("warrant_drivers_created_total")
+    print(f"[DRV] Chrome launched in {t_resolve + t_launch:.2f}s "
+          f"(resolve {t_resolve:.2f}s, launch {t_launch:.2f}s)", flush=True)
+
+    if profile_dir:
+        orig_quit = drv.quit
+
+        def quit():
+            try:
+                orig_quit()
+            finally:
+                _release_profile(profile_dir)
+
+        drv.quit = quit
+    return profiling.instrument(drv)
+
+
+def bench(n=3, headless=True):
+    """連續冷/熱啟動 n 次，印出解析與啟動耗時。"""
+    from selenium import webdriver
+
+    for i in range(n):
+        opts = webdriver.ChromeOptions()
+        if headless:
+            opts.add_argument("--headless=new")
+        opts.add_argument("--no-sandbox")
+        t0 = time.perf_counter()
+        drv = create_driver(opts)
+        t1 = time.perf_counter()
+        drv.quit()
+        print(f"#{i + 1}: start {t1 - t0:.2f}s  quit {time.perf_counter() - t1:.2f}s")
+    metrics.print_summary()
+
+
+if __name__ == "__main__":
+    import sys
+
+    n = int(sys.argv[sys.argv.index("--bench") + 1]) if "--bench" in sys.argv else 3
+    bench(n)
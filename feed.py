@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+即時推播（Server-Sent Events，給 /api/stream 用）
+- 每份新快照存進 SnapshotStore 後，跟各 WID 最後一次推出去的內容比對，
+  只把有變的列推給訂閱了那些 WID 的連線；上游抓一次，看的人再多也不會多抓
+- 有人訂閱時背景執行緒每 FEED_INTERVAL 秒檢查一次各連線訂閱的那組 WID（相同的組只算一次），
+  快照比 FEED_REFRESH 秒舊才重抓；快照的 key 就是那組 WID，跟 /api/warrants?wids=同一組 共用快取，
+  看板的輪詢與推播不會各抓一次，也不會因為多一個人看不同的組就把所有人的聯集重抓
+- 訂閱者的佇列滿了（網路太慢）就丟掉累積的更新，下一次改送它那組 WID 的完整資料
+- 沒有價格的列（Pending / Timeout / 錯誤）不會蓋掉之前推過的資料
+可用環境變數：
+  - FEED_INTERVAL=10   秒；多久檢查一次（新訂閱會馬上檢查）
+  - FEED_REFRESH=60    秒；同一組 WID 最多多久重抓一次（只有人開著頁面時的背景抓取頻率）
+  - FEED_QUEUE=100     每個連線最多累積幾則更新
+  - FEED_KEEPALIVE=15  秒；沒有更新時送註解行，避免代理伺服器斷線
+注意：每條 SSE 連線佔一個執行緒；gunicorn 請用 --threads 或 gevent worker。
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+
+import metrics
+from snapshot import diff_rows
+
+FEED_INTERVAL = float(os.getenv("FEED_INTERVAL", "10"))
+FEED_REFRESH = float(os.getenv("FEED_REFRESH", "60"))
+FEED_QUEUE = int(os.getenv("FEED_QUEUE", "100"))
+FEED_KEEPALIVE = float(os.getenv("FEED_KEEPALIVE", "15"))
+
+
+class Subscriber:
+    def __init__(self, wids=None):
+        self.order = list(wids) if wids else None
+        self.wids = set(wids) if wids else None  # None = 全部
+        self.q = queue.Queue(maxsize=FEED_QUEUE)
+        self.resync = False
+
+    def wants(self, wid):
+        return self.wids is None or wid in self.wids
+
+
+class Feed:
+    def __init__(self, store, default_wids, interval=FEED_INTERVAL, refresh=FEED_REFRESH):
+        self.store = store
+        self.default_wids = list(default_wids)
+        self.interval = interval
+        self.refresh = refresh
+        self.latest = {}            # WID -> 最後推出去的列
+        self.version = None
+        self.generated_at = None
+        self._subs = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        store.listeners.append(self.publish)
+
+    # ====== 訂閱 ======
+    def subscribe(self, wids=None):
+        sub = Subscriber(wids)
+        with self._lock:
+            self._subs.add(sub)
+            n = len(self._subs)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._refresh_loop, name="feed", daemon=True)
+                self._thread.start()
+        metrics.set_gauge("warrant_feed_subscribers", n)
+        self._wake.set()  # 新訂閱的 WID 可能還沒抓過，馬上整理一次
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subs.discard(sub)
+            n = len(self._subs)
+        metrics.set_gauge("warrant_feed_subscribers", n)
+
+    def rows_for(self, sub):
+        with self._lock:
+            if sub.order is None:
+                return list(self.latest.values())
+            return [self.latest[w] for w in sub.order if w in self.latest]
+
+    # ====== 發佈 ======
+    def publish(self, snap):
+        """SnapshotStore 的 listener：算出跟上次推送的差異，分送給有訂閱的連線。"""
+        with self._lock:
+            new = [r for r in snap.items if "成交價" in r or r.get("WID") not in self.latest]
+            old = [self.latest[r["WID"]] for r in new if r.get("WID") in self.latest]
+            diff = diff_rows(old, new)
+            for r in new:
+                self.latest[r["WID"]] = r
+            self.version, self.generated_at = snap.digest, snap.generated_at
+            subs = list(self._subs)
+        if not (diff["changed"] or diff["added"]):
+            return
+        for sub in subs:
+            msg = {
+                "version": snap.digest,
+                "generated_at": snap.generated_at,
+                "changed": [c for c in diff["changed"] if sub.wants(c["WID"])],
+                "added": [r for r in diff["added"] if sub.wants(r["WID"])],
+            }
+            if not (msg["changed"] or msg["added"]):
+                continue
+            try:
+                sub.q.put_nowait(msg)
+            except queue.Full:
+                sub.resync = True
+                metrics.inc("warrant_feed_dropped_total")
+        metrics.inc("warrant_feed_publish_total")
+
+    def _wanted_sets(self):
+        """各連線訂閱的 WID 組（保留順序、相同的只留一組）；沒人訂閱回 None。"""
+        with self._lock:
+            if not self._subs:
+                return None
+            return list(dict.fromkeys(tuple(s.order) if s.order else tuple(self.default_wids) for s in self._subs))
+
+    def _refresh_loop(self):
+        while True:
+            sets = self._wanted_sets()
+            if sets is None:
+                with self._lock:
+                    if not self._subs:
+                        self._thread = None
+                        return
+                continue
+            for wids in sets:
+                try:
+                    # 夠新的快照（包括 /api/warrants 同一組剛抓過的）就不重抓
+                    self.store.get(wids, max_age=self.refresh)
+                except Exception as e:
+                    print(f"[FEED] refresh failed: {type(e).__name__}: {e}", flush=True)
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    # ====== SSE ======
+    def stream(self, sub):
+        """產生 text/event-stream；連線斷掉時（GeneratorExit）取消訂閱。"""
+        def event(name, data):
+            return f"event: {name}\ndata: {json.dumps(data, ensure_ascii=False, separators=(',', ':'))}\n\n"
+
+        def full():
+            # wids：這條連線訂閱的那組（預設清單時給 default_wids），前端據此決定取代或合併
+            return event("snapshot", {"version": self.version, "generated_at": self.generated_at,
+                                      "wids": sub.order or self.default_wids, "items": self.rows_for(sub)})
+
+        try:
+            yield "retry: 3000\n\n"
+            yield full()
+            last = time.monotonic()
+            while True:
+                if sub.resync:
+                    sub.resync = False
+                    while not sub.q.empty():
+                        sub.q.get_nowait()
+                    yield full()
+                try:
+                    msg = sub.q.get(timeout=1)
+                except queue.Empty:
+                    if time.monotonic() - last >= FEED_KEEPALIVE:
+                        last = time.monotonic()
+                        yield ": keepalive\n\n"
+                    continue
+                last = time.monotonic()
+                yield event("update", msg)
+        finally:
+            self.unsubscribe(sub)
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+歷史快照（SQLite，差異編碼）
+連續兩份快照大多一模一樣（靜態欄位不會變、冷門權證一整天沒成交），所以只存變動：
+- 每個 WID 跟上一次存的狀態比對，只寫有變的欄位（D）；完全沒變就什麼都不寫
+- 每 KEYFRAME_EVERY 筆差異或隔 KEYFRAME_SEC 秒寫一筆完整列（K），重建時不必從頭套用
+- state_at(ts)：任一時間點的完整狀態 = 最近的 K + 之後到 ts 的所有 D（一個查詢完成）
+- replay(wid, t0, t1)：逐筆重建某檔在一段時間內的完整列
+- 每份快照同時更新 1m / 5m / 1d K 棒（bars.Rollups，同一個 SQLite 檔），bars() 查詢走勢圖用
+可用環境變數：
+  - HISTORY_DB=history.db    website.py / cli.py publish 設了才會記錄
+  - KEYFRAME_EVERY=120、KEYFRAME_SEC=3600
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from bars import Rollups, query as query_bars
+from snapshot import VOLATILE_FIELDS
+
+HISTORY_DB = os.getenv("HISTORY_DB", "").strip()
+KEYFRAME_EVERY = int(os.getenv("KEYFRAME_EVERY", "120"))
+KEYFRAME_SEC = float(os.getenv("KEYFRAME_SEC", "3600"))
+
+
+def parse_time(text):
+    """'2026-10-19 13:30[:00]' / '2026-10-19' / epoch 秒 → epoch 秒；空值回傳 None。"""
+    if text is None or str(text).strip() == "":
+        return None
+    text = str(text).strip()
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%dT%H:%M", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(text, fmt).timestamp()
+        except ValueError:
+            continue
+    raise ValueError(f"看不懂的時間：{text}（例：2026-10-19 13:30、epoch 秒）")
+
+
+class History:
+    def __init__(self, path=HISTORY_DB):
+        self.path = path
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS changes ("
+            " id INTEGER PRIMARY KEY, ts REAL NOT NULL, wid TEXT NOT NULL,"
+            " kind TEXT NOT NULL, fields TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS changes_wid_ts ON changes (wid, ts)")
+        self._db.commit()
+        self._lock = threading.Lock()
+        self.rollups = Rollups(self._db, self._lock)
+        self._last = {}      # WID -> 最後存下的完整列
+        self._since_kf = {}  # WID -> (上次 K 之後的 D 筆數, 上次 K 的時間)
+        self._load_last()
+
+    def _load_last(self):
+        self._last = self.state_at(time.time() + 1)
+        for wid, n, kts in self._db.execute(
+            "WITH kf AS (SELECT wid, MAX(ts) AS kts FROM changes WHERE kind = 'K' GROUP BY wid)"
+            " SELECT c.wid, COUNT(*) - 1, kf.kts FROM changes c JOIN kf ON c.wid = kf.wid AND c.ts >= kf.kts"
+            " GROUP BY c.wid"
+        ):
+            self._since_kf[wid] = (n, kts)
+
+    # ====== 寫 ======
+    def record(self, rows, ts=None):
+        """寫入一份快照；回傳實際寫了幾筆（K + D）。"""
+        ts = time.time() if ts is None else ts
+        out = []
+        with self._lock:
+            self.rollups.update(rows, ts)  # K 棒看每一份快照，不只看有變動的列
+            for r in rows:
+                wid = r.get("WID")
+                if not wid or "成交價" not in r:  # 沒價格的列（Pending / 錯誤）不進歷史
+                    continue
+                prev = self._last.get(wid)
+                delta = None if prev is None else self._changed(prev, r)
+                if prev is not None and not delta:
+                    continue
+                n, kts = self._since_kf.get(wid, (0, 0.0))
+                if prev is None or n + 1 >= KEYFRAME_EVERY or ts - kts >= KEYFRAME_SEC:
+                    out.append((ts, wid, "K", r))
+                    self._since_kf[wid] = (0, ts)
+                else:
+                    delta.update({k: r[k] for k in VOLATILE_FIELDS if k in r})
+                    out.append((ts, wid, "D", delta))
+                    self._since_kf[wid] = (n + 1, kts)
+                self._last[wid] = dict(r)
+            if out:
+                self._db.executemany(
+                    "INSERT INTO changes (ts, wid, kind, fields) VALUES (?, ?, ?, ?)",
+                    [(t, w, k, json.dumps(f, ensure_ascii=False, separators=(",", ":"), default=str))
+                     for t, w, k, f in out],
+                )
+                self._db.commit()
+        return len(out)
+
+    @staticmethod
+    def _changed(prev, row):
+        delta = {k: v for k, v in row.items() if k not in VOLATILE_FIELDS and prev.get(k) != v}
+        delta.update({k: None for k in prev if k not in row})  # None = 欄位被拿掉
+        return delta
+
+    def publish_snapshot(self, snap):
+        """SnapshotStore 的 listener。"""
+        self.record(snap.items, ts=snap.created)
+
+    # ====== 讀 ======
+    @staticmethod
+    def _apply(state, kind, fields):
+        if kind == "K":
+            return dict(fields)
+        state = dict(state or {})
+        for k, v in fields.items():
+            if v is None:
+                state.pop(k, None)
+            else:
+                state[k] = v
+        return state
+
+    def state_at(self, ts, wids=None):
+        """ts 時間點每個 WID 的完整列 {WID: row}；wids 給定時只重建那些。"""
+        wids = list(wids) if wids else []
+        only = f" AND wid IN ({','.join('?' * len(wids))})" if 0 < len(wids) <= 500 else ""
+        sql = (
+            f"WITH kf AS (SELECT wid, MAX(ts) AS kts FROM changes WHERE kind = 'K' AND ts <= ?{only} GROUP BY wid)"
+            " SELECT c.wid, c.kind, c.fields FROM changes c JOIN kf ON c.wid = kf.wid AND c.ts >= kf.kts"
+            " WHERE c.ts <= ? ORDER BY c.wid, c.ts, c.id"
+        )
+        want = set(wids) if wids else None
+        state = {}
+        with self._lock:
+            cur = self._db.execute(sql, (ts, *(wids if only else ()), ts))
+            for wid, kind, fields in cur:
+                if want is not None and wid not in want:
+                    continue
+                state[wid] = self._apply(state.get(wid), kind, json.loads(fields))
+        return state
+
+    def replay(self, wid, t0=None, t1=None):
+        """回傳 [(ts, 完整列)]：t0 當下的狀態（有的話）+ 之後到 t1 每一次變動後的狀態。"""
+        t1 = time.time() + 1 if t1 is None else t1
+        out = []
+        state = None
+        if t0 is not None:
+            state = self.state_at(t0, [wid]).get(wid)
+            if state is not None:
+                out.append((t0, state))
+        with self._lock:
+            if t0 is None:
+                cur = self._db.execute(
+                    "SELECT ts, kind, fields FROM changes WHERE wid = ? AND ts <= ? ORDER BY ts, id", (wid, t1))
+            else:
+                cur = self._db.execute(
+                    "SELECT ts, kind, fields FROM changes WHERE wid = ? AND ts > ? AND ts <= ? ORDER BY ts, id",
+                    (wid, t0, t1))
+            rows = cur.fetchall()
+        for ts, kind, fields in rows:
+            state = self._apply(state, kind, json.loads(fields))
+            out.append((ts, state))
+        return out
+
+    def bars(self, wid, t0, t1, res):
+        """[t0, t1] 內長度 res 秒的 K 棒（見 bars.py）。"""
+        return query_bars(self, wid, t0, t1, res)
+
+    def stats(self):
+        with self._lock:
+            (n, k, wids, t0, t1), = self._db.execute(
+                "SELECT COUNT(*), SUM(kind = 'K'), COUNT(DISTINCT wid), MIN(ts), MAX(ts) FROM changes")
+        size = sum(os.path.getsize(p) for p in (self.path, self.path + "-wal") if os.path.exists(p))
+        return {"records": n, "keyframes": k or 0, "wids": wids, "from": t0, "to": t1, "bytes": size}
+
+    def close(self):
+        self.rollups.flush()
+        self._db.close()
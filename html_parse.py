@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+離線解析 Info.aspx 的 page_source 快照
+瀏覽器只負責把頁面載到資料出現、拿一次 driver.page_source 就去載下一檔；
+欄位解析（ng-bind、標籤旁的值、含「標的」的抬頭備援）改在這裡用 lxml 跑，
+並丟到 ProcessPoolExecutor，讓解析 CPU 可以吃滿多核。
+XPath 跟線上版（website.py / yuanta.py）完全一樣，只是換成在本機 DOM 上求值。
+可用環境變數：
+  - PARSE_WORKERS=4  解析用的 process 數（預設 CPU 核心數）
+"""
+
+import os
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from lxml import etree, html as lxml_html
+
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", "0")) or (os.cpu_count() or 2)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+# ====== 取字（模擬 WebElement.text：只留看得到的字，空白壓成一格）======
+def _text(el):
+    return " ".join(el.text_content().split())
+
+
+def _first_text(doc, xp):
+    for el in doc.xpath(xp):
+        t = _text(el)
+        if t:
+            return t
+        break  # 跟 find_element 一樣只看第一個
+    return ""
+
+
+def _basic_value_by_label(doc, label_text):
+    xps = [
+        f"//*[normalize-space(text())='{label_text}']/following-sibling::*[1]",
+        f"//div[.//*[normalize-space(text())='{label_text}']]/*[normalize-space(text())='{label_text}']/following-sibling::*[1]",
+        f"//li[.//*[normalize-space(text())='{label_text}']]//*[normalize-space(text())='{label_text}']/following::*[1]",
+    ]
+    for xp in xps:
+        t = _first_text(doc, xp)
+        if t:
+            return t
+    return ""
+
+
+def _target_fields(doc):
+    """標的名稱 / 現價 / 代碼：先 ng-bind，再用含「標的」的抬頭字串備援。"""
+    name = _first_text(doc, "//*[contains(@ng-bind, 'TAR_NAME') or contains(@ng-bind, 'FLD_TAR_NAME')]")
+    price = _first_text(doc, "//*[contains(@ng-bind, 'TAR_PRICE') or contains(@ng-bind, 'FLD_TAR_PRICE')]")
+    code = re.sub(r"\D", "", _first_text(doc, "//*[contains(@ng-bind, 'TAR_CODE') or contains(@ng-bind, 'FLD_TAR_CODE')]"))
+    price = price.replace(",", "")
+
+    if not (name and code):
+        els = doc.xpath("//*[contains(normalize-space(.), '標的')]")
+        block = _text(els[0]) if els else ""
+        if block:
+            after = re.split(r"標的[:：]", block, maxsplit=1)
+            tail = after[1].strip() if len(after) > 1 else block
+            if not name:
+                m_name = re.match(r"([^\s(／/｜|（）]+)", tail)
+                name = m_name.group(1) if m_name else ""
+            if not price:
+                m_px = re.search(r"(\d{1,3}(?:,\d{3})*(?:\.\d+)?|\d+\.\d+)", tail)
+                price = m_px.group(1).replace(",", "") if m_px else ""
+            if not code:
+                m_code = re.search(r"\((\d{4})\)", block) or re.search(r"[^\d](\d{4})(?:\D|$)", block)
+                code = m_code.group(1) if m_code else ""
+    return name, price, code
+
+
+def parse_warrant_html(page_source, labels):
+    """解析一頁快照，回傳原始欄位（字串）；labels 為要抓的基本資料標籤。"""
+    doc = lxml_html.fromstring(page_source)
+    # script/style 的字不會出現在 WebElement.text，先拿掉免得汙染「標的」備援
+    etree.strip_elements(doc, "script", "style", "noscript", with_tail=False)
+
+    deal = _first_text(doc, "//*[contains(@ng-bind, 'WAR_DEAL_PRICE')]")
+    buy = _first_text(doc, "//*[contains(@ng-bind, 'WAR_BUY_PRICE')]")
+    sell = _first_text(doc, "//*[contains(@ng-bind, 'WAR_SELL_PRICE')]")
+    if not (deal and buy and sell):
+        prices = [_text(e) for e in doc.xpath("//*[contains(concat(' ', normalize-space(@class), ' '), ' tBig ')]")]
+        if len(prices) >= 3:
+            deal = deal or prices[0]
+            buy = buy or prices[1]
+            sell = sell or prices[2]
+
+    tgt_name, tgt_price, tgt_code = _target_fields(doc)
+    out = {
+        "WID": _first_text(doc, "//*[contains(@ng-bind, 'WAR_ID') or contains(@id,'lblWID')]"),
+        "成交價": deal,
+        "買價": buy,
+        "賣價": sell,
+        "標的名稱": tgt_name,
+        "標的現價": tgt_price,
+        "標的代碼": tgt_code,
+    }
+    for lab in labels:
+        out[lab] = _basic_value_by_label(doc, lab)
+    return out
+
+
+def _parse_timed(page_source, labels):
+    t0 = time.perf_counter()
+    fields = parse_warrant_html(page_source, labels)
+    return fields, time.perf_counter() - t0
+
+
+# ====== Process pool ======
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=PARSE_WORKERS)
+        return _pool
+
+
+def submit(page_source, labels):
+    """丟進解析池；future.result() 為 (欄位 dict, 解析秒數)。"""
+    return get_pool().submit(_parse_timed, page_source, list(labels))
+
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
@@ -1,16 +1,16 @@
 # 可以抓資料 不能試算
 from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
-from webdriver_manager.chrome import ChromeDriverManager
 from datetime import datetime
 import openpyxl, os, re, time
 import requests  # ← 新增：用來打 Yuanta API
 import math
 
+import driver_factory
+
 # ======= 設定 =======
 wid_list = ["03111U","03126U","03485U"]
 
@@ -36,8 +36,7 @@ def launch_driver(headless=False):
     options.add_argument("--disable-blink-features=AutomationControlled")
     options.add_argument("--no-sandbox")
     options.add_argument("--disable-dev-shm-usage")
-    service = Service(ChromeDriverManager().install())
-    return webdriver.Chrome(service=service, options=options)
+    return driver_factory.create_driver(options)
 
 # ======= 抓資料輔助 =======
 def text_or_blank(driver, by, sel):
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+背景抓取工作（給 /api/jobs 用）
+大量 WID 丟進來立刻拿到 job id，實際抓取在固定大小的執行緒池裡跑，
+Flask 的請求執行緒不會被整段抓取卡住。
+- 每個 job 依 batch_size 分段呼叫抓取函式（跟 scrape_batch 每批開一個 driver 一致），
+  每段完成就更新進度、吞吐量與目前為止的結果
+- 只保留最近 JOB_KEEP 個 job（還在排隊 / 執行的不丟，從最舊的已結束 job 開始清）
+- 排隊中的 job 達 JOB_MAX_QUEUED 個就拒收（submit 丟 JobQueueFull，API 回 429）
+可用環境變數：
+  - JOB_WORKERS=2   同時跑幾個 job
+  - JOB_KEEP=100
+  - JOB_MAX_QUEUED=20
+  - UNIVERSE_FILE=/path/to/wids.txt   universe="file" 時的 WID 清單（一行一檔）
+"""
+
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import metrics
+import profiling
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_KEEP = int(os.getenv("JOB_KEEP", "100"))
+JOB_MAX_QUEUED = int(os.getenv("JOB_MAX_QUEUED", "20"))
+UNIVERSE_FILE = os.getenv("UNIVERSE_FILE", "").strip()
+
+STATES = ("queued", "running", "done", "failed")
+
+
+def load_universe(name, default_wids):
+    """universe 名稱 → WID 清單：default 為看板預設清單，file 為 UNIVERSE_FILE。"""
+    if name == "default":
+        return list(default_wids)
+    if name == "file":
+        if not UNIVERSE_FILE:
+            raise ValueError("universe=file 需要設定 UNIVERSE_FILE")
+        with open(UNIVERSE_FILE, encoding="utf-8") as f:
+            return [ln.strip() for ln in f if ln.strip() and not ln.startswith("#")]
+    raise ValueError(f"未知的 universe：{name}（可用 default、file）")
+
+
+def filter_wids(wids, prefix="", kind=""):
+    """prefix：代號開頭；kind：put（P 結尾）/ call（其他）。"""
+    out = [w for w in wids if w.startswith(prefix)] if prefix else list(wids)
+    if kind == "put":
+        out = [w for w in out if w.endswith("P")]
+    elif kind == "call":
+        out = [w for w in out if not w.endswith("P")]
+    elif kind:
+        raise ValueError(f"kind 只能是 call 或 put：{kind}")
+    return out
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, wids, deadline=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.wids = list(wids)
+        self.deadline = deadline
+        self.state = "queued"
+        self.items = []
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    def snapshot(self, with_items=True):
+        with self._lock:
+            done = len(self.items)
+            items = list(self.items) if with_items else None
+        now = self.finished_at or time.time()
+        elapsed = (now - self.started_at) if self.started_at else 0.0
+        rate = done / elapsed * 60 if elapsed > 0 else 0.0
+        left = len(self.wids) - done
+        out = {
+            "id": self.id,
+            "state": self.state,
+            "total": len(self.wids),
+            "done": done,
+            "progress": round(done / len(self.wids), 4) if self.wids else 1.0,
+            "elapsed_sec": round(elapsed, 1),
+            "rows_per_min": round(rate, 2),
+            "eta_sec": round(left / rate * 60, 1) if rate > 0 and self.state == "running" else None,
+            "created_at": datetime.fromtimestamp(self.created_at).strftime("%Y-%m-%d %H:%M:%S"),
+            "error": self.error,
+        }
+        if with_items:
+            out["items"] = items
+        return out
+
+
+class JobManager:
+    def __init__(self, scrape_fn, workers=JOB_WORKERS, batch_size=4, keep=JOB_KEEP, max_queued=JOB_MAX_QUEUED):
+        self.scrape_fn = scrape_fn  # scrape_fn(wids, batch_size, deadline=秒數或 None) -> rows
+        self.batch_size = batch_size
+        self.keep = keep
+        self.max_queued = max_queued
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, wids, deadline=None):
+        job = Job(wids, deadline)
+        with self._lock:
+            queued = sum(1 for j in self._jobs.values() if j.state == "queued")
+            if queued >= self.max_queued:
+                raise JobQueueFull(f"已有 {queued} 個 job 在排隊，請稍後再送")
+            self._jobs[job.id] = job
+            extra = len(self._jobs) - self.keep
+            if extra > 0:
+                # 還在跑的不丟，跳過它們繼續清後面已結束的
+                finished = [k for k, j in self._jobs.items() if j.state not in ("queued", "running")]
+                for old_id in finished[:extra]:
+                    del self._jobs[old_id]
+        self._update_gauges()
+        self._pool.submit(self._run, job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job):
+        job.state = "running"
+        job.started_at = time.time()
+        self._update_gauges()
+        end = job.started_at + job.deadline if job.deadline else None
+        try:
+            with profiling.run(f"job-{job.id}"):
+                self._scrape_all(job, end)
+            job.state = "done"
+        except Exception as e:
+            job.error = f"{type(e).__name__}: {e}"
+            job.state = "failed"
+            print(f"[JOB] {job.id} failed: {job.error}", flush=True)
+        finally:
+            job.finished_at = time.time()
+            self._update_gauges()
+            metrics.observe("warrant_stage_seconds", job.finished_at - job.started_at, stage="job")
+
+    def _scrape_all(self, job, end):
+        for i in range(0, len(job.wids), self.batch_size):
+            chunk = job.wids[i : i + self.batch_size]
+            # 整個 job 共用一個期限；過期後剩下的段落會很快回 Pending 列
+            remaining = None if end is None else max(end - time.time(), 0.001)
+            rows = self.scrape_fn(chunk, self.batch_size, deadline=remaining)
+            with job._lock:
+                job.items.extend(rows)
+
+    def _update_gauges(self):
+        with self._lock:
+            counts = {s: 0 for s in STATES}
+            for j in self._jobs.values():
+                counts[j.state] += 1
+        for s, n in counts.items():
+            metrics.set_gauge("warrant_jobs", n, state=s)
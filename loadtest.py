@@ -0,0 +1,377 @@
+# -*- coding: utf-8 -*-
+"""
+Flask 服務壓測（/ 與 /api/warrants）
+- 假上游（StandIn）：本機 HTTP 伺服器，回傳長得像 Info.aspx 的頁面（同樣的 ng-bind / 標籤結構）
+  與 Quote.ashx 的 mem_ta5 JSON；可設延遲、抖動、錯誤率。受測服務以 WARRANT_SITE 指過來，
+  Chrome 照常開、照常解析，只是不打到真的網站
+- 受測服務：預設在子行程跑 `cli.py serve`（環境變數照傳，可加 --env SNAPSHOT_TTL=0 這類設定）；
+  也可用 --target 打已經在跑的服務（給 --pid 才量得到 Chrome 與記憶體）
+- 用戶端：N 個執行緒的封閉迴圈（每個送完一個才送下一個，可加 think time）；
+  每次依 --page-ratio 決定打 / 還是 /api/warrants，後者從 --wid-set 依權重抽一組 WID
+- 取樣：每 SAMPLE_SEC 秒記一次受測行程樹的 Chrome 行程數、總 RSS、進行中的請求數（讀 /proc，僅 Linux）
+- 報告：各端點與整體的 p50 / p90 / p95 / p99 / max、錯誤率、吞吐量，峰值 Chrome 數與記憶體，
+  加上 commit、設定與時間軸寫成 JSON；--compare 舊結果.json 印出差異，方便跨 commit 比較
+可用環境變數：
+  - SAMPLE_SEC=0.5
+"""
+
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from core import BASIC_LABELS
+
+SAMPLE_SEC = float(os.getenv("SAMPLE_SEC", "0.5"))
+PERCENTILES = (50, 90, 95, 99)
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+# ====== 假上游 ======
+def fake_values(wid):
+    """同一個 WID 每次給一樣的靜態欄位，價格隨時間小幅跳動。"""
+    rnd = random.Random(wid)
+    udly = 20 + rnd.random() * 900
+    strike = udly * rnd.uniform(0.8, 1.3)
+    px = max(0.01, rnd.uniform(0.1, 3) * (1 + 0.02 * random.uniform(-1, 1)))
+    return {
+        "code": str(rnd.randint(1101, 9999)),
+        "name": f"標的{wid[:3]}",
+        "udly": round(udly * (1 + 0.005 * random.uniform(-1, 1)), 2),
+        "deal": round(px, 2), "buy": round(px - 0.01, 2), "sell": round(px + 0.01, 2),
+        "basic": {
+            "上市日期": "2026/05/01", "最後交易日": "2027/01/15", "到期日期": "2027/01/19",
+            "發行型態": "認售" if wid.endswith("P") else "認購", "最新發行張數": f"{rnd.randint(5, 50) * 1000:,}",
+            "流通在外張數/比例": f"{rnd.randint(0, 5000):,} / {rnd.random() * 30:.2f}%",
+            "最新履約價": f"{strike:.2f}", "最新行使比例": f"{rnd.choice([0.01, 0.02, 0.05, 0.1]):.3f}",
+            "買價隱波": f"{rnd.uniform(20, 60):.2f}%", "賣價隱波": f"{rnd.uniform(20, 60):.2f}%",
+            "Delta": f"{rnd.uniform(-1, 1):.4f}", "Theta": f"{-rnd.random() / 10:.4f}",
+            "剩餘天數": f"{rnd.randint(10, 300)} 天", "價內外程度": f"價外 {rnd.random() * 30:.2f}%",
+            "實質槓桿": f"{rnd.uniform(2, 15):.2f}", "買賣價差比": f"{rnd.uniform(0.5, 5):.2f}%",
+        },
+    }
+
+
+def fake_page(wid):
+    v = fake_values(wid)
+    basic = "\n".join(f"<li><span>{k}</span><span>{v['basic'][k]}</span></li>" for k in BASIC_LABELS)
+    return f"""<!DOCTYPE html><html><head><meta charset="utf-8"><title>{wid}</title></head>
+<body ng-app="stand-in"><div class="ng-scope">
+<h3>權證 <span ng-bind="d.WAR_ID">{wid}</span></h3>
+<div>標的：<span ng-bind="d.FLD_TAR_NAME">{v['name']}</span>
+ <span ng-bind="d.FLD_TAR_CODE">{v['code']}</span> <span ng-bind="d.FLD_TAR_PRICE">{v['udly']:,.2f}</span></div>
+<div><span class="tBig" ng-bind="d.WAR_DEAL_PRICE">{v['deal']}</span>
+ <span class="tBig" ng-bind="d.WAR_BUY_PRICE">{v['buy']}</span>
+ <span class="tBig" ng-bind="d.WAR_SELL_PRICE">{v['sell']}</span></div>
+<ul>
+{basic}
+</ul></div></body></html>"""
+
+
+def fake_ta5(symbol):
+    rnd = random.Random(symbol)
+    mid = 20 + rnd.random() * 900
+    tick = max(0.01, round(mid / 2000, 2))
+    items = {}
+    for lv in range(5):
+        items[str(101 + 2 * lv)] = f"{mid - tick * (lv + 1):.2f}"
+        items[str(102 + 2 * lv)] = f"{mid + tick * (lv + 1):.2f}"
+        items[str(113 + lv)] = str(random.randint(1, 500))
+        items[str(118 + lv)] = str(random.randint(1, 500))
+    return {"items": items}
+
+
+class StandIn:
+    """假上游；delay / jitter 為秒，error_rate 為回 500 的機率。"""
+
+    def __init__(self, host="127.0.0.1", port=0, delay=0.05, jitter=0.05, error_rate=0.0):
+        stand_in = self
+        self.delay, self.jitter, self.error_rate = delay, jitter, error_rate
+        self.hits = {"page": 0, "ta5": 0, "error": 0}
+        self._lock = threading.Lock()
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                stand_in._handle(self)
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://{host}:{self.server.server_address[1]}"
+
+    def _handle(self, req):
+        u = urlparse(req.path)
+        q = parse_qs(u.query)
+        time.sleep(max(self.delay + random.uniform(-self.jitter, self.jitter), 0))
+        if random.random() < self.error_rate:
+            with self._lock:
+                self.hits["error"] += 1
+            return self._send(req, 500, "text/plain", b"stand-in error")
+        if u.path.endswith("/Warrant/Info.aspx"):
+            with self._lock:
+                self.hits["page"] += 1
+            return self._send(req, 200, "text/html; charset=utf-8", fake_page(q.get("WID", [""])[0]).encode())
+        if u.path.endswith("/ws/Quote.ashx"):
+            with self._lock:
+                self.hits["ta5"] += 1
+            body = json.dumps(fake_ta5(q.get("symbol", [""])[0])).encode()
+            return self._send(req, 200, "application/json", body)
+        self._send(req, 404, "text/plain", b"not found")
+
+    @staticmethod
+    def _send(req, code, ctype, body):
+        req.send_response(code)
+        req.send_header("Content-Type", ctype)
+        req.send_header("Content-Length", str(len(body)))
+        req.end_headers()
+        req.wfile.write(body)
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True, name="stand-in").start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+
+
+# ====== 行程樹取樣（/proc）======
+def _children(pid):
+    kids = {}
+    for d in os.listdir("/proc"):
+        if not d.isdigit():
+            continue
+        try:
+            with open(f"/proc/{d}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        kids.setdefault(ppid, []).append(int(d))
+    out, todo = [], [pid]
+    while todo:
+        p = todo.pop()
+        out.append(p)
+        todo.extend(kids.get(p, ()))
+    return out
+
+
+def sample_tree(pid):
+    """(Chrome 行程數, 整棵行程樹的 RSS MB)。"""
+    chrome, rss = 0, 0
+    for p in _children(pid):
+        try:
+            with open(f"/proc/{p}/comm") as f:
+                comm = f.read().strip().lower()
+            with open(f"/proc/{p}/status") as f:
+                m = re.search(r"VmRSS:\s+(\d+)", f.read())
+        except OSError:
+            continue
+        if "chrom" in comm:
+            chrome += 1
+        rss += int(m.group(1)) if m else 0
+    return chrome, round(rss / 1024, 1)
+
+
+# ====== 壓測 ======
+def percentiles(values):
+    if not values:
+        return {**{f"p{p}": None for p in PERCENTILES}, "max": None, "mean": None}
+    v = sorted(values)
+    out = {f"p{p}": round(v[min(len(v) - 1, int(len(v) * p / 100))] * 1000, 1) for p in PERCENTILES}
+    return {**out, "max": round(v[-1] * 1000, 1), "mean": round(sum(v) / len(v) * 1000, 1)}
+
+
+def parse_wid_set(spec):
+    """'03111U,03162U' 或 '03111U,03162U*3'（權重 3）→ (wids, 權重)。"""
+    spec, _, w = spec.partition("*")
+    return [x.strip() for x in spec.split(",") if x.strip()], float(w or 1)
+
+
+def git_describe():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=HERE,
+                                    capture_output=True, text=True).stdout.strip())
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class LoadTest:
+    def __init__(self, target, clients=8, duration=30, page_ratio=0.1, wid_sets=None, think=0.0,
+                 deadline=None, timeout=120, pid=None):
+        self.target = target.rstrip("/")
+        self.clients, self.duration, self.page_ratio, self.think = clients, duration, page_ratio, think
+        self.wid_sets = wid_sets or [(["03111U", "03162U"], 1.0)]
+        self.deadline, self.timeout, self.pid = deadline, timeout, pid
+        self.results = []        # (t, 端點, 秒, 成功, 狀態碼或錯誤)
+        self.timeline = []       # {t, chrome, rss_mb, inflight}
+        self._inflight = 0
+        self._lock = threading.Lock()
+
+    def _pick(self):
+        if random.random() < self.page_ratio:
+            return "/", "/"
+        i = random.choices(range(len(self.wid_sets)), weights=[w for _, w in self.wid_sets])[0]
+        wids = self.wid_sets[i][0]
+        url = f"/api/warrants?wids={','.join(wids)}"
+        if self.deadline:
+            url += f"&deadline={self.deadline}"
+        return f"/api/warrants[set{i}:{len(wids)}]", url
+
+    def _client(self, end, t0):
+        import requests
+
+        http = requests.Session()
+        while time.time() < end:
+            name, path = self._pick()
+            with self._lock:
+                self._inflight += 1
+            start = time.perf_counter()
+            try:
+                r = http.get(self.target + path, timeout=self.timeout)
+                ok, info = r.status_code < 400, r.status_code
+                if ok and name != "/":
+                    r.json()
+            except Exception as e:
+                ok, info = False, type(e).__name__
+            took = time.perf_counter() - start
+            with self._lock:
+                self._inflight -= 1
+                self.results.append((round(time.time() - t0, 3), name, took, ok, info))
+            if self.think:
+                time.sleep(self.think)
+
+    def _sampler(self, stop, t0):
+        while not stop.wait(SAMPLE_SEC):
+            chrome, rss = sample_tree(self.pid) if self.pid else (None, None)
+            with self._lock:
+                inflight = self._inflight
+            self.timeline.append({"t": round(time.time() - t0, 2), "chrome": chrome, "rss_mb": rss,
+                                  "inflight": inflight})
+
+    def run(self):
+        t0 = time.time()
+        end = t0 + self.duration
+        stop = threading.Event()
+        sampler = threading.Thread(target=self._sampler, args=(stop, t0), daemon=True)
+        sampler.start()
+        threads = [threading.Thread(target=self._client, args=(end, t0), name=f"client-{i}")
+                   for i in range(self.clients)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        stop.set()
+        sampler.join()
+        return self.report(time.time() - t0, t0)
+
+    def report(self, elapsed, t0):
+        by = {}
+        for _, name, took, ok, info in self.results:
+            d = by.setdefault(name, {"lat": [], "errors": 0, "codes": {}})
+            d["lat"].append(took)
+            d["errors"] += not ok
+            d["codes"][str(info)] = d["codes"].get(str(info), 0) + 1
+
+        def summarize(lat, errors, codes=None):
+            n = len(lat)
+            out = {"requests": n, "errors": errors, "error_rate": round(errors / n, 4) if n else None,
+                   "rps": round(n / elapsed, 2) if elapsed else None, "latency_ms": percentiles(lat)}
+            if codes is not None:
+                out["codes"] = codes
+            return out
+
+        chrome = [s["chrome"] for s in self.timeline if s["chrome"] is not None]
+        rss = [s["rss_mb"] for s in self.timeline if s["rss_mb"] is not None]
+        return {
+            "commit": git_describe(),
+            "started_at": datetime.fromtimestamp(t0).strftime("%Y-%m-%d %H:%M:%S"),
+            "host": platform.node(),
+            "python": platform.python_version(),
+            "config": {
+                "target": self.target, "clients": self.clients, "duration": self.duration,
+                "page_ratio": self.page_ratio, "think": self.think, "deadline": self.deadline,
+                "wid_sets": [{"wids": s, "weight": w} for s, w in self.wid_sets],
+            },
+            "elapsed_sec": round(elapsed, 2),
+            "overall": summarize([r[2] for r in self.results], sum(not r[3] for r in self.results)),
+            "endpoints": {k: summarize(d["lat"], d["errors"], d["codes"]) for k, d in sorted(by.items())},
+            "peak_chrome": max(chrome) if chrome else None,
+            "peak_rss_mb": max(rss) if rss else None,
+            "timeline": self.timeline,
+        }
+
+
+def print_report(rep):
+    print(f"== {rep['commit'] or '?'}  {rep['config']['clients']} clients × {rep['elapsed_sec']}s ==")
+    rows = [("(all)", rep["overall"])] + list(rep["endpoints"].items())
+    print(f"{'endpoint':<22}{'req':>7}{'err%':>7}{'rps':>8}" + "".join(f"{k:>9}" for k in ("p50", "p90", "p95", "p99", "max")))
+    for name, d in rows:
+        lat = d["latency_ms"]
+        err = "-" if d["error_rate"] is None else f"{d['error_rate'] * 100:.1f}"
+        print(f"{name:<22}{d['requests']:>7}{err:>7}{d['rps'] or 0:>8}"
+              + "".join(f"{'-' if lat[k] is None else lat[k]:>9}" for k in ("p50", "p90", "p95", "p99", "max")))
+    print(f"peak Chrome processes: {rep['peak_chrome']}   peak RSS: {rep['peak_rss_mb']} MB")
+
+
+def print_compare(old, new):
+    """跟舊的結果比：延遲、錯誤率、峰值。"""
+    print(f"== {old.get('commit')} → {new.get('commit')} ==")
+
+    def line(label, a, b, unit=""):
+        if a is None or b is None:
+            print(f"{label:<30}{a!s:>10} → {b!s:<10}")
+            return
+        pct = f"{(b - a) / a * 100:+.1f}%" if a else ""
+        print(f"{label:<30}{a:>10}{unit} → {b:<10}{unit} {pct}")
+
+    for name in sorted(set(old["endpoints"]) | set(new["endpoints"]) | {"(all)"}):
+        a = old["overall"] if name == "(all)" else old["endpoints"].get(name)
+        b = new["overall"] if name == "(all)" else new["endpoints"].get(name)
+        if not a or not b:
+            print(f"{name}: 只在其中一份結果裡")
+            continue
+        for k in ("p50", "p95", "p99"):
+            line(f"{name} {k}", a["latency_ms"][k], b["latency_ms"][k], " ms")
+        line(f"{name} error_rate", a["error_rate"], b["error_rate"])
+        line(f"{name} rps", a["rps"], b["rps"])
+    line("peak_chrome", old.get("peak_chrome"), new.get("peak_chrome"))
+    line("peak_rss_mb", old.get("peak_rss_mb"), new.get("peak_rss_mb"), " MB")
+
+
+def start_server(port, site, env_overrides=()):
+    """子行程跑 cli.py serve，指到假上游；等到 / 回應才返回。回傳的 log 檔由呼叫端在 proc.wait() 後關掉。"""
+    import requests
+
+    env = dict(os.environ, WARRANT_SITE=site, PYTHONUNBUFFERED="1")
+    for kv in env_overrides:
+        k, _, v = kv.partition("=")
+        env[k] = v
+    log = open(os.path.join(os.getenv("TMPDIR", "/tmp"), f"loadtest-serve-{port}.log"), "w")
+    proc = subprocess.Popen([sys.executable, os.path.join(HERE, "cli.py"), "serve", "--port", str(port)],
+                            env=env, stdout=log, stderr=subprocess.STDOUT)
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        if proc.poll() is not None:
+            log.close()
+            raise RuntimeError(f"服務沒起來，見 {log.name}")
+        try:
+            requests.get(url + "/", timeout=1)
+            return proc, url, log
+        except requests.RequestException:
+            time.sleep(0.2)
+    proc.terminate()
+    proc.wait(timeout=30)
+    log.close()
+    raise RuntimeError(f"服務 20 秒內沒有回應，見 {log.name}")
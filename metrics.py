@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+分段計時 / 計數器（純標準庫，執行緒安全）
+- stage("drv_get", wid)     計時某段流程，依 stage 與 stage+WID 各累積一份直方圖
+- inc / set_gauge / add_gauge  計數器與量表（錯誤數、快取命中、driver 佔用數…）
+- render_prometheus()       產出 Prometheus 文字格式，給 Flask 的 /metrics 用
+- print_summary()           桌面腳本跑完時印出各階段耗時
+可用環境變數：
+  - METRICS_LOG=1  每段結束印一行 [STAGE] stage=… wid=… sec=…
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+METRICS_LOG = os.getenv("METRICS_LOG", "0") == "1"
+
+# 秒；涵蓋 API 呼叫（< 1s）到整頁逾時（15s + 25s + 6s）
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 15, 25, 35, 60)
+
+_lock = threading.Lock()
+_hist = {}      # (name, labels) -> [bucket_counts, sum, count]
+_counters = {}  # (name, labels) -> float
+_gauges = {}    # (name, labels) -> float
+
+_HELP = {
+    "warrant_stage_seconds": ("histogram", "各階段耗時（秒）"),
+    "warrant_stage_wid_seconds": ("histogram", "各階段耗時（秒），依 WID 分"),
+    "warrant_stage_errors_total": ("counter", "各階段拋出的例外數"),
+    "warrant_rows_total": ("counter", "產出的資料列數（依狀態分類）"),
+    "warrant_cache_requests_total": ("counter", "快取查詢次數（hit/miss）"),
+    "warrant_cache_hit_ratio": ("gauge", "快取命中率"),
+    "warrant_drivers_created_total": ("counter", "建立過的 Chrome driver 數"),
+    "warrant_drivers_active": ("gauge", "目前佔用中的 Chrome driver 數"),
+    "warrant_api_errors_total": ("counter", "API 端點回 500 的次數"),
+    "warrant_spa_fallback_total": ("counter", "SPA 切換失敗、退回整頁載入的次數"),
+    "warrant_jobs": ("gauge", "背景抓取工作數（依狀態分）"),
+    "warrant_feed_subscribers": ("gauge", "目前的推播（SSE）連線數"),
+    "warrant_feed_publish_total": ("counter", "有變動而推播出去的快照數"),
+    "warrant_feed_dropped_total": ("counter", "訂閱者佇列滿了被丟掉的更新數"),
+    "warrant_alerts_total": ("counter", "警示規則觸發次數（依 level 分；規則名不當 label，避免時間序列隨規則數暴增）"),
+}
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+def observe(name, value, **labels):
+    k = _key(name, labels)
+    with _lock:
+        h = _hist.get(k)
+        if h is None:
+            h = _hist[k] = [[0] * len(BUCKETS), 0.0, 0]
+        for i, b in enumerate(BUCKETS):
+            if value <= b:
+                h[0][i] += 1
+        h[1] += value
+        h[2] += 1
+
+
+def inc(name, value=1, **labels):
+    k = _key(name, labels)
+    with _lock:
+        _counters[k] = _counters.get(k, 0) + value
+
+
+def set_gauge(name, value, **labels):
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def add_gauge(name, delta, **labels):
+    k = _key(name, labels)
+    with _lock:
+        _gauges[k] = _gauges.get(k, 0) + delta
+
+
+def cache_lookup(cache, hit):
+    inc("warrant_cache_requests_total", cache=cache, result="hit" if hit else "miss")
+
+
+@contextmanager
+def stage(name, wid=None):
+    """計時一段流程；例外照樣往外丟，但會先記下耗時與錯誤類型。"""
+    t0 = time.perf_counter()
+    err = None
+    try:
+        yield
+    except BaseException as e:
+        err = type(e).__name__
+        raise
+    finally:
+        sec = time.perf_counter() - t0
+        observe("warrant_stage_seconds", sec, stage=name)
+        if wid:
+            observe("warrant_stage_wid_seconds", sec, stage=name, wid=wid)
+        if err:
+            inc("warrant_stage_errors_total", stage=name, kind=err)
+        if METRICS_LOG:
+            print(f"[STAGE] stage={name} wid={wid or '-'} sec={sec:.3f}"
+                  + (f" error={err}" if err else ""), flush=True)
+
+
+# ====== 輸出 ======
+def _fmt_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    body = ",".join('{}="{}"'.format(k, v.replace("\\", "\\\\").replace('"', '\\"')) for k, v in pairs)
+    return "{" + body + "}"
+
+
+def _fmt_num(v):
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+def render_prometheus():
+    with _lock:
+        hist = {k: (list(v[0]), v[1], v[2]) for k, v in _hist.items()}
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+
+    lines = []
+    seen = set()
+
+    def header(name):
+        if name in seen:
+            return
+        seen.add(name)
+        kind, help_ = _HELP.get(name, ("untyped", name))
+        lines.append(f"# HELP {name} {help_}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    for (name, labels), (buckets, total, count) in sorted(hist.items()):
+        header(name)
+        for b, c in zip(BUCKETS, buckets):
+            lines.append(f"{name}_bucket{_fmt_labels(labels, [('le', str(b))])} {c}")
+        lines.append(f"{name}_bucket{_fmt_labels(labels, [('le', '+Inf')])} {count}")
+        lines.append(f"{name}_sum{_fmt_labels(labels)} {total:.6f}")
+        lines.append(f"{name}_count{_fmt_labels(labels)} {count}")
+
+    for (name, labels), v in sorted(counters.items()):
+        header(name)
+        lines.append(f"{name}{_fmt_labels(labels)} {_fmt_num(v)}")
+
+    # 命中率直接算好，方便看板不用再寫 PromQL
+    hits, totals = {}, {}
+    for (name, labels), v in counters.items():
+        if name != "warrant_cache_requests_total":
+            continue
+        d = dict(labels)
+        totals[d["cache"]] = totals.get(d["cache"], 0) + v
+        if d["result"] == "hit":
+            hits[d["cache"]] = hits.get(d["cache"], 0) + v
+    for cache, total in sorted(totals.items()):
+        gauges[("warrant_cache_hit_ratio", (("cache", cache),))] = hits.get(cache, 0) / total
+
+    for (name, labels), v in sorted(gauges.items()):
+        header(name)
+        lines.append(f"{name}{_fmt_labels(labels)} {_fmt_num(v)}")
+
+    return "\n".join(lines) + "\n"
+
+
+def print_summary():
+    """印出各階段次數 / 平均 / 總耗時（只看不分 WID 的那份）。"""
+    with _lock:
+        rows = [(dict(k[1]).get("stage", ""), v[2], v[1])
+                for k, v in _hist.items() if k[0] == "warrant_stage_seconds"]
+    if not rows:
+        return
+    print("⏱️ 各階段耗時：")
+    for name, count, total in sorted(rows, key=lambda r: -r[2]):
+        print(f"  {name:<16} 次數 {count:>4}  平均 {total / count:6.3f}s  合計 {total:8.2f}s")
+
+
+def reset():
+    with _lock:
+        _hist.clear()
+        _counters.clear()
+        _gauges.clear()
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+五檔報價（mem_ta5）完整擷取
+- fetch_ta5(symbol) 一次取回買賣各五檔價量，壓成固定 20 欄的 float 序列（缺值為 NaN）：
+    [0:5]  買一~買五價（鍵 101,103,…,109）
+    [5:10] 賣一~賣五價（鍵 102,104,…,110）
+    [10:15] 買一~買五量（鍵 113~117）
+    [15:20] 賣一~賣五量（鍵 118~122）
+  core.get_udly_best_ask_from_api 也走這裡，所以抓標的賣一時完整五檔順便留下，不必再打一輪
+- BookTable：擷取期間的五檔快照表（N × 20 的 float64 陣列 + 時間 / 代號 / 類別），可存成 .npz
+- book_metrics(data)：對整張表向量化算 mid、microprice、價差、深度加權價差、掛單量、買賣失衡
+用法：
+  orderbook.start_capture()      # 之後所有 fetch_ta5 的結果都記進表裡
+  … 抓取 …
+  table = orderbook.stop_capture(); table.save("books.npz")
+numpy 只在建表 / 算指標時才載入（只查價的 cli.py price 不需要）。
+"""
+
+import threading
+import time
+
+import metrics
+from core import WARRANT_SITE
+
+LEVELS = 5
+WIDTH = LEVELS * 4
+BID_PX = slice(0, 5)
+ASK_PX = slice(5, 10)
+BID_SZ = slice(10, 15)
+ASK_SZ = slice(15, 20)
+
+# 欄位順序對應的 mem_ta5 鍵
+TA5_KEYS = (
+    [101 + 2 * i for i in range(LEVELS)]      # 買價
+    + [102 + 2 * i for i in range(LEVELS)]    # 賣價
+    + [113 + i for i in range(LEVELS)]        # 買量
+    + [118 + i for i in range(LEVELS)]        # 賣量
+)
+COLUMNS = (
+    [f"bid_px{i + 1}" for i in range(LEVELS)] + [f"ask_px{i + 1}" for i in range(LEVELS)]
+    + [f"bid_sz{i + 1}" for i in range(LEVELS)] + [f"ask_sz{i + 1}" for i in range(LEVELS)]
+)
+
+_NAN = float("nan")
+_capture = None
+_capture_lock = threading.Lock()
+
+
+def _num(v):
+    try:
+        return float(str(v).replace(",", ""))
+    except (TypeError, ValueError):
+        return _NAN
+
+
+def parse_ta5(items):
+    """mem_ta5 的 items（字串鍵或整數鍵）→ 20 個 float 的 tuple。"""
+    if not isinstance(items, dict):
+        return (_NAN,) * WIDTH
+    return tuple(_num(items.get(str(k), items.get(k))) for k in TA5_KEYS)
+
+
+def fetch_ta5(symbol, timeout=8, kind="udly"):
+    """取回 symbol 的五檔；失敗回傳 None。擷取中（start_capture）會順便記進表裡。
+    kind：udly（標的）/ warrant（權證本身），也是 metrics 的 stage 名稱前綴。"""
+    import requests
+
+    if not symbol:
+        return None
+    url = f"{WARRANT_SITE}/eyuanta/ws/Quote.ashx?type=mem_ta5&symbol={symbol}"
+    try:
+        with metrics.stage(f"{kind}_api"):
+            r = requests.get(url, timeout=timeout)
+        r.raise_for_status()
+        levels = parse_ta5(r.json().get("items", {}))
+    except Exception as e:
+        print(f"⚠️ fetch_ta5 {symbol} error:", e)
+        return None
+    table = _capture
+    if table is not None:
+        table.add(symbol, levels, kind=kind)
+    return levels
+
+
+# ====== 快照表 ======
+class BookTable:
+    """固定寬度的五檔快照表；容量不夠時加倍。"""
+
+    def __init__(self, capacity=256):
+        import numpy as np
+
+        self.data = np.full((capacity, WIDTH), np.nan)
+        self.ts = np.zeros(capacity)
+        self.symbols = []
+        self.kinds = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def add(self, symbol, levels, kind="udly", ts=None):
+        import numpy as np
+
+        with self._lock:
+            n = len(self.symbols)
+            if n == len(self.data):
+                self.data = np.vstack([self.data, np.full_like(self.data, np.nan)])
+                self.ts = np.concatenate([self.ts, np.zeros_like(self.ts)])
+            self.data[n] = levels
+            self.ts[n] = time.time() if ts is None else ts
+            self.symbols.append(symbol)
+            self.kinds.append(kind)
+
+    def latest(self):
+        """每個代號最後一筆的列號（依代號）。"""
+        with self._lock:
+            return {s: i for i, s in enumerate(self.symbols)}
+
+    def summary(self):
+        return book_metrics(self.data[: len(self)])
+
+    def save(self, path):
+        import numpy as np
+
+        n = len(self)
+        np.savez_compressed(
+            path, data=self.data[:n], ts=self.ts[:n],
+            symbols=np.array(self.symbols, dtype=str), kinds=np.array(self.kinds, dtype=str),
+            columns=np.array(COLUMNS),
+        )
+        print(f"✅ 五檔快照 {n} 筆：{path}")
+
+    @classmethod
+    def load(cls, path):
+        import numpy as np
+
+        z = np.load(path)
+        t = cls(capacity=max(len(z["data"]), 1))
+        n = len(z["data"])
+        t.data[:n] = z["data"]
+        t.ts[:n] = z["ts"]
+        t.symbols = [str(x) for x in z["symbols"]]
+        t.kinds = [str(x) for x in z["kinds"]]
+        return t
+
+
+def start_capture(capacity=256):
+    global _capture
+    with _capture_lock:
+        _capture = BookTable(capacity)
+    return _capture
+
+
+def stop_capture():
+    global _capture
+    with _capture_lock:
+        table, _capture = _capture, None
+    return table
+
+
+def capturing():
+    return _capture is not None
+
+
+# ====== 向量化指標 ======
+def book_metrics(data):
+    """data：(N, 20) 陣列。回傳 {指標名: 長度 N 的陣列}；缺檔位時為 NaN。"""
+    import numpy as np
+
+    data = np.atleast_2d(np.asarray(data, dtype=float))
+    bid, ask = data[:, BID_PX], data[:, ASK_PX]
+    bsz, asz = data[:, BID_SZ], data[:, ASK_SZ]
+    bid1, ask1, bsz1, asz1 = bid[:, 0], ask[:, 0], bsz[:, 0], asz[:, 0]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mid = (bid1 + ask1) / 2
+        spread = ask1 - bid1
+        # 量大的那一邊比較不會被吃掉，價格往另一邊靠
+        micro = (bid1 * asz1 + ask1 * bsz1) / (bsz1 + asz1)
+        bid_qty = np.nansum(np.where(np.isnan(bid), 0, bsz), axis=1)
+        ask_qty = np.nansum(np.where(np.isnan(ask), 0, asz), axis=1)
+        # 五檔依掛單量加權的買 / 賣均價之差
+        bid_vwap = np.nansum(bid * bsz, axis=1) / bid_qty
+        ask_vwap = np.nansum(ask * asz, axis=1) / ask_qty
+        return {
+            "mid": mid,
+            "microprice": micro,
+            "spread": spread,
+            "spread_bps": spread / mid * 1e4,
+            "depth_spread": ask_vwap - bid_vwap,
+            "bid_qty": bid_qty,
+            "ask_qty": ask_qty,
+            "quoted_size": bid_qty + ask_qty,
+            "imbalance": (bid_qty - ask_qty) / (bid_qty + ask_qty),
+        }
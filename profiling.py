@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+WebDriver 指令層級追蹤 + cProfile（預設關閉）
+每個 find_element / .text / WebDriverWait 輪詢都是一次打到 chromedriver 的 HTTP，
+這裡把 driver.command_executor.execute 包起來，逐筆記下：
+  指令名稱、定位器（using/value；對元素的後續指令會回推當初找到它的定位器）、
+  耗時、成功與否、當下在抓哪個 WID
+每次 run 結束寫出：
+  - <name>-<時間>.trace.json  Chrome trace 格式（chrome://tracing、Perfetto 可直接開）
+  - <name>-<時間>.prof        cProfile 結果（snakeviz / gprof2dot 轉火焰圖）
+並印出最耗時的指令 + 定位器排行。
+可用環境變數：
+  - PROFILE=1               開啟
+  - PROFILE_DIR=profiles    輸出資料夾
+每個請求 / job 各自一個 run（存在 contextvar），並行的 run 互不等待、也不會混在一起：
+driver 建立時記住當下的 run，之後不論哪條執行緒（執行緒池、worker）用它送的指令都記在那個 run 底下。
+cProfile 同一時間只能開一個，別的 run 正在用時這個 run 只有 trace、沒有 .prof。
+用法：with profiling.run("api"): …（或 start_run / finish_run 成對呼叫）
+"""
+
+import contextvars
+import cProfile
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+PROFILE = os.getenv("PROFILE", "0") == "1"
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+_ELEMENT_KEY = "element-6066-11e4-a52e-4f735466cecf"
+
+_local = threading.local()
+_lock = threading.Lock()
+_cprofile_lock = threading.Lock()   # 拿到的 run 才開 cProfile
+_current = contextvars.ContextVar("profile_run", default=None)
+_ids = itertools.count(1)
+
+
+def _now_us():
+    return time.perf_counter_ns() // 1000
+
+
+def _current_wid():
+    return getattr(_local, "wid", None)
+
+
+@contextmanager
+def wid_span(wid):
+    """標記目前在抓哪個 WID；trace 上也會多一條包住整頁的區段。"""
+    prev = _current_wid()
+    _local.wid = wid
+    t0 = _now_us()
+    try:
+        yield
+    finally:
+        _local.wid = prev
+        _record({"name": f"WID {wid}", "cat": "wid", "ts": t0, "dur": _now_us() - t0,
+                 "args": {"wid": wid}})
+
+
+def _record(ev, run=None):
+    run = run or _current.get()
+    if run is None:
+        return
+    ev.setdefault("ph", "X")
+    ev.setdefault("pid", os.getpid())
+    ev.setdefault("tid", threading.get_ident())
+    with _lock:
+        run["events"].append(ev)
+
+
+def _element_ids(value):
+    if isinstance(value, dict) and _ELEMENT_KEY in value:
+        return [value[_ELEMENT_KEY]]
+    if isinstance(value, list):
+        return [v[_ELEMENT_KEY] for v in value if isinstance(v, dict) and _ELEMENT_KEY in v]
+    return []
+
+
+def instrument(drv):
+    """包住 driver 的 command executor；PROFILE 沒開就原樣回傳。"""
+    if not PROFILE:
+        return drv
+    executor = drv.command_executor
+    orig = executor.execute
+    locators = {}  # element id -> 找到它的定位器
+    owner = _current.get()   # 建立 driver 的那個 run；別的執行緒拿這個 driver 送指令也記在它底下
+
+    def execute(command, params):
+        # execute() 會把 URL 用到的參數（sessionId、id…）從 params 刪掉，先記下來
+        params = params or {}
+        using, value = params.get("using"), params.get("value")
+        el_id = params.get("id")
+        locator = f"{using}={value}" if using else locators.get(el_id, "")
+        t0 = _now_us()
+        ok = False
+        try:
+            resp = orig(command, params)
+            ok = int((resp or {}).get("status", 0) or 0) < 400
+            if ok and using:
+                for eid in _element_ids((resp or {}).get("value")):
+                    locators[eid] = locator
+            return resp
+        finally:
+            _record({"name": command, "cat": "webdriver", "ts": t0, "dur": _now_us() - t0,
+                     "args": {"wid": _current_wid(), "locator": locator, "ok": ok}}, _current.get() or owner)
+
+    executor.execute = execute
+    return drv
+
+
+def start_run(name):
+    """在目前的 context 開始一個 run 並回傳它；PROFILE 沒開時什麼都不做（回 None）。"""
+    if not PROFILE:
+        return None
+    run = {"id": next(_ids), "name": name, "events": [], "profiler": None}
+    if _cprofile_lock.acquire(blocking=False):
+        run["profiler"] = cProfile.Profile()
+        run["profiler"].enable()
+    run["token"] = _current.set(run)
+    return run
+
+
+def finish_run(run=None):
+    """結束 run（預設為目前 context 的）：停止 cProfile、寫出 trace/prof，回傳 trace 檔路徑（沒開則 None）。"""
+    run = run or _current.get()
+    if run is None:
+        return None
+    try:
+        _current.reset(run["token"])
+    except ValueError:   # 在別的 context 結束（例如交給其他執行緒收尾）
+        _current.set(None)
+    if run["profiler"] is not None:
+        run["profiler"].disable()
+        _cprofile_lock.release()
+
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    base = os.path.join(PROFILE_DIR, f"{run['name']}-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{run['id']}")
+    with _lock:
+        events = list(run["events"])
+    with open(base + ".trace.json", "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+    if run["profiler"] is not None:
+        run["profiler"].dump_stats(base + ".prof")
+        print(f"[PROFILE] trace → {base}.trace.json  cProfile → {base}.prof", flush=True)
+    else:
+        print(f"[PROFILE] trace → {base}.trace.json（cProfile 被其他 run 佔用，這次沒有 .prof）", flush=True)
+    _print_top(events)
+    return base + ".trace.json"
+
+
+@contextmanager
+def run(name):
+    """with profiling.run("api"): … 包住一次請求 / job；PROFILE 沒開時什麼都不做。"""
+    r = start_run(name)
+    try:
+        yield r
+    finally:
+        if r is not None:
+            finish_run(r)
+
+
+def _print_top(events, n=15):
+    agg = {}
+    for ev in events:
+        if ev.get("cat") != "webdriver":
+            continue
+        k = (ev["name"], ev["args"]["locator"])
+        a = agg.setdefault(k, [0, 0, 0])
+        a[0] += 1
+        a[1] += ev["dur"]
+        a[2] += 0 if ev["args"]["ok"] else 1
+    if not agg:
+        return
+    print(f"[PROFILE] 最耗時的 WebDriver 指令（前 {n}）：", flush=True)
+    for (cmd, loc), (count, dur, fails) in sorted(agg.items(), key=lambda kv: -kv[1][1])[:n]:
+        print(f"  {dur / 1e6:8.2f}s  x{count:<5} fail {fails:<4} {cmd:<22} {loc[:90]}", flush=True)
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+跨行程共用的即時報價表（mmap 檔 + seqlock）
+多個 Flask worker（gunicorn）與抓取行程共用同一張表：抓取端寫入，各 worker 直接從共享記憶體讀，
+不必各自開 Chrome，也不用經過外部資料庫。
+- 固定格式：每個 WID 一個槽（slot），欄位為 numpy structured dtype（數值 float64、文字為定長 UTF-8）；
+  數值欄另存網站上的原字串（35.20%、1,000…），scrape() 組回的列跟 scraper 產出的一模一樣
+- 寫入：同一槽用 fcntl 位元組範圍鎖保證只有一個寫者；seq 先 +1（奇數 = 寫入中），寫完再 +1
+- 讀取：先讀 seq、複製資料、再讀一次 seq；奇數或前後不同就重讀（讀者完全不上鎖）
+- 新 WID 分配槽位時才鎖表頭；各行程自己快取 WID → 槽號
+- fcntl 鎖只擋別的行程，同一行程的多個執行緒（請求 / feed / job 都會觸發 listener）
+  另外用 threading 鎖排隊，分配槽位與整段 seqlock 寫入都和 lockf 一起拿著
+可用環境變數：
+  - QUOTE_TABLE=/dev/shm/warrant_quotes.bin   不設就不啟用
+  - QUOTE_SLOTS=4096   建檔時的槽數（既有檔案以檔頭為準）
+僅支援有 fcntl 的平台（Linux / macOS）。
+"""
+
+import fcntl
+import mmap
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+
+from core import BASIC_LABELS, to_float
+
+QUOTE_TABLE = os.getenv("QUOTE_TABLE", "").strip()
+QUOTE_SLOTS = int(os.getenv("QUOTE_SLOTS", "4096"))
+
+MAGIC = b"WQT2"
+HEADER = struct.Struct("<4sII")   # magic, 槽數, 每槽位元組數
+HEADER_SIZE = 64
+
+NUM_FIELDS = [
+    "成交價", "買價", "賣價", "標的現價", "最新發行張數", "最新履約價", "最新行使比例",
+    "買價隱波", "賣價隱波", "Delta", "Theta", "剩餘天數", "實質槓桿", "買賣價差比",
+]
+TEXT_FIELDS = [
+    ("WID", 16), ("狀態", 64), ("標的名稱", 48), ("標的代碼", 16), ("上市日期", 16), ("最後交易日", 16),
+    ("到期日期", 16), ("發行型態", 32), ("流通在外張數/比例", 48), ("價內外程度", 32), ("抓取時間", 20),
+    ("來源網址", 96),
+]
+RAW_LEN = 24   # 數值欄原字串的長度上限
+SLOT_DTYPE = np.dtype(
+    [("seq", "<u8"), ("updated", "<f8")]
+    + [(k, f"S{n}") for k, n in TEXT_FIELDS]
+    + [(k, "<f8") for k in NUM_FIELDS]
+    + [(f"{k}@raw", f"S{RAW_LEN}") for k in NUM_FIELDS]
+)
+FIELDS = [k for k, _ in TEXT_FIELDS] + NUM_FIELDS
+# scrape() 組出的列的欄位順序（同 scraper 的列）
+ROW_FIELDS = ["WID", "狀態", "成交價", "買價", "賣價", "標的名稱", "標的代碼", "標的現價",
+              *BASIC_LABELS, "抓取時間", "來源網址"]
+STATUS_UNPUBLISHED = "未發布（報價表裡還沒有這檔）"
+
+
+class QuoteTable:
+    def __init__(self, path=QUOTE_TABLE, slots=QUOTE_SLOTS):
+        self.path = path
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        self._fd = fd
+        fcntl.lockf(fd, fcntl.LOCK_EX, HEADER_SIZE, 0)
+        try:
+            if os.fstat(fd).st_size < HEADER_SIZE:
+                os.ftruncate(fd, HEADER_SIZE + slots * SLOT_DTYPE.itemsize)
+                os.pwrite(fd, HEADER.pack(MAGIC, slots, SLOT_DTYPE.itemsize), 0)
+            magic, n, itemsize = HEADER.unpack(os.pread(fd, HEADER.size, 0))
+        finally:
+            fcntl.lockf(fd, fcntl.LOCK_UN, HEADER_SIZE, 0)
+        if magic != MAGIC or itemsize != SLOT_DTYPE.itemsize:
+            raise RuntimeError(f"{path} 不是這個版本的報價表（欄位變了請刪掉重建）")
+        self.nslots = n
+        self._mm = mmap.mmap(fd, HEADER_SIZE + n * itemsize)
+        self.rows = np.ndarray((n,), dtype=SLOT_DTYPE, buffer=self._mm, offset=HEADER_SIZE)
+        self._slots = {}          # 本行程的 WID → 槽號快取
+        self._lock = threading.RLock()   # lockf 不擋同行程的其他執行緒
+
+    # ====== 槽位 ======
+    def _scan(self):
+        wids = self.rows["WID"]
+        used = np.flatnonzero(wids != b"")
+        self._slots = {wids[i].decode(): int(i) for i in used}
+
+    def slot(self, wid, create=False):
+        i = self._slots.get(wid)
+        if i is not None:
+            return i
+        self._scan()  # 可能是別的行程剛加的
+        i = self._slots.get(wid)
+        if i is not None or not create:
+            return i
+        with self._lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, HEADER_SIZE, 0)
+            try:
+                self._scan()
+                i = self._slots.get(wid)
+                if i is None:
+                    free = np.flatnonzero(self.rows["WID"] == b"")
+                    if not len(free):
+                        raise RuntimeError(f"報價表已滿（{self.nslots} 槽），請調大 QUOTE_SLOTS 並重建")
+                    i = int(free[0])
+                    self.rows["WID"][i] = wid.encode()
+                    self._slots[wid] = i
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, HEADER_SIZE, 0)
+        return i
+
+    # ====== 寫 ======
+    def write(self, row):
+        wid = row.get("WID", "")
+        if not wid:
+            return
+        with self._lock:
+            i = self.slot(wid, create=True)
+            start = HEADER_SIZE + i * SLOT_DTYPE.itemsize
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, SLOT_DTYPE.itemsize, start)
+            try:
+                rec = self.rows[i]
+                rec["seq"] += 1   # 奇數：寫入中
+                for k, n in TEXT_FIELDS[1:]:
+                    rec[k] = str(row.get(k, "") or "").encode("utf-8")[:n]
+                for k in NUM_FIELDS:
+                    v = to_float(row.get(k))
+                    rec[k] = np.nan if v is None else v
+                    rec[f"{k}@raw"] = str(row.get(k, "") or "").encode("utf-8")[:RAW_LEN]
+                rec["updated"] = time.time()
+                rec["seq"] += 1
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, SLOT_DTYPE.itemsize, start)
+
+    # ====== 讀 ======
+    def read(self, wids=None, timeout=1.0):
+        """回傳一致的 structured array（複本）；wids 為 None 時回傳所有已使用的槽。
+        只重讀不一致的那幾列；timeout 秒內都讀不到一致的資料才報錯。"""
+        if wids is None:
+            self._scan()
+            idx = np.fromiter(self._slots.values(), dtype=np.int64)
+        else:
+            found = [self.slot(w) for w in wids]
+            idx = np.array([i for i in found if i is not None], dtype=np.int64)
+        out = self.rows[idx]          # fancy index → 複本
+        end = time.monotonic() + timeout
+        while True:
+            seq = self.rows["seq"][idx]
+            bad = (out["seq"] != seq) | (seq & 1 == 1)
+            if not bad.any():
+                return out
+            if time.monotonic() > end:
+                raise RuntimeError("報價表一直在寫入中，讀不到一致的資料")
+            time.sleep(0)
+            out[bad] = self.rows[idx[bad]]
+
+    def columns(self, wids=None, fields=None):
+        """{欄位: list}，文字欄位已解碼、NaN 轉 None；給 API 直接輸出。"""
+        data = self.read(wids)
+        out = {"updated": [round(float(x), 3) for x in data["updated"]]}
+        for k in fields or FIELDS:
+            col = data[k]
+            if col.dtype.kind == "S":
+                out[k] = [b.decode("utf-8", "ignore") for b in col]
+            else:
+                out[k] = [None if x != x else float(x) for x in col]
+        return out
+
+    def scrape(self, wids, batch_size=None, deadline=None):
+        """SnapshotStore 的 scrape_fn 介面：從共享表組出跟 scraper 一樣的列（數值欄用原字串），
+        web worker 用它取代自己開 Chrome；表裡沒有的 WID 回一列只有狀態的列。"""
+        data = self.read(wids)
+        found = {}
+        for rec in data:
+            row = {}
+            for k in ROW_FIELDS:
+                key = f"{k}@raw" if k in NUM_FIELDS else k
+                row[k] = rec[key].decode("utf-8", "ignore")
+            found[row["WID"]] = row
+        return [found.get(w) or {"WID": w, "狀態": STATUS_UNPUBLISHED} for w in wids]
+
+    def close(self):
+        self.rows = None
+        self._mm.close()
+        os.close(self._fd)
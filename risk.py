@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+部位風險（依標的彙總的金額 Delta / Gamma / Vega / Theta）
+- 部位檔：CSV（欄位 WID,張數；也接受 qty / 數量）或 JSON（{"WID": 張數} 或 [{"WID":…, "張數":…}]）；
+  1 張 = 1000 單位權證，每單位可換 最新行使比例 股標的
+- Delta 用網站上的發行商 Delta；Gamma / Vega / Theta 網站沒有，以 Black-Scholes
+  （買賣價隱波的平均、履約價、剩餘天數、標的現價）計算；Delta 缺值時也用 BS 補
+- 金額單位（元）：
+    Delta  = 約當股數 × Delta × S                （約當持有的標的市值）
+    Gamma  = 約當股數 × Γ × S² / 100            （標的漲 1% 時金額 Delta 的變化）
+    Vega   = 約當股數 × S × φ(d1) × √T / 100     （隱波 +1 個百分點）
+    Theta  = 約當股數 × BS θ / 365               （過一天）
+- RiskBook：部位的欄位與希臘字母都是 numpy 陣列；報價更新時只重算有變動的那幾檔，
+  再把差額加回所屬標的的小計（不重算整本）
+可用環境變數：
+  - RISK_FREE=0.015   無風險利率
+"""
+
+import csv
+import json
+import math
+import os
+import threading
+
+import numpy as np
+
+from core import to_float
+
+RISK_FREE = float(os.getenv("RISK_FREE", "0.015"))
+UNITS_PER_LOT = 1000
+GREEKS = ("delta", "gamma", "vega", "theta")
+_QTY_KEYS = ("張數", "數量", "qty", "quantity")
+INPUT_FIELDS = ("標的現價", "標的股價", "標的代碼", "標的名稱", "最新履約價", "最新行使比例",
+                "買價隱波", "賣價隱波", "Delta", "剩餘天數", "發行型態")
+
+
+def load_positions(path):
+    """回傳 {WID: 張數}；同一檔出現多次會加總。"""
+    pos = {}
+
+    def add(wid, qty):
+        wid = str(wid or "").strip()
+        if wid:
+            pos[wid] = pos.get(wid, 0.0) + float(qty or 0)
+
+    if path.endswith(".json"):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            for wid, qty in data.items():
+                add(wid, qty)
+        else:
+            for r in data:
+                add(r.get("WID"), next((r[k] for k in _QTY_KEYS if k in r), 0))
+        return pos
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        for r in csv.DictReader(f):
+            key = next((k for k in _QTY_KEYS if k in r), None)
+            if key is None:
+                raise ValueError(f"{path} 需要 WID 與 張數（或 qty / 數量）欄位")
+            add(r.get("WID"), r[key])
+    return pos
+
+
+def is_put(row):
+    """認售權證：發行型態寫認售，或代碼 P 結尾。"""
+    return "認售" in str(row.get("發行型態", "")) or str(row.get("WID", "")).endswith("P")
+
+
+def underlying_key(row):
+    return str(row.get("標的代碼") or row.get("標的名稱") or "（未知標的）")
+
+
+def _erf(x):
+    """numpy 版 erf（Abramowitz & Stegun 7.1.26，誤差 < 1.5e-7），整個陣列一次算，沒有逐元素的 Python 迴圈。"""
+    x = np.asarray(x, dtype=float)
+    sign = np.sign(x)
+    a = np.abs(x)
+    t = 1.0 / (1.0 + 0.3275911 * a)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    return sign * (1.0 - poly * np.exp(-a * a))
+
+
+def _ncdf(x):
+    return 0.5 * (1 + _erf(np.asarray(x, dtype=float) / math.sqrt(2)))
+
+
+def bs_greeks(S, K, T, vol, is_put, r=RISK_FREE):
+    """向量化 Black-Scholes：回傳每單位標的的 (delta, gamma, vega, theta/年)；輸入不完整的為 NaN。"""
+    S, K, T, vol = (np.asarray(a, dtype=float) for a in (S, K, T, vol))
+    is_put = np.asarray(is_put, dtype=bool)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sqrt_t = np.sqrt(T)
+        d1 = (np.log(S / K) + (r + 0.5 * vol ** 2) * T) / (vol * sqrt_t)
+        d2 = d1 - vol * sqrt_t
+        pdf = np.exp(-0.5 * d1 ** 2) / math.sqrt(2 * math.pi)
+        nd1, nd2 = _ncdf(d1), _ncdf(d2)
+        delta = np.where(is_put, nd1 - 1, nd1)
+        gamma = pdf / (S * vol * sqrt_t)
+        vega = S * pdf * sqrt_t
+        disc = K * np.exp(-r * T)
+        theta = -S * pdf * vol / (2 * sqrt_t) + np.where(is_put, r * disc * (1 - nd2), -r * disc * nd2)
+    bad = ~((S > 0) & (K > 0) & (T > 0) & (vol > 0))
+    for a in (delta, gamma, vega, theta):
+        a[bad] = np.nan
+    return delta, gamma, vega, theta
+
+
+def row_inputs(rows):
+    """列 → 向量化計算需要的欄位陣列。"""
+    def col(fn):
+        return np.array([np.nan if (v := fn(r)) is None else v for r in rows], dtype=float)
+
+    def iv(r):
+        b, a = to_float(r.get("買價隱波")), to_float(r.get("賣價隱波"))
+        vals = [v for v in (b, a) if v is not None and v > 0]
+        return sum(vals) / len(vals) / 100 if vals else None
+
+    return {
+        "S": col(lambda r: to_float(r.get("標的現價")) or to_float(r.get("標的股價"))),
+        "K": col(lambda r: to_float(r.get("最新履約價"))),
+        "T": col(lambda r: None if (d := to_float(r.get("剩餘天數"))) is None else d / 365),
+        "vol": col(iv),
+        "ratio": col(lambda r: to_float(r.get("最新行使比例"))),
+        "site_delta": col(lambda r: to_float(r.get("Delta"))),
+        "is_put": np.array([is_put(r) for r in rows], dtype=bool),
+    }
+
+
+def position_greeks(qty_lots, inp):
+    """每個部位的金額希臘字母（長度 N 的陣列 dict）。"""
+    delta, gamma, vega, theta = bs_greeks(inp["S"], inp["K"], inp["T"], inp["vol"], inp["is_put"])
+    delta = np.where(np.isnan(inp["site_delta"]), delta, inp["site_delta"])
+    shares = np.asarray(qty_lots, dtype=float) * UNITS_PER_LOT * inp["ratio"]
+    S = inp["S"]
+    return {
+        "delta": shares * delta * S,
+        "gamma": shares * gamma * S ** 2 / 100,
+        "vega": shares * vega / 100,
+        "theta": shares * theta / 365,
+    }
+
+
+class RiskBook:
+    def __init__(self, positions):
+        self.wids = list(positions)
+        self.qty = np.array([positions[w] for w in self.wids], dtype=float)
+        self.index = {w: i for i, w in enumerate(self.wids)}
+        n = len(self.wids)
+        self.greeks = {g: np.zeros(n) for g in GREEKS}
+        self.missing = np.ones(n, dtype=bool)       # 還沒有報價或輸入不完整
+        self.group = np.full(n, -1)                  # 部位 → 標的組別
+        self.groups = []                             # 組別 → 標的
+        self.totals = {g: np.zeros(0) for g in GREEKS}
+        self._inputs = {}                            # WID -> 上次計算用的欄位值
+        self._lock = threading.Lock()
+
+    def _group_of(self, key):
+        if key not in self.groups:
+            self.groups.append(key)
+            for g in GREEKS:
+                self.totals[g] = np.append(self.totals[g], 0.0)
+        return self.groups.index(key)
+
+    def update(self, rows):
+        """只重算計算欄位有變的部位，再把差額加回標的小計；回傳重算了幾檔。"""
+        with self._lock:
+            latest = {}   # 同一批同一檔出現多次只算最後一列，否則 np.add.at 會把舊值扣兩次
+            for r in rows:
+                if r.get("WID") in self.index and "成交價" in r:
+                    latest[r["WID"]] = r
+            changed = []
+            for wid, r in latest.items():
+                key = tuple(r.get(k) for k in INPUT_FIELDS)
+                if self._inputs.get(wid) != key:
+                    self._inputs[wid] = key
+                    changed.append(r)
+            rows = changed
+            if not rows:
+                return 0
+            idx = np.array([self.index[r["WID"]] for r in rows])
+            new_group = np.array([self._group_of(underlying_key(r)) for r in rows])
+            new = position_greeks(self.qty[idx], row_inputs(rows))
+            bad = np.zeros(len(idx), dtype=bool)
+            for g in GREEKS:
+                bad |= np.isnan(new[g])
+            for g in GREEKS:
+                val = np.where(bad, 0.0, new[g])
+                old_grp = self.group[idx]
+                had = old_grp >= 0
+                np.add.at(self.totals[g], old_grp[had], -self.greeks[g][idx][had])
+                np.add.at(self.totals[g], new_group, val)
+                self.greeks[g][idx] = val
+            self.group[idx] = new_group
+            self.missing[idx] = bad
+        return len(idx)
+
+    def publish_snapshot(self, snap):
+        """SnapshotStore 的 listener。"""
+        self.update(snap.items)
+
+    def summary(self):
+        with self._lock:
+            by = []
+            for i, key in enumerate(self.groups):
+                members = np.flatnonzero(self.group == i)
+                if not len(members):
+                    continue
+                by.append({
+                    "標的": key,
+                    "部位數": int(len(members)),
+                    **{g: round(float(self.totals[g][i]), 2) for g in GREEKS},
+                })
+            by.sort(key=lambda d: -abs(d["delta"]))
+            return {
+                "total": {g: round(float(self.totals[g].sum()), 2) for g in GREEKS},
+                "by_underlying": by,
+                "positions": len(self.wids),
+                "missing": [self.wids[i] for i in np.flatnonzero(self.missing)],
+            }
@@ -0,0 +1,601 @@
+# -*- coding: utf-8 -*-
+"""
+Selenium 抓取引擎（website.py、之後的 job / worker 共用）
+- chromedriver / Chrome 路徑由 driver_factory 解析一次後快取（可離線指定路徑）
+- 可用環境變數調整：
+  - HEADLESS=0/1  (default 1)
+  - BROWSER_BIN=/path/to/chrome  (如需指定瀏覽器)
+  - CHROMEDRIVER_PATH / DRIVER_OFFLINE / REUSE_PROFILE  見 driver_factory.py
+  - METRICS_LOG=1  每個階段結束印一行 [STAGE]
+  - PROFILE=1  追蹤每個 WebDriver 指令 + cProfile（見 profiling.py）
+  - SNAPSHOT_PARSE=1  每檔只拿一次 page_source，欄位交給 process pool 離線解析（見 html_parse.py）
+  - NAV_MODE=spa  同一個 driver 第二檔起不整頁重載，改在 Angular app 內切換 WID（失敗自動退回 reload）
+  - SPA_NAV_HOOK='…'  自訂切換用的 JS（可用變數 wid），例如呼叫頁面 controller 的載入函式
+  - TABS=3  每個 driver 開 3 個分頁流水線：抽取目前這檔時，其他分頁已在載下一檔（預設 1 = 關閉）
+"""
+
+import os
+import re
+import time
+from concurrent.futures import TimeoutError as FutureTimeout
+from datetime import datetime
+
+from selenium import webdriver
+from selenium.common.exceptions import NoSuchElementException, TimeoutException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+
+import driver_factory
+import metrics
+import profiling
+from core import BASIC_LABELS, is_warrant_code, warrant_url
+
+# ====== 設定 ======
+HEADLESS = os.getenv("HEADLESS", "1") != "0"  # 預設啟用 headless
+PAGELOAD_TIMEOUT = 35
+SCRIPT_TIMEOUT = 35
+SNAPSHOT_PARSE = os.getenv("SNAPSHOT_PARSE", "0") == "1"
+NAV_MODE = os.getenv("NAV_MODE", "reload").strip().lower()  # reload / spa
+SPA_NAV_HOOK = os.getenv("SPA_NAV_HOOK", "").strip()
+SPA_NAV_TIMEOUT = 8
+TABS = max(1, int(os.getenv("TABS", "1")))
+TAB_RECYCLE_EVERY = 50  # 同一分頁載這麼多檔後關掉重開，避免記憶體越吃越多
+MIN_WID_BUDGET = 3  # 秒；有總期限時，剩下的時間連這點都不夠就不再開始新的一檔
+
+STATUS_PENDING = "Pending（期限內未開始）"
+STATUS_DEADLINE = "Timeout（超過期限）"
+
+
+# ====== 期限 ======
+class Deadline:
+    """整批抓取的總期限（monotonic）；seconds 為 None 時不限時間，0 或負數視為已經到期。"""
+
+    def __init__(self, seconds=None):
+        self.end = None if seconds is None else time.monotonic() + seconds
+
+    def remaining(self):
+        return float("inf") if self.end is None else self.end - time.monotonic()
+
+    def can_start(self):
+        return self.end is None or self.remaining() >= MIN_WID_BUDGET
+
+    def share(self, outstanding):
+        return self.remaining() / max(outstanding, 1)
+
+
+def _timeout(drv, default):
+    """WebDriverWait 用的秒數：不超過這一檔剩下的時間額度。"""
+    end = getattr(drv, "_wid_deadline", None)
+    if end is None:
+        return default
+    return max(0.1, min(default, end - time.monotonic()))
+
+
+def _over_budget(drv):
+    end = getattr(drv, "_wid_deadline", None)
+    return end is not None and time.monotonic() >= end
+
+
+# ====== Selenium 工具 ======
+def make_driver(page_load_strategy=None):
+    """建立 Chrome driver（chromedriver / Chrome 路徑交給 driver_factory 解析並快取）。
+    page_load_strategy="none" 時 drv.get 不等載完就返回（分頁流水線用）。
+    """
+    print("[DRV] Creating Chrome driver...", flush=True)
+    opts = webdriver.ChromeOptions()
+    if page_load_strategy:
+        opts.page_load_strategy = page_load_strategy
+    if HEADLESS:
+        # "--headless=new" 有些版本比較挑，"--headless" 通用性更好
+        opts.add_argument("--headless")
+    # 一些穩定性/雜訊參數
+    opts.add_argument("--disable-blink-features=AutomationControlled")
+    opts.add_argument("--no-sandbox")
+    opts.add_argument("--disable-gpu")
+    opts.add_argument("--window-size=1280,1600")
+
+    drv = driver_factory.create_driver(opts)
+    drv.set_page_load_timeout(PAGELOAD_TIMEOUT)
+    drv.set_script_timeout(SCRIPT_TIMEOUT)
+    return drv
+
+
+def text_or_blank(drv, by, sel):
+    try:
+        return drv.find_element(by, sel).text.strip()
+    except NoSuchElementException:
+        return ""
+
+
+def find_basic_value_by_label(drv, label_text):
+    XPS = [
+        f"//*[normalize-space(text())='{label_text}']/following-sibling::*[1]",
+        f"//div[.//*[normalize-space(text())='{label_text}']]/*[normalize-space(text())='{label_text}']/following-sibling::*[1]",
+        f"//li[.//*[normalize-space(text())='{label_text}']]//*[normalize-space(text())='{label_text}']/following::*[1]",
+    ]
+    for xp in XPS:
+        try:
+            el = drv.find_element(By.XPATH, xp)
+            t = el.text.strip()
+            if t:
+                return t
+        except NoSuchElementException:
+            continue
+    return ""
+
+
+def get_target_info(drv):
+    # 先找 ng-bind
+    name = ""
+    price = ""
+    for xp in ["//*[contains(@ng-bind,'TAR_NAME')]", "//*[contains(@ng-bind,'FLD_TAR_NAME')]"]:
+        els = drv.find_elements(By.XPATH, xp)
+        if els and els[0].text.strip():
+            name = els[0].text.strip()
+            break
+    for xp in ["//*[contains(@ng-bind,'TAR_PRICE')]", "//*[contains(@ng-bind,'FLD_TAR_PRICE')]"]:
+        els = drv.find_elements(By.XPATH, xp)
+        if els and els[0].text.strip():
+            price = els[0].text.strip().replace(",", "")
+            break
+    if name or price:
+        return name, price
+
+    # 再找含「標的」的抬頭字串並解析（備援）
+    try:
+        header = drv.find_element(By.XPATH, "//*[contains(normalize-space(.), '標的')]")
+        block = header.text.strip()
+        if block:
+            after = re.split(r"標的[:：]", block, maxsplit=1)
+            tail = after[1].strip() if len(after) > 1 else block
+            m_name = re.match(r"([^\s(／/｜|]+)", tail)
+            m_px = re.search(r"(\d{1,3}(?:,\d{3})*(?:\.\d+)?|\d+\.\d+)", tail)
+            return (m_name.group(1) if m_name else ""), (
+                m_px.group(1).replace(",", "") if m_px else ""
+            )
+    except NoSuchElementException:
+        pass
+    return "", ""
+
+
+WID_XPATH = "//*[contains(@ng-bind, 'WAR_ID') or contains(@id,'lblWID')]"
+
+# 在已載入的 Angular app 裡切換 WID：先跑自訂 hook，否則改網址參數 + $location/$route，
+# 讓 app 走自己的路由 / 資料請求。回傳使用的方式，不支援時回傳 "unsupported:…"。
+SPA_NAV_JS = """
+var wid = arguments[0], hook = arguments[1];
+if (hook) { (new Function("wid", hook))(wid); return "hook"; }
+var ng = window.angular;
+if (!ng) { return "unsupported:no-angular"; }
+var host = document.querySelector("[ng-app],[data-ng-app],.ng-scope") || document.body;
+var inj = ng.element(host).injector();
+if (!inj) { return "unsupported:no-injector"; }
+history.replaceState(history.state, "", location.pathname + "?WID=" + encodeURIComponent(wid));
+var $rootScope = inj.get("$rootScope");
+$rootScope.$apply(function () {
+  if (inj.has("$location")) { inj.get("$location").search("WID", wid); }
+});
+if (inj.has("$route")) { inj.get("$route").reload(); return "route"; }
+if (inj.has("$state")) { inj.get("$state").reload(); return "state"; }
+return "location";
+"""
+
+# 目前頁面上除了 WAR_ID 以外所有 ng-bind 的內容（價格、基本資料），SPA 切換前後比對用
+BINDINGS_JS = """
+var out = [];
+document.querySelectorAll("[ng-bind]").forEach(function (el) {
+  var b = el.getAttribute("ng-bind");
+  if (b.indexOf("WAR_ID") < 0) { out.push(b + "=" + el.textContent.trim()); }
+});
+return out.join("|");
+"""
+
+
+def spa_navigate(drv, wid):
+    """NAV_MODE=spa：不重載頁面，改用 app 自己的機制切到新 WID。
+    WAR_ID 綁定的字變成新 WID 還不夠（Angular 可能先更新它、價格與基本資料稍後才到），
+    要等其他綁定的內容也跟切換前不同才算完成，免得新 WID 配上上一檔的價格；
+    任何一步不行就回 False，並對這個 driver 停用 SPA，之後都走整頁 reload。
+    """
+    if not getattr(drv, "_spa_ready", False):
+        return False
+    try:
+        with metrics.stage("spa_nav", wid):
+            before = drv.execute_script(BINDINGS_JS)
+            how = drv.execute_script(SPA_NAV_JS, wid, SPA_NAV_HOOK)
+            if str(how).startswith("unsupported"):
+                raise RuntimeError(how)
+            wait = WebDriverWait(drv, _timeout(drv, SPA_NAV_TIMEOUT))
+            wait.until(EC.text_to_be_present_in_element((By.XPATH, WID_XPATH), wid))
+            # 兩檔內容完全一樣的機率很低；真的等不到就逾時、退回整頁載入（一定是新資料）
+            wait.until(lambda d: d.execute_script(BINDINGS_JS) != before)
+        return True
+    except Exception as e:
+        print(f"[SCRAPE] SPA 切換失敗，改回整頁載入：{type(e).__name__}: {e}", flush=True)
+        metrics.inc("warrant_spa_fallback_total", kind=type(e).__name__)
+        drv._spa_ready = False
+        drv._spa_disabled = True
+        return False
+
+
+def load_page(drv, wid):
+    """載入權證頁並等到買價區塊出現且有字；回傳 (url, 狀態)。"""
+    url = warrant_url(wid)
+    if NAV_MODE == "spa" and spa_navigate(drv, wid):
+        print(f"[SCRAPE] SPA → {wid}", flush=True)
+    else:
+        print(f"[SCRAPE] GET {url}", flush=True)
+        with metrics.stage("drv_get", wid):
+            drv.get(url)
+        # 整頁載入成功後，同一個 driver 下一檔就可以試 SPA 切換
+        drv._spa_ready = NAV_MODE == "spa" and not getattr(drv, "_spa_disabled", False)
+    return url, wait_price(drv, wid)
+
+
+def wait_price(drv, wid):
+    """等買價區塊出現且有字；回傳狀態字串。"""
+    status = "OK"
+    try:
+        with metrics.stage("wait_price_section", wid):
+            WebDriverWait(drv, _timeout(drv, 15)).until(
+                EC.presence_of_element_located((By.XPATH, "//*[contains(@ng-bind, 'WAR_BUY_PRICE')]"))
+            )
+        with metrics.stage("wait_price_text", wid):
+            WebDriverWait(drv, _timeout(drv, 25)).until(
+                lambda d: d.find_element(By.XPATH, "//*[contains(@ng-bind, 'WAR_BUY_PRICE')]")
+                .text.strip()
+                != ""
+            )
+    except TimeoutException:
+        status = "No price section / slow"
+    return status
+
+
+def scrape_one(drv, wid):
+    url, status = load_page(drv, wid)
+    return extract_row(drv, wid, url, status)
+
+
+def extract_row(drv, wid, url, status):
+    """頁面已就緒，從目前分頁抽出一列。"""
+    with metrics.stage("extract_prices", wid):
+        deal = text_or_blank(drv, By.XPATH, "//*[contains(@ng-bind,'WAR_DEAL_PRICE')]")
+        buy = text_or_blank(drv, By.XPATH, "//*[contains(@ng-bind,'WAR_BUY_PRICE')]")
+        sell = text_or_blank(drv, By.XPATH, "//*[contains(@ng-bind,'WAR_SELL_PRICE')]")
+
+    # 備援 class（常見順序：成交/買/賣）
+    if not (deal and buy and sell):
+        try:
+            with metrics.stage("wait_tbig", wid):
+                WebDriverWait(drv, _timeout(drv, 6)).until(
+                    EC.presence_of_all_elements_located((By.CLASS_NAME, "tBig"))
+                )
+            prices = [e.text.strip() for e in drv.find_elements(By.CLASS_NAME, "tBig")]
+            if len(prices) >= 3:
+                deal = deal or prices[0]
+                buy = buy or prices[1]
+                sell = sell or prices[2]
+        except TimeoutException:
+            pass
+
+    with metrics.stage("extract_target", wid):
+        tgt_name, tgt_px = get_target_info(drv)
+        tgt_code = re.sub(r"\D", "", text_or_blank(drv, By.XPATH, "//*[contains(@ng-bind,'TAR_CODE')]"))
+    with metrics.stage("extract_basic", wid):
+        basic = {lab: find_basic_value_by_label(drv, lab) for lab in BASIC_LABELS}
+
+    if not (deal or buy or sell):
+        status = "No prices"
+
+    return {
+        "WID": wid,
+        "狀態": status,
+        "成交價": deal,
+        "買價": buy,
+        "賣價": sell,
+        "標的名稱": tgt_name,
+        "標的代碼": tgt_code,
+        "標的現價": tgt_px,
+        **basic,
+        "抓取時間": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "來源網址": url,
+    }
+
+
+def snapshot_one(drv, wid):
+    """只負責載頁 + 拿一次 page_source，driver 馬上可以去載下一檔。"""
+    url, status = load_page(drv, wid)
+    if status != "OK":
+        # 跟線上版一樣，買價沒出來時給 tBig 備援一點時間
+        try:
+            with metrics.stage("wait_tbig", wid):
+                WebDriverWait(drv, _timeout(drv, 6)).until(
+                    EC.presence_of_all_elements_located((By.CLASS_NAME, "tBig"))
+                )
+        except TimeoutException:
+            pass
+    with metrics.stage("page_source", wid):
+        page = drv.page_source
+    return page, url, status
+
+
+def row_from_snapshot(wid, fields, url, status):
+    if not (fields["成交價"] or fields["買價"] or fields["賣價"]):
+        status = "No prices"
+    return {
+        "WID": wid,
+        "狀態": status,
+        "成交價": fields["成交價"],
+        "買價": fields["買價"],
+        "賣價": fields["賣價"],
+        "標的名稱": fields["標的名稱"],
+        "標的代碼": fields["標的代碼"],
+        "標的現價": fields["標的現價"],
+        **{lab: fields[lab] for lab in BASIC_LABELS},
+        "抓取時間": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "來源網址": url,
+    }
+
+
+def _start_wid(drv, deadline, outstanding):
+    """設定這一檔可用的時間（總期限平均分給還沒抓的 WID）；沒有期限時什麼都不做。"""
+    if deadline.end is None:
+        return
+    budget = min(max(MIN_WID_BUDGET, deadline.share(outstanding)), deadline.remaining())
+    drv._wid_deadline = time.monotonic() + budget
+    if getattr(drv, "_page_load_budget", None) != round(budget):
+        drv._page_load_budget = round(budget)
+        drv.set_page_load_timeout(max(1, min(PAGELOAD_TIMEOUT, budget)))
+
+
+def _finish_row(drv, wid, row=None, exc=None):
+    """收尾一列：超過這檔的時間額度就標成逾期，並記錄 metrics。"""
+    if exc is not None:
+        row = {"WID": wid, "狀態": f"Error: {type(exc).__name__}: {exc}"}
+    if row["狀態"] != "OK" and _over_budget(drv):
+        row["狀態"] = STATUS_DEADLINE
+    if row["狀態"] == STATUS_DEADLINE:
+        metrics.inc("warrant_rows_total", status="deadline")
+    elif exc is not None:
+        metrics.inc("warrant_rows_total", status="error")
+    else:
+        metrics.inc("warrant_rows_total", status="ok" if row["狀態"] == "OK" else "degraded")
+    return row
+
+
+def _pending_row(wid):
+    metrics.inc("warrant_rows_total", status="pending")
+    return {"WID": wid, "狀態": STATUS_PENDING}
+
+
+def _skip_row(wid):
+    metrics.inc("warrant_rows_total", status="skipped")
+    return {"WID": wid, "狀態": "非權證（略過）"}
+
+
+def scrape_batch_snapshot(wids, batch_size=5, deadline=None):
+    """SNAPSHOT_PARSE 模式：瀏覽器只載頁，解析在 html_parse 的 process pool 平行跑。"""
+    import html_parse
+
+    deadline = deadline or Deadline()
+    results = [None] * len(wids)
+    left = sum(1 for w in wids if is_warrant_code(w))
+    pending = []  # (index, wid, future, url, status)
+    for i in range(0, len(wids), batch_size):
+        chunk = list(enumerate(wids[i : i + batch_size], start=i))
+        if not deadline.can_start():
+            for j, wid in chunk:
+                results[j] = _pending_row(wid) if is_warrant_code(wid) else _skip_row(wid)
+            continue
+        drv = None
+        try:
+            drv = make_driver()
+            metrics.add_gauge("warrant_drivers_active", 1)
+            for j, wid in chunk:
+                if not is_warrant_code(wid):
+                    results[j] = _skip_row(wid)
+                    continue
+                if not deadline.can_start():
+                    results[j] = _pending_row(wid)
+                    continue
+                try:
+                    _start_wid(drv, deadline, left)
+                    with profiling.wid_span(wid), metrics.stage("snapshot_one", wid):
+                        page, url, status = snapshot_one(drv, wid)
+                    pending.append((j, wid, html_parse.submit(page, BASIC_LABELS), url, status))
+                except Exception as e:
+                    results[j] = _finish_row(drv, wid, exc=e)
+                left -= 1
+        finally:
+            if drv:
+                metrics.add_gauge("warrant_drivers_active", -1)
+                try:
+                    drv.quit()
+                except Exception:
+                    pass
+
+    for j, wid, fut, url, status in pending:
+        try:
+            with metrics.stage("parse_wait", wid):
+                fields, sec = fut.result(timeout=None if deadline.end is None else max(0.1, deadline.remaining()))
+            metrics.observe("warrant_stage_seconds", sec, stage="parse_html")
+            row = row_from_snapshot(wid, fields, url, status)
+            metrics.inc("warrant_rows_total", status="ok" if row["狀態"] == "OK" else "degraded")
+        except FutureTimeout:
+            fut.cancel()
+            row = {"WID": wid, "狀態": STATUS_DEADLINE, "來源網址": url}
+            metrics.inc("warrant_rows_total", status="deadline")
+        except Exception as e:
+            row = {"WID": wid, "狀態": f"Error: {type(e).__name__}: {e}"}
+            metrics.inc("warrant_rows_total", status="error")
+        results[j] = row
+    return results
+
+
+def scrape_batch_pipelined(wids, batch_size=5, tabs=TABS, deadline=None):
+    """分頁流水線：每個 driver 開 tabs 個分頁，抽取其中一頁時其他分頁同時在載入。
+    driver 用 pageLoadStrategy=none，drv.get 送出導頁就返回；
+    每個分頁記住自己該是哪個 WID，抽取前先等 WAR_ID 顯示該 WID（防止讀到上一檔的殘留內容）。
+    """
+    deadline = deadline or Deadline()
+    results = [None] * len(wids)
+    left = sum(1 for w in wids if is_warrant_code(w))
+    for i in range(0, len(wids), batch_size):
+        queue = []
+        for j, wid in enumerate(wids[i : i + batch_size], start=i):
+            if is_warrant_code(wid):
+                queue.append((j, wid))
+            else:
+                results[j] = _skip_row(wid)
+        if not queue:
+            continue
+        if not deadline.can_start():
+            for j, wid in queue:
+                results[j] = _pending_row(wid)
+            continue
+
+        drv = None
+        try:
+            drv = make_driver(page_load_strategy="none")
+            metrics.add_gauge("warrant_drivers_active", 1)
+            handles = [drv.current_window_handle]
+            for _ in range(min(tabs, len(queue)) - 1):
+                drv.switch_to.new_window("tab")
+                handles.append(drv.current_window_handle)
+            uses = {h: 0 for h in handles}
+            inflight = []  # (handle, index, wid, url, 分頁是否載過別檔)
+
+            def start(handle):
+                """把下一檔載進這個分頁。導頁出錯（逾時、分頁掛了）只記這檔的錯誤列，
+                換一個新分頁接著載下一檔，不讓整批中斷。"""
+                nonlocal left
+                while queue and deadline.can_start():
+                    j, wid = queue.pop(0)
+                    url = warrant_url(wid)
+                    try:
+                        if uses[handle] >= TAB_RECYCLE_EVERY:
+                            # 先開新分頁再關舊的（關掉目前分頁後不能直接 new_window）
+                            drv.switch_to.new_window("tab")
+                            new = drv.current_window_handle
+                            drv.switch_to.window(handle)
+                            drv.close()
+                            del uses[handle]
+                            uses[new] = 0
+                            handle = new
+                        drv.switch_to.window(handle)
+                        print(f"[SCRAPE] GET {url} (pipelined)", flush=True)
+                        with metrics.stage("drv_get", wid):
+                            drv.get(url)
+                        inflight.append((handle, j, wid, url, uses[handle] > 0))
+                        uses[handle] += 1
+                        return
+                    except Exception as e:
+                        print(f"[SCRAPE] {wid} 導頁失敗：{type(e).__name__}: {e}", flush=True)
+                        metrics.inc("warrant_rows_total", status="error")
+                        results[j] = {"WID": wid, "狀態": f"Error: {type(e).__name__}: {e}", "來源網址": url}
+                        left -= 1
+                        handle = replace_tab(handle)
+
+            def replace_tab(handle):
+                """壞掉的分頁換成新分頁；連新分頁都開不了就沿用原本的（之後的檔各自記錯誤）。"""
+                try:
+                    drv.switch_to.new_window("tab")
+                except Exception:
+                    return handle
+                new = drv.current_window_handle
+                uses.pop(handle, None)
+                uses[new] = 0
+                try:
+                    drv.switch_to.window(handle)
+                    drv.close()
+                except Exception:
+                    pass
+                drv.switch_to.window(new)
+                return new
+
+            for h in handles:
+                start(h)
+
+            while inflight:
+                handle, j, wid, url, reused = inflight.pop(0)
+                try:
+                    _start_wid(drv, deadline, left)
+                    with profiling.wid_span(wid), metrics.stage("scrape_one", wid):
+                        drv.switch_to.window(handle)
+                        try:
+                            with metrics.stage("wait_wid", wid):
+                                WebDriverWait(drv, _timeout(drv, PAGELOAD_TIMEOUT)).until(
+                                    EC.text_to_be_present_in_element((By.XPATH, WID_XPATH), wid)
+                                )
+                            fresh = True
+                        except TimeoutException:
+                            # 全新分頁沒有舊內容可混淆，交給 wait_price 判斷；載過別檔的分頁則不能信
+                            fresh = not reused
+                        if fresh:
+                            row = extract_row(drv, wid, url, wait_price(drv, wid))
+                        else:
+                            row = {"WID": wid, "狀態": "Timeout（分頁仍是上一檔內容）", "來源網址": url}
+                    row = _finish_row(drv, wid, row)
+                except Exception as e:
+                    row = _finish_row(drv, wid, exc=e)
+                results[j] = row
+                left -= 1
+                # 這個分頁抽完了，立刻拿去載下一檔
+                start(handle)
+            for j, wid in queue:  # 期限到了還沒開始載的
+                results[j] = _pending_row(wid)
+        finally:
+            if drv:
+                metrics.add_gauge("warrant_drivers_active", -1)
+                try:
+                    drv.quit()
+                except Exception:
+                    pass
+    return results
+
+
+def scrape_batch(wids, batch_size=5, deadline=None):
+    """抓一串 WID；deadline 為整批的總秒數（None = 不限）。
+    有期限時，剩下的時間平均分給還沒抓的 WID，時間到就停：
+    已開始但沒抓完的標成「超過期限」，還沒開始的標成「期限內未開始」。
+    """
+    deadline = Deadline(deadline)
+    if TABS > 1:
+        return scrape_batch_pipelined(wids, batch_size, deadline=deadline)
+    if SNAPSHOT_PARSE:
+        return scrape_batch_snapshot(wids, batch_size, deadline=deadline)
+    results = []
+    left = sum(1 for w in wids if is_warrant_code(w))
+    for i in range(0, len(wids), batch_size):
+        chunk = wids[i : i + batch_size]
+        if not deadline.can_start():
+            results.extend(_pending_row(w) if is_warrant_code(w) else _skip_row(w) for w in chunk)
+            continue
+        drv = None
+        try:
+            drv = make_driver()
+            metrics.add_gauge("warrant_drivers_active", 1)
+            for wid in chunk:
+                if not is_warrant_code(wid):
+                    results.append(_skip_row(wid))
+                    continue
+                if not deadline.can_start():
+                    results.append(_pending_row(wid))
+                    continue
+                try:
+                    _start_wid(drv, deadline, left)
+                    with profiling.wid_span(wid), metrics.stage("scrape_one", wid):
+                        row = _finish_row(drv, wid, scrape_one(drv, wid))
+                except Exception as e:
+                    row = _finish_row(drv, wid, exc=e)
+                results.append(row)
+                left -= 1
+        finally:
+            if drv:
+                metrics.add_gauge("warrant_drivers_active", -1)
+                try:
+                    drv.quit()
+                except Exception:
+                    pass
+    return results
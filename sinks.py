@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+"""
+輸出 sink：每抓完一列就寫出去，可同時開好幾個
+- xlsx     openpyxl write_only 串流寫主表，每檔一張試算表（close 時才成為完整檔案）
+- csv      UTF-8 BOM（Excel 直接開不亂碼），每列 flush
+- jsonl    一列一個 JSON，每列 flush
+- parquet  pyarrow，欄位有型別（價格/隱波/Delta… 為 float64、日期為 date32），
+           每 PARQUET_ROW_GROUP 列寫出一個 row group
+用法：
+  sink = open_sinks(["out.xlsx", "out.parquet", "jsonl:-"])   # 依副檔名判斷，或用 格式:路徑
+  sink.write(row) … sink.close()
+CSV / JSONL 中途掛掉也保有已寫入的列；xlsx / parquet 要 close 後才完整。
+路徑也可以是可寫入的二進位檔案物件；stream_rows() 用這點在背景執行緒寫進一條有上限的管線，
+邊寫邊把 bytes 交給 HTTP 回應（網站的下載端點用），整份檔案不會留在記憶體裡
+可用環境變數：
+  - PARQUET_ROW_GROUP=50
+  - STREAM_CHUNK=65536   串流下載每塊的大小（bytes）
+  - STREAM_QUEUE=16      最多暫存幾塊；讀的人跟不上時寫的執行緒會停下來等（記憶體上限約 CHUNK × QUEUE）
+"""
+
+import csv
+import io
+import json
+import os
+import queue
+import sys
+import threading
+
+import metrics
+from core import (
+    CALC_BOLD, CALC_WIDTHS, DATE_FIELDS, FLOAT_FIELDS, HEADER_ORDER, TIMESTAMP_FIELDS,
+    calc_sheet_cells, typed_value,
+)
+
+PARQUET_ROW_GROUP = int(os.getenv("PARQUET_ROW_GROUP", "50"))
+STREAM_CHUNK = int(os.getenv("STREAM_CHUNK", str(64 * 1024)))
+STREAM_QUEUE = int(os.getenv("STREAM_QUEUE", "16"))
+
+
+def _ensure_dir(path):
+    if isinstance(path, str) and (d := os.path.dirname(path)):
+        os.makedirs(d, exist_ok=True)
+
+
+def _open_text(path, encoding):
+    if path == "-":
+        return sys.stdout, False
+    if not isinstance(path, str):   # 二進位檔案物件：包一層文字編碼，關閉時一起關
+        return io.TextIOWrapper(path, encoding=encoding, newline="", write_through=True), True
+    _ensure_dir(path)
+    return open(path, "w", encoding=encoding, newline=""), True
+
+
+class CsvSink:
+    def __init__(self, path, fields=HEADER_ORDER):
+        self.path = path
+        self.fields = list(fields)
+        self._f, self._owned = _open_text(path, "utf-8-sig")
+        self._w = csv.DictWriter(self._f, fieldnames=self.fields, extrasaction="ignore")
+        self._w.writeheader()
+
+    def write(self, row):
+        self._w.writerow({k: row.get(k, "") for k in self.fields})
+        self._f.flush()
+
+    def close(self):
+        if self._owned:
+            self._f.close()
+
+
+class JsonlSink:
+    def __init__(self, path, fields=None):
+        self.path = path
+        self.fields = list(fields) if fields else None
+        self._f, self._owned = _open_text(path, "utf-8")
+
+    def write(self, row):
+        if self.fields:
+            row = {k: row.get(k, "") for k in self.fields}
+        self._f.write(json.dumps(row, ensure_ascii=False, default=str) + "\n")
+        self._f.flush()
+
+    def close(self):
+        if self._owned:
+            self._f.close()
+
+
+def parquet_schema(fields):
+    import pyarrow as pa
+
+    def typ(k):
+        if k in FLOAT_FIELDS:
+            return pa.float64()
+        if k in DATE_FIELDS:
+            return pa.date32()
+        if k in TIMESTAMP_FIELDS:
+            return pa.timestamp("s")
+        return pa.string()
+
+    return pa.schema([(k, typ(k)) for k in fields])
+
+
+class ParquetSink:
+    def __init__(self, path, fields=HEADER_ORDER, row_group_size=PARQUET_ROW_GROUP):
+        import pyarrow.parquet as pq
+
+        self.path = path
+        self.fields = list(fields)
+        self.schema = parquet_schema(self.fields)
+        _ensure_dir(path)
+        self._writer = pq.ParquetWriter(path, self.schema, compression="zstd")
+        self._buf = {k: [] for k in self.fields}
+        self._n = 0
+        self.row_group_size = row_group_size
+
+    def write(self, row):
+        for k in self.fields:
+            self._buf[k].append(typed_value(k, row.get(k)))
+        self._n += 1
+        if self._n >= self.row_group_size:
+            self._flush()
+
+    def _flush(self):
+        import pyarrow as pa
+
+        if not self._n:
+            return
+        self._writer.write_table(pa.table(self._buf, schema=self.schema))
+        self._buf = {k: [] for k in self.fields}
+        self._n = 0
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+
+
+class XlsxSink:
+    """主表一列一列 append；calc_sheets=True 時每檔另開「試算_WID」表（寫完就關，不佔檔案代號）。"""
+
+    def __init__(self, path, fields=HEADER_ORDER, calc_sheets=True):
+        import openpyxl
+
+        self.path = path
+        self.fields = list(fields)
+        self.calc_sheets = calc_sheets
+        self._wb = openpyxl.Workbook(write_only=True)
+        self._ws = self._wb.create_sheet("元大權證")
+        self._ws.append(self.fields)
+
+    def write(self, row):
+        self._ws.append([row.get(k, "") for k in self.fields])
+        if self.calc_sheets:
+            self._write_calc(row)
+
+    def _write_calc(self, row):
+        from openpyxl.cell import WriteOnlyCell
+        from openpyxl.styles import Font
+        from openpyxl.utils.cell import coordinate_from_string, column_index_from_string
+
+        calc = self._wb.create_sheet(f"試算_{row.get('WID', '')}")
+        for col, width in CALC_WIDTHS:
+            calc.column_dimensions[col].width = width
+        grid = {}
+        for addr, val in calc_sheet_cells(row).items():
+            col, r = coordinate_from_string(addr)
+            grid.setdefault(r, {})[column_index_from_string(col)] = (val, addr in CALC_BOLD)
+        bold = Font(bold=True)
+        for r in range(1, max(grid) + 1):
+            cells = grid.get(r, {})
+            out = []
+            for c in range(1, max(cells, default=0) + 1):
+                val, is_bold = cells.get(c, (None, False))
+                cell = WriteOnlyCell(calc, value=val)
+                if is_bold:
+                    cell.font = bold
+                out.append(cell)
+            calc.append(out)
+        calc.close()
+
+    def close(self):
+        _ensure_dir(self.path)
+        with metrics.stage("excel_save"):
+            self._wb.save(self.path)
+
+
+class MultiSink:
+    def __init__(self, sinks):
+        self.sinks = list(sinks)
+
+    def write(self, row):
+        with metrics.stage("sink_write"):
+            for s in self.sinks:
+                s.write(row)
+
+    def close(self):
+        err = None
+        for s in self.sinks:
+            try:
+                s.close()
+            except Exception as e:  # 一個壞掉不影響其他檔案收尾
+                print(f"⚠️ 關閉輸出 {getattr(s, 'path', s)} 失敗：{e}", flush=True)
+                err = err or e
+        if err:
+            raise err
+
+    @property
+    def paths(self):
+        return [s.path for s in self.sinks]
+
+
+SINKS = {"xlsx": XlsxSink, "csv": CsvSink, "jsonl": JsonlSink, "parquet": ParquetSink}
+_EXT = {".xlsx": "xlsx", ".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl", ".parquet": "parquet"}
+
+
+def parse_spec(spec):
+    """'out.parquet' → ('parquet', 'out.parquet')；'jsonl:-' → ('jsonl', '-')。"""
+    fmt, sep, path = spec.partition(":")
+    if sep and fmt in SINKS:
+        return fmt, path
+    ext = os.path.splitext(spec)[1].lower()
+    if ext not in _EXT:
+        raise ValueError(f"看不出輸出格式：{spec}（可用 {', '.join(SINKS)}，或寫成 格式:路徑）")
+    return _EXT[ext], spec
+
+
+def open_sinks(specs, fields=HEADER_ORDER):
+    sinks = []
+    try:
+        for spec in specs:
+            fmt, path = parse_spec(spec)
+            sinks.append(SINKS[fmt](path, fields=fields))
+    except Exception:
+        for s in sinks:
+            s.close()
+        raise
+    return MultiSink(sinks)
+
+
+# ====== 串流下載 ======
+class _Pipe(io.RawIOBase):
+    """sink 寫進來的 bytes 湊滿 STREAM_CHUNK 就放進有上限的佇列；佇列滿了寫的人就等。
+    只能往後寫（不能 seek），zipfile / pyarrow 會自動改用不需回頭改寫的格式。"""
+
+    _END = object()
+
+    def __init__(self):
+        super().__init__()
+        self.chunks = queue.Queue(STREAM_QUEUE)
+        self.cancelled = threading.Event()   # 下載端斷線：之後的寫入直接丟錯讓背景執行緒收手
+        self._buf = bytearray()
+        self._pos = 0
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def write(self, b):
+        if self.cancelled.is_set():
+            raise BrokenPipeError("下載端已斷線")
+        self._buf += b
+        self._pos += len(b)
+        if len(self._buf) >= STREAM_CHUNK:
+            self._put(bytes(self._buf))
+            self._buf.clear()
+        return len(b)
+
+    def _put(self, item):
+        while not self.cancelled.is_set():
+            try:
+                self.chunks.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+        raise BrokenPipeError("下載端已斷線")
+
+    def finish(self, err=None):
+        """寫完（或出錯）時由背景執行緒呼叫：送出剩下的 bytes 與結束記號。"""
+        try:
+            if self._buf and err is None:
+                self._put(bytes(self._buf))
+            self._buf.clear()
+            self._put(err if err is not None else self._END)
+        except BrokenPipeError:
+            pass
+
+
+def stream_rows(fmt, rows, fields=HEADER_ORDER, **opts):
+    """在背景執行緒把 rows 寫成 fmt 格式，回傳逐塊吐出 bytes 的產生器。
+    rows 可以是產生器；opts 直接給 sink（例如 xlsx 的 calc_sheets）。
+    產生器被提早關閉（下載端斷線）時背景執行緒會在下一次寫入時停下。"""
+    if fmt not in SINKS:
+        raise ValueError(f"不支援的格式：{fmt}（可用 {', '.join(SINKS)}）")
+    pipe = _Pipe()
+
+    def produce():
+        err = None
+        try:
+            sink = SINKS[fmt](pipe, fields=fields, **opts)
+            for r in rows:
+                sink.write(r)
+            sink.close()
+        except Exception as e:
+            err = e
+        pipe.finish(err)
+
+    threading.Thread(target=produce, daemon=True, name=f"stream-{fmt}").start()
+
+    def chunks():
+        try:
+            while True:
+                item = pipe.chunks.get()
+                if item is _Pipe._END:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            pipe.cancelled.set()
+
+    return chunks()
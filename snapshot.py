@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+看板 / API 共用的快照快取
+- 同一組 WID 在 SNAPSHOT_TTL 秒內重複查詢直接回快取，不再開 Chrome
+- 同一組 WID 同時有多個請求時只抓一次，其他請求等它的結果
+- 每份快照有內容摘要 digest（不含 抓取時間），內容沒變 digest 就不變，API 拿它當 ETag
+- 編碼好的回應（格式 × 欄位 × 壓縮）掛在快照上，同一份快照不重複序列化
+- 每組 WID 保留最近 SNAPSHOT_HISTORY 份快照，前端帶舊版本號來只拿差異（diff_rows）
+可用環境變數：
+  - SNAPSHOT_TTL=15   秒；0 = 每次都重抓（仍會算 digest）
+  - SNAPSHOT_HISTORY=8
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import metrics
+
+SNAPSHOT_TTL = float(os.getenv("SNAPSHOT_TTL", "15"))
+SNAPSHOT_HISTORY = int(os.getenv("SNAPSHOT_HISTORY", "8"))
+
+# 每次抓都會變、不代表內容有變的欄位
+VOLATILE_FIELDS = ("抓取時間",)
+
+
+def content_digest(items):
+    stable = [{k: v for k, v in r.items() if k not in VOLATILE_FIELDS} for r in items]
+    raw = json.dumps(stable, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:20]
+
+
+def diff_rows(old, new):
+    """兩份快照的差異（以 WID 對齊）：
+    changed 只帶有變的欄位（外加 WID 與 抓取時間），added 為整列，removed 為 WID 清單。"""
+    before = {r.get("WID"): r for r in old}
+    seen = set()
+    changed, added = [], []
+    for r in new:
+        wid = r.get("WID")
+        seen.add(wid)
+        prev = before.get(wid)
+        if prev is None:
+            added.append(r)
+            continue
+        delta = {k: v for k, v in r.items() if k not in VOLATILE_FIELDS and prev.get(k) != v}
+        # 舊列有、新列沒有的欄位（例如變成 Pending 列）清成空字串
+        delta.update({k: "" for k in prev if k not in r and k not in VOLATILE_FIELDS})
+        if delta:
+            delta["WID"] = wid
+            delta.update({k: r[k] for k in VOLATILE_FIELDS if k in r})
+            changed.append(delta)
+    removed = [w for w in before if w not in seen]
+    return {"changed": changed, "added": added, "removed": removed}
+
+
+class Snapshot:
+    def __init__(self, wids, items, summary, deadline=None):
+        self.wids = tuple(wids)
+        self.items = items
+        self.summary = summary      # {status, pending, timed_out}
+        self.deadline = deadline
+        self.created = time.time()
+        self.generated_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.digest = content_digest(items)
+        self.encoded = {}           # (format, fields, encoding) -> bytes
+        self._enc_lock = threading.Lock()
+
+    @property
+    def complete(self):
+        return self.summary.get("status") == "complete"
+
+    def age(self):
+        return time.time() - self.created
+
+    def encode(self, key, build):
+        """key 對應的編碼結果只算一次。"""
+        with self._enc_lock:
+            data = self.encoded.get(key)
+        if data is None:
+            data = build()
+            with self._enc_lock:
+                self.encoded[key] = data
+        return data
+
+
+class SnapshotStore:
+    def __init__(self, scrape_fn, summarize, ttl=SNAPSHOT_TTL, keep=32):
+        self.scrape_fn = scrape_fn  # scrape_fn(wids, batch_size, deadline=…) -> rows
+        self.summarize = summarize  # summarize(rows) -> {status, pending, timed_out}
+        self.ttl = ttl
+        self.keep = keep
+        self._snaps = {}            # tuple(wids) -> Snapshot
+        self._history = {}          # tuple(wids) -> deque[Snapshot]（舊 → 新）
+        self.listeners = []         # fn(snapshot)，每份新快照存好後呼叫（推播用，見 feed.py）
+        self._inflight = {}         # tuple(wids) -> Lock
+        self._lock = threading.Lock()
+
+    def peek(self, wids):
+        with self._lock:
+            return self._snaps.get(tuple(wids))
+
+    def find(self, wids, version):
+        """依版本號（digest）找這組 WID 最近保留的快照。"""
+        with self._lock:
+            for snap in reversed(self._history.get(tuple(wids), ())):
+                if snap.digest == version:
+                    return snap
+        return None
+
+    def fresh(self, wids, max_age=None):
+        """還在有效期內的完整快照（沒有 Pending / Timeout）；沒有回 None。命中會記進 metrics。"""
+        snap = self.peek(wids)
+        if snap and snap.complete and snap.age() < (self.ttl if max_age is None else max_age):
+            metrics.cache_lookup("snapshot", True)
+            return snap
+        return None
+
+    def get(self, wids, deadline=None, max_age=None):
+        """回傳 (Snapshot, 是否命中快取)；沒有可用的快照就抓一次。"""
+        key = tuple(wids)
+        snap = self.fresh(key, max_age)
+        if snap:
+            return snap, True
+
+        with self._lock:
+            gate = self._inflight.setdefault(key, threading.Lock())
+        with gate:
+            # 等鎖期間別人可能已經抓完了
+            snap = self.fresh(key, max_age)
+            if snap:
+                return snap, True
+            metrics.cache_lookup("snapshot", False)
+            items = self.scrape_fn(list(key), 4, deadline=deadline)
+            snap = self._store(key, items, deadline)
+        return snap, False
+
+    def _store(self, key, items, deadline):
+        snap = Snapshot(key, items, self.summarize(items), deadline)
+        with self._lock:
+            self._snaps[key] = snap
+            hist = self._history.setdefault(key, deque(maxlen=SNAPSHOT_HISTORY))
+            if hist and hist[-1].digest == snap.digest:
+                hist.pop()  # 內容沒變，只留最新的一份
+            hist.append(snap)
+            if len(self._snaps) > self.keep:
+                oldest = min(self._snaps, key=lambda k: self._snaps[k].created)
+                del self._snaps[oldest]
+                self._inflight.pop(oldest, None)
+                self._history.pop(oldest, None)
+        for fn in self.listeners:
+            try:
+                fn(snap)
+            except Exception as e:  # 推播出錯不影響 API 回應
+                print(f"[SNAP] listener failed: {type(e).__name__}: {e}", flush=True)
+        return snap
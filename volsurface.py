@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+各標的的隱波曲面（找出相對同標的其他權證偏貴 / 偏便宜的權證）
+- 每檔權證一個點：x = ln(K/S)（價內外）、√T（年）、iv = 買價隱波 / 賣價隱波的平均（%）
+- 每個標的擬合 iv ≈ b0 + b1·x + b2·x² + b3·√T + b4·x·√T + b5·認售
+  （認售 / 認購的發行商報價常差一截，用一個常數項吸收）
+- 所有標的一起算：依標的排序後用 np.add.reduceat 把每個點的外積加成各標的的 XᵀWX / XᵀWy，
+  再用 np.linalg.solve 一次解完全部 G 個 6×6 系統；沒有逐標的的 Python 迴圈
+- 穩健：第一次擬合後用每組殘差的 MAD 當尺度，Tukey 權重重擬 SURFACE_ITERS 次，
+  少數離群的報價不會把曲面拉過去
+- 標記：|殘差| ≥ SURFACE_Z × 尺度 且 ≥ SURFACE_MIN_GAP 個百分點；殘差 > 0 為偏貴（rich），< 0 為偏便宜（cheap）
+- 摘要的平價隱波為曲面在價平、3 個月（√T = 0.5）、認購的值
+- 點數少於 SURFACE_MIN_POINTS 的標的不擬合（不標記）
+可用環境變數：
+  - SURFACE_Z=3、SURFACE_MIN_GAP=2（百分點）、SURFACE_MIN_POINTS=8、SURFACE_ITERS=2
+"""
+
+import math
+import os
+
+import numpy as np
+
+from core import to_float
+from risk import is_put, underlying_key
+
+SURFACE_Z = float(os.getenv("SURFACE_Z", "3"))
+SURFACE_MIN_GAP = float(os.getenv("SURFACE_MIN_GAP", "2"))
+SURFACE_MIN_POINTS = int(os.getenv("SURFACE_MIN_POINTS", "8"))
+SURFACE_ITERS = int(os.getenv("SURFACE_ITERS", "2"))
+RIDGE = 1e-6   # 某標的全是認購（或同一到期）時矩陣會奇異，加一點點對角線
+
+OUTPUT_FIELDS = [
+    "WID", "標的代碼", "標的名稱", "成交價", "最新履約價", "剩餘天數", "標的現價",
+    "買價隱波", "賣價隱波", "隱波", "曲面隱波", "偏離", "z", "標記",
+]
+
+
+def points(rows):
+    """列 → (有效列, 標的 key, x, √T, 認售, iv)；缺欄位的列不進來。"""
+    keep, keys, x, st, put, iv = [], [], [], [], [], []
+    for r in rows:
+        S = to_float(r.get("標的現價")) or to_float(r.get("標的股價"))
+        K = to_float(r.get("最新履約價"))
+        days = to_float(r.get("剩餘天數"))
+        vals = [v for v in (to_float(r.get("買價隱波")), to_float(r.get("賣價隱波"))) if v is not None and v > 0]
+        if not (S and K and S > 0 and K > 0 and days and days > 0 and vals):
+            continue
+        keep.append(r)
+        keys.append(underlying_key(r))
+        x.append(math.log(K / S))
+        st.append(math.sqrt(days / 365))
+        put.append(is_put(r))
+        iv.append(sum(vals) / len(vals))
+    return keep, keys, np.array(x), np.array(st), np.array(put, dtype=float), np.array(iv)
+
+
+def design(x, st, put):
+    return np.column_stack([np.ones_like(x), x, x * x, st, x * st, put])
+
+
+def _group_median(values, group, ngroups):
+    """每組的中位數（向量化：依 (組, 值) 排序後取中間那個）。"""
+    order = np.lexsort((values, group))
+    counts = np.bincount(group, minlength=ngroups)
+    starts = np.r_[0, np.cumsum(counts)[:-1]]
+    out = np.full(ngroups, np.nan)
+    ok = counts > 0
+    lo = starts[ok] + (counts[ok] - 1) // 2
+    hi = starts[ok] + counts[ok] // 2
+    v = values[order]
+    out[ok] = (v[lo] + v[hi]) / 2
+    return out
+
+
+def _solve(X, y, w, group, ngroups):
+    """加權最小平方，所有組一次解：回傳 (G, p) 係數。"""
+    p = X.shape[1]
+    order = np.argsort(group, kind="stable")
+    starts = np.searchsorted(group[order], np.arange(ngroups))   # 每組都至少一點
+    Xw = X[order] * w[order, None]
+    XtX = np.add.reduceat(Xw[:, :, None] * X[order][:, None, :], starts)
+    Xty = np.add.reduceat(Xw * y[order, None], starts)
+    XtX += RIDGE * np.eye(p)
+    return np.linalg.solve(XtX, Xty[:, :, None])[:, :, 0]
+
+
+def fit(rows, z=SURFACE_Z, min_gap=SURFACE_MIN_GAP, min_points=SURFACE_MIN_POINTS, iters=SURFACE_ITERS):
+    """回傳 (每列的結果 list, 每個標的的摘要 list)；門檻給 None 用環境變數的預設值。"""
+    z = SURFACE_Z if z is None else z
+    min_gap = SURFACE_MIN_GAP if min_gap is None else min_gap
+    keep, keys, x, st, put, iv = points(rows)
+    if not keep:
+        return [], []
+    names, group = np.unique(np.array(keys), return_inverse=True)
+    ngroups = len(names)
+    counts = np.bincount(group, minlength=ngroups)
+    fitted = counts[group] >= min_points
+    X = design(x, st, put)
+    w = fitted.astype(float)
+    for it in range(iters + 1):
+        beta = _solve(X, iv, w, group, ngroups)
+        surf = np.einsum("ij,ij->i", X, beta[group])
+        resid = iv - surf
+        scale = 1.4826 * _group_median(np.abs(resid), group, ngroups)
+        scale = np.maximum(scale, 1e-6)
+        if it < iters:
+            u = resid / (4.685 * scale[group])      # Tukey biweight
+            w = np.where(np.abs(u) < 1, (1 - u * u) ** 2, 0.0) * fitted
+    zs = resid / scale[group]
+    flag = fitted & (np.abs(zs) >= z) & (np.abs(resid) >= min_gap)
+
+    nflag = np.bincount(group, weights=flag, minlength=ngroups)
+    out = []
+    for i, r in enumerate(keep):
+        out.append({
+            **{k: r.get(k, "") for k in OUTPUT_FIELDS[:9]},
+            "標的代碼": keys[i],
+            "隱波": round(float(iv[i]), 3),
+            "曲面隱波": round(float(surf[i]), 3) if fitted[i] else "",
+            "偏離": round(float(resid[i]), 3) if fitted[i] else "",
+            "z": round(float(zs[i]), 2) if fitted[i] else "",
+            "標記": ("rich" if resid[i] > 0 else "cheap") if flag[i] else "",
+        })
+    summary = []
+    for g, name in enumerate(names):
+        ok = counts[g] >= min_points
+        summary.append({
+            "標的": str(name),
+            "點數": int(counts[g]),
+            "擬合": bool(ok),
+            "平價隱波": round(float(beta[g, 0] + beta[g, 3] * 0.5), 3) if ok else None,   # 價平、3 個月、認購
+            "偏斜": round(float(beta[g, 1]), 3) if ok else None,
+            "尺度": round(float(scale[g]), 3) if ok else None,
+            "標記數": int(nflag[g]),
+        })
+    return out, summary
@@ -1,218 +1,218 @@
 # -*- coding: utf-8 -*-
 """
-跨平台 Flask + Selenium (Selenium Manager) 版本
-- 不硬編 chromedriver 路徑，讓 Selenium 自行管理
-- 可用環境變數調整：
-  - HEADLESS=0/1  (default 1)
-  - BROWSER_BIN=/path/to/chrome  (如需指定瀏覽器)
+跨平台 Flask 看板 + API
+- 抓取引擎在 scraper.py（Selenium 只在第一次抓取時才載入，啟動服務不必等它）
+- 抓取相關的環境變數（HEADLESS、BROWSER_BIN、SNAPSHOT_PARSE、NAV_MODE、TABS…）見 scraper.py
+- /metrics 輸出 Prometheus 格式的分段耗時與計數（見 metrics.py）
+- /api/warrants?deadline=秒數 限定整批抓取時間，逾時回傳已完成的列 + 未完成清單；
+  API_DEADLINE=秒數 為預設值（不設 = 不限）
+- /api/warrants 的結果放在快照快取（snapshot.py，SNAPSHOT_TTL 秒內不重抓），另外支援：
+    format=rows（預設）/ table（fields + 列陣列）/ columns（fields + 欄陣列）
+    fields=WID,買價,賣價  只回這些欄位
+    gzip / br 壓縮（br 需要裝 brotli），ETag + If-None-Match 內容沒變回 304
+    since=版本號  只回該版本之後有變的列（changed / added / removed），看板用它局部更新
+- /api/stream?wids=…  SSE 推播：快照一更新就把有變的列推給訂閱那些 WID 的連線（見 feed.py），
+  看板預設用它取代每 60 秒輪詢
+- QUOTE_TABLE=路徑（例如 /dev/shm/warrant_quotes.bin）時本行程不抓取：快照（/api/warrants、
+  /api/stream、看板、下載）改從跨行程共用的報價表（quotetable.py）組出來，多個 gunicorn worker
+  共用一份、都不開 Chrome；抓取交給單一的 `python cli.py publish` 行程寫入同一個檔。
+  /api/quotes?wids=&fields= 直接回欄式資料
+- HISTORY_DB=路徑 時每份快照以差異編碼存進歷史庫（history.py），並增量更新 1m / 5m / 1d K 棒；
+    GET /api/warrants/<wid>/history?from=&to=&bar=5m   成交/買/賣 OHLC，隱波 / Delta / 價差比的最後值與平均
+- RISK_POSITIONS=部位檔（CSV：WID,張數 或 JSON）時開 /api/risk?deadline=：依標的彙總的金額
+  Delta / Gamma / Vega / Theta（risk.py）；每份快照進來只重算有變動的部位
+- ALERT_RULES=規則檔（JSON，見 alerts.py）時每份快照跑一次警示規則（只看有變的列與相關規則），
+    GET /api/alerts?since=上次看到的 id   最近觸發的警示
+- 看板：資料以欄式存在瀏覽器，表格虛擬捲動（DOM 只有看得到的列），點欄名排序、篩選框即時篩選
+- 大批抓取用背景工作（見 jobs.py）：
+    POST /api/jobs  {"wids": [...]} 或 {"universe": "default", "prefix": "03", "kind": "call"}，可加 "deadline"；
+                    排隊中的 job 達 JOB_MAX_QUEUED 個時回 429
+    GET  /api/jobs/<id>            進度、吞吐量、目前為止的結果（?items=0 只看進度）
+    GET  /api/jobs/<id>/result     完成後的結果，?format=json（預設）/ xlsx / csv / parquet
+- 下載檔案：GET /api/warrants.xlsx（或 .csv / .parquet）?wids=&fields=&deadline=&calc=0
+  從快照快取產生，sink 在背景執行緒邊寫邊送（chunked transfer，見 sinks.stream_rows），
+  列數再多記憶體也只佔幾塊 STREAM_CHUNK；xlsx 預設每檔附一張試算表，calc=0 不附；一樣有 ETag / 304
 """
 
+import gzip
+import json
 import os
 import re
-import time
 from datetime import datetime
 
-from flask import Flask, jsonify, make_response, render_template_string, request
-
-from selenium import webdriver
-from selenium.common.exceptions import NoSuchElementException, TimeoutException
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.support.ui import WebDriverWait
-
-# ====== 設定 ======
-HEADLESS = os.getenv("HEADLESS", "1") != "0"  # 預設啟用 headless
-BROWSER_BIN = os.getenv("BROWSER_BIN", "").strip()  # 需要時才指定
-PAGELOAD_TIMEOUT = 35
-SCRIPT_TIMEOUT = 35
-
-# 為了避免第一次進頁面就超久，預設清單縮小；要抓一整包可在前端輸入或用 query 參數
-DEFAULT_WIDS = [
-    "03111U", "03162U", "03485U", "03616U", "03662U",
-    "03281U", "03864U", "05831P", "063866", "065413", "071599",
-    "07879P", "079683", "085398", "08700P", "08769P", "08992P",
-    "71280U", "71286U", "71289U", "71344U", "71974U"
-]
-
-BASIC_LABELS = [
-    "上市日期", "最後交易日", "到期日期", "發行型態", "最新發行張數",
-    "流通在外張數/比例", "最新履約價", "最新行使比例",
-    "買價隱波", "賣價隱波", "Delta", "Theta",
-    "剩餘天數", "價內外程度", "實質槓桿", "買賣價差比",
-]
-
-# ====== Selenium 工具 ======
-def make_driver():
-    """建立 Chrome driver（用 Selenium Manager 自動處理 chromedriver）。
-    不手動傳 Service(...)，跨機器最穩。
-    """
-    print("[DRV] Creating Chrome driver...", flush=True)
-    opts = webdriver.ChromeOptions()
-    if HEADLESS:
-        # "--headless=new" 有些版本比較挑，"--headless" 通用性更好
-        opts.add_argument("--headless")
-    # 一些穩定性/雜訊參數
-    opts.add_argument("--disable-blink-features=AutomationControlled")
-    opts.add_argument("--no-sandbox")
-    opts.add_argument("--disable-gpu")
-    opts.add_argument("--window-size=1280,1600")
-    # 如真的需要手動指定瀏覽器可用 BROWSER_BIN
-    if BROWSER_BIN:
-        opts.binary_location = BROWSER_BIN
-
-    # 關鍵：不傳 Service(...)，讓 Selenium 自己抓對應版 driver
-    drv = webdriver.Chrome(options=opts)
-    drv.set_page_load_timeout(PAGELOAD_TIMEOUT)
-    drv.set_script_timeout(SCRIPT_TIMEOUT)
-    print("[DRV] Chrome launched.", flush=True)
-    return drv
-
-
-def text_or_blank(drv, by, sel):
-    try:
-        return drv.find_element(by, sel).text.strip()
-    except NoSuchElementException:
-        return ""
-
-
-def find_basic_value_by_label(drv, label_text):
-    XPS = [
-        f"//*[normalize-space(text())='{label_text}']/following-sibling::*[1]",
-        f"//div[.//*[normalize-space(text())='{label_text}']]/*[normalize-space(text())='{label_text}']/following-sibling::*[1]",
-        f"//li[.//*[normalize-space(text())='{label_text}']]//*[normalize-space(text())='{label_text}']/following::*[1]",
-    ]
-    for xp in XPS:
-        try:
-            el = drv.find_element(By.XPATH, xp)
-            t = el.text.strip()
-            if t:
-                return t
-        except NoSuchElementException:
-            continue
-    return ""
-
-
-def get_target_info(drv):
-    # 先找 ng-bind
-    name = ""
-    price = ""
-    for xp in ["//*[contains(@ng-bind,'TAR_NAME')]", "//*[contains(@ng-bind,'FLD_TAR_NAME')]"]:
-        els = drv.find_elements(By.XPATH, xp)
-        if els and els[0].text.strip():
-            name = els[0].text.strip()
-            break
-    for xp in ["//*[contains(@ng-bind,'TAR_PRICE')]", "//*[contains(@ng-bind,'FLD_TAR_PRICE')]"]:
-        els = drv.find_elements(By.XPATH, xp)
-        if els and els[0].text.strip():
-            price = els[0].text.strip().replace(",", "")
-            break
-    if name or price:
-        return name, price
-
-    # 再找含「標的」的抬頭字串並解析（備援）
-    try:
-        header = drv.find_element(By.XPATH, "//*[contains(normalize-space(.), '標的')]")
-        block = header.text.strip()
-        if block:
-            after = re.split(r"標的[:：]", block, maxsplit=1)
-            tail = after[1].strip() if len(after) > 1 else block
-            m_name = re.match(r"([^\s(／/｜|]+)", tail)
-            m_px = re.search(r"(\d{1,3}(?:,\d{3})*(?:\.\d+)?|\d+\.\d+)", tail)
-            return (m_name.group(1) if m_name else ""), (
-                m_px.group(1).replace(",", "") if m_px else ""
-            )
-    except NoSuchElementException:
-        pass
-    return "", ""
-
-
-def is_warrant_code(code: str) -> bool:
-    return code.endswith(("U", "P")) or code.isdigit()
-
-
-def scrape_one(drv, wid):
-    url = f"https://www.warrantwin.com.tw/eyuanta/Warrant/Info.aspx?WID={wid}"
-    print(f"[SCRAPE] GET {url}", flush=True)
-    drv.get(url)
-
-    status = "OK"
-    # 等待買價區塊出現且有字
-    try:
-        WebDriverWait(drv, 15).until(
-            EC.presence_of_element_located((By.XPATH, "//*[contains(@ng-bind, 'WAR_BUY_PRICE')]"))
-        )
-        WebDriverWait(drv, 25).until(
-            lambda d: d.find_element(By.XPATH, "//*[contains(@ng-bind, 'WAR_BUY_PRICE')]")
-            .text.strip()
-            != ""
-        )
-    except TimeoutException:
-        status = "No price section / slow"
-
-    deal = text_or_blank(drv, By.XPATH, "//*[contains(@ng-bind,'WAR_DEAL_PRICE')]")
-    buy = text_or_blank(drv, By.XPATH, "//*[contains(@ng-bind,'WAR_BUY_PRICE')]")
-    sell = text_or_blank(drv, By.XPATH, "//*[contains(@ng-bind,'WAR_SELL_PRICE')]")
-
-    # 備援 class（常見順序：成交/買/賣）
-    if not (deal and buy and sell):
-        try:
-            WebDriverWait(drv, 6).until(
-                EC.presence_of_all_elements_located((By.CLASS_NAME, "tBig"))
-            )
-            prices = [e.text.strip() for e in drv.find_elements(By.CLASS_NAME, "tBig")]
-            if len(prices) >= 3:
-                deal = deal or prices[0]
-                buy = buy or prices[1]
-                sell = sell or prices[2]
-        except TimeoutException:
-            pass
-
-    tgt_name, tgt_px = get_target_info(drv)
-    basic = {lab: find_basic_value_by_label(drv, lab) for lab in BASIC_LABELS}
-
-    if not (deal or buy or sell):
-        status = "No prices"
+from flask import Flask, Response, jsonify, make_response, render_template_string, request
+
+import metrics
+import profiling
+from core import BASIC_LABELS, DEFAULT_WIDS
+from feed import Feed
+from jobs import JobManager, JobQueueFull, filter_wids, load_universe
+from snapshot import SnapshotStore, diff_rows
+
+API_DEADLINE = float(os.getenv("API_DEADLINE", "0")) or None
+
+
+def scrape_batch(wids, batch_size=5, deadline=None):
+    import scraper
 
+    return scraper.scrape_batch(wids, batch_size, deadline=deadline)
+
+
+def deadline_summary(items):
+    """整理期限內沒抓完的 WID，給前端顯示。"""
+    from scraper import STATUS_DEADLINE, STATUS_PENDING
+
+    pending = [r["WID"] for r in items if r.get("狀態") == STATUS_PENDING]
+    timed_out = [r["WID"] for r in items if r.get("狀態") == STATUS_DEADLINE]
     return {
-        "WID": wid,
-        "狀態": status,
-        "成交價": deal,
-        "買價": buy,
-        "賣價": sell,
-        "標的名稱": tgt_name,
-        "標的現價": tgt_px,
-        **basic,
-        "抓取時間": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        "來源網址": url,
+        "status": "partial" if (pending or timed_out) else "complete",
+        "pending": pending,
+        "timed_out": timed_out,
     }
 
 
-def scrape_batch(wids, batch_size=5):
-    results = []
-    for i in range(0, len(wids), batch_size):
-        drv = None
-        try:
-            drv = make_driver()
-            for wid in wids[i : i + batch_size]:
-                if not is_warrant_code(wid):
-                    results.append({"WID": wid, "狀態": "非權證（略過）"})
-                    continue
-                try:
-                    row = scrape_one(drv, wid)
-                except Exception as e:
-                    row = {"WID": wid, "狀態": f"Error: {type(e).__name__}: {e}"}
-                results.append(row)
-        finally:
-            if drv:
-                try:
-                    drv.quit()
-                except Exception:
-                    pass
-    return results
+# ====== 快照 / 回應編碼 ======
+# /api/warrants 回的欄位（跟 scraper 產出的列一致）
+API_FIELDS = ["WID", "狀態", "成交價", "買價", "賣價", "標的名稱", "標的代碼", "標的現價",
+              *BASIC_LABELS, "抓取時間", "來源網址"]
+# rows：一列一個 dict（原本的格式）；table：fields + 二維陣列；columns：fields + 每欄一個陣列
+RESPONSE_FORMATS = ("rows", "table", "columns")
+EXPORT_MIMETYPES = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+COMPRESS_MIN_BYTES = 1024
+
+snapshots = SnapshotStore(scrape_batch, deadline_summary)
+feed = Feed(snapshots, DEFAULT_WIDS)
+
+QUOTE_TABLE = os.getenv("QUOTE_TABLE", "").strip()
+quotes = None
+if QUOTE_TABLE:
+    from quotetable import QuoteTable
+
+    quotes = QuoteTable(QUOTE_TABLE)
+    snapshots.scrape_fn = quotes.scrape   # 只讀共享表；寫入者是 cli.py publish
+
+HISTORY_DB = os.getenv("HISTORY_DB", "").strip()
+hist = None
+if HISTORY_DB:
+    from history import History
+
+    hist = History(HISTORY_DB)
+    if quotes is None:   # 共用報價表時由 publish 行程記錄（cli.py publish --history），worker 只讀
+        snapshots.listeners.append(hist.publish_snapshot)
+
+RISK_POSITIONS = os.getenv("RISK_POSITIONS", "").strip()
+risk_book = None
+if RISK_POSITIONS:
+    from risk import RiskBook, load_positions
+
+    risk_book = RiskBook(load_positions(RISK_POSITIONS))
+    snapshots.listeners.append(risk_book.publish_snapshot)
+
+ALERT_RULES = os.getenv("ALERT_RULES", "").strip()
+alert_engine = None
+if ALERT_RULES:
+    from alerts import AlertEngine, load_rules
+
+    alert_engine = AlertEngine(load_rules(ALERT_RULES))
+    alert_engine.listeners.append(lambda a: print(f"[ALERT] {a['wid']} {a['rule']}：{a['when']}", flush=True))
+    snapshots.listeners.append(alert_engine.publish_snapshot)
+
+
+def parse_deadline():
+    """?deadline=秒數；沒給用 API_DEADLINE。0 或負數不是「不限」，直接當參數錯誤（400）。"""
+    deadline = request.args.get("deadline", type=float)
+    if deadline is None:
+        return API_DEADLINE
+    if deadline <= 0:
+        raise ValueError("deadline 必須大於 0 秒")
+    return deadline
+
+
+def parse_fields(text):
+    fields = [f.strip() for f in text.split(",") if f.strip()]
+    unknown = [f for f in fields if f not in API_FIELDS]
+    if unknown:
+        raise ValueError(f"未知的欄位：{', '.join(unknown)}")
+    return fields
+
+
+def accepted_encoding(header):
+    """依 Accept-Encoding 挑 br（有裝 brotli 時）或 gzip。"""
+    accepted = {p.split(";")[0].strip().lower() for p in header.split(",")}
+    if "br" in accepted and _brotli() is not None:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+_ETAG_RE = re.compile(r'\*|(?:W/)?"[^"]*"')
+
+
+def etag_matches(header, etag):
+    """If-None-Match 是否命中：逗號分隔的 ETag 清單或 *，用弱比較（忽略 W/ 前綴）逐一比對。"""
+    if not header:
+        return False
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for tag in _ETAG_RE.findall(header):
+        if tag == "*" or (tag[2:] if tag.startswith("W/") else tag) == opaque:
+            return True
+    return False
+
+
+def _brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def encode_snapshot(snap, fmt, fields, encoding=None, base=None):
+    """快照 → JSON bytes（依格式與欄位），夠大的話再壓縮。
+    有 base（前端手上的舊快照）時只回差異：changed / added / removed，不管 format。"""
+    cols = fields or API_FIELDS
+    items = snap.items
+    if base is not None:
+        diff = diff_rows(base.items, items)
+        if fields:
+            keep = {"WID", *fields}
+            diff["changed"] = [d for d in ({k: v for k, v in c.items() if k in keep} for c in diff["changed"])
+                               if len(d) > 1]
+            diff["added"] = [{k: r.get(k, "") for k in cols} for r in diff["added"]]
+        data = {"delta": True, "base": base.digest, **diff}
+    elif fmt == "table":
+        data = {"fields": cols, "rows": [[r.get(k, "") for k in cols] for r in items]}
+    elif fmt == "columns":
+        data = {"fields": cols, "columns": {k: [r.get(k, "") for r in items] for k in cols}}
+    else:
+        data = {"items": [{k: r.get(k, "") for k in cols} for r in items] if fields else items}
+    payload = {
+        "generated_at": snap.generated_at,
+        "version": snap.digest,
+        "count": len(items),
+        "deadline_sec": snap.deadline,
+        **snap.summary,
+        "format": fmt,
+        **data,
+    }
+    with metrics.stage("json_serialize"):
+        body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    if encoding and len(body) >= COMPRESS_MIN_BYTES:
+        with metrics.stage("compress"):
+            if encoding == "br":
+                return _brotli().compress(body, quality=5)
+            return gzip.compress(body, compresslevel=6)
+    return body
 
 
 # ====== Flask App ======
 app = Flask(__name__)
+job_manager = JobManager(scrape_batch)
 
 INDEX_HTML = """
 <!doctype html>
@@ -226,10 +226,15 @@ INDEX_HTML = """
     h1{font-size:20px;margin:0 0 12px}
     .controls{display:flex; gap:8px; align-items:center; margin-bottom:12px;}
     input,button{font-size:14px;padding:6px 10px}
-    table{border-collapse:collapse; width:100%; font-size:14px}
-    th,td{border:1px solid #ddd; padding:8px; text-align:left}
-    th{background:#f5f5f5; position:sticky; top:0}
-    tr:nth-child(even){background:#fafafa}
+    #wrap{height:calc(100vh - 130px); overflow:auto; border:1px solid #ddd}
+    table{border-collapse:collapse; width:100%; font-size:14px; table-layout:fixed}
+    th,td{border:1px solid #ddd; padding:0 8px; height:31px; text-align:left;
+          white-space:nowrap; overflow:hidden; text-overflow:ellipsis; width:90px}
+    th{background:#f5f5f5; position:sticky; top:0; cursor:pointer; user-select:none; z-index:1}
+    th.asc::after{content:" ▲"} th.desc::after{content:" ▼"}
+    tr.odd{background:#fafafa}
+    tr.pad td{border:0; padding:0; height:0}
+    td.hl{background:#fff3a0}
     .muted{color:#888}
   </style>
 </head>
@@ -237,62 +242,297 @@ INDEX_HTML = """
   <h1>元大權證即時看板</h1>
   <div class="controls">
     <input id="wids" style="flex:1" placeholder="輸入代號（逗號分隔），留空用預設清單">
-    <button onclick="loadData()">更新</button>
+    <button onclick="refresh()">更新</button>
+    <input id="filter" style="flex:1" placeholder="篩選：文字，或 實質槓桿>5 剩餘天數<90 狀態=OK（空白分隔）">
     <span class="muted" id="ts"></span>
   </div>
-  <table id="tbl">
-    <thead>
-      <tr>
-        <th>WID</th><th>狀態</th><th>成交價</th><th>買價</th><th>賣價</th>
-        <th>標的名稱</th><th>標的現價</th>
-        <th>上市日期</th><th>最後交易日</th><th>到期日期</th><th>發行型態</th>
-        <th>最新發行張數</th><th>流通在外張數/比例</th><th>最新履約價</th><th>最新行使比例</th>
-        <th>買價隱波</th><th>賣價隱波</th><th>Delta</th><th>Theta</th>
-        <th>剩餘天數</th><th>價內外程度</th><th>實質槓桿</th><th>買賣價差比</th>
-        <th>抓取時間</th>
-      </tr>
-    </thead>
-    <tbody></tbody>
-  </table>
+  <div id="wrap">
+    <table id="tbl">
+      <thead><tr></tr></thead>
+      <tbody><tr class="pad" id="padTop"><td colspan="24"></td></tr><tr class="pad" id="padBot"><td colspan="24"></td></tr></tbody>
+    </table>
+  </div>
 <script>
+const COLS = [
+  'WID','狀態','成交價','買價','賣價','標的名稱','標的現價',
+  '上市日期','最後交易日','到期日期','發行型態','最新發行張數',
+  '流通在外張數/比例','最新履約價','最新行使比例',
+  '買價隱波','賣價隱波','Delta','Theta','剩餘天數','價內外程度','實質槓桿','買賣價差比',
+  '抓取時間'
+];
+const ROW_H = 32, OVERSCAN = 10, FLASH_MS = 2000;
+
+// ====== 欄式資料：每欄一個陣列，第 i 列 = 各欄的第 i 個值 ======
+let cols = {};                 // 欄位 -> 值陣列（字串）
+let num = {};                  // 欄位 -> Float64Array（排序 / 數值篩選用，資料有變就作廢）
+let index = new Map();         // WID -> 列號
+let nRows = 0;
+let view = new Int32Array(0);  // 篩選 + 排序後要顯示的列號
+let sortKey = null, sortDir = 1;
+let filters = [];
+const flashAt = new Map();     // 'WID\\t欄位' -> 變動時間
+let version = null, queryKey = null, changedCells = 0;
+
+function resetStore(){
+  cols = {}; num = {}; index = new Map(); nRows = 0;
+  for (const k of COLS) cols[k] = [];
+}
+resetStore();
+
+function toNum(s){
+  const v = parseFloat(String(s ?? '').replace(/[,%\\s]/g, ''));
+  return Number.isFinite(v) ? v : NaN;
+}
+function numCol(k){
+  if (!num[k]){
+    const a = new Float64Array(nRows), src = cols[k];
+    for (let i = 0; i < nRows; i++) a[i] = toNum(src[i]);
+    num[k] = a;
+  }
+  return num[k];
+}
+
+function setValue(i, k, v, mark){
+  const text = String(v ?? '');
+  if (cols[k][i] === text) return;
+  cols[k][i] = text;
+  delete num[k];
+  if (mark && k !== '抓取時間'){ flashAt.set(cols.WID[i] + '\\t' + k, Date.now()); changedCells++; }
+}
+
+function upsert(r, mark){
+  const i = index.get(r.WID);
+  if (i === undefined) addRow(r, mark);
+  else for (const k of COLS) setValue(i, k, r[k], mark);
+}
+
+function addRow(r, mark){
+  const i = nRows++;
+  index.set(r.WID, i);
+  for (const k of COLS) cols[k].push(String(r[k] ?? ''));
+  num = {};
+  if (mark) for (const k of COLS) flashAt.set(r.WID + '\\t' + k, Date.now());
+}
+
+function removeRows(wids){
+  const drop = new Set(wids.filter(w => index.has(w)));
+  if (!drop.size) return;
+  const keep = [];
+  for (let i = 0; i < nRows; i++) if (!drop.has(cols.WID[i])) keep.push(i);
+  for (const k of COLS){ const a = cols[k]; cols[k] = keep.map(i => a[i]); }
+  nRows = keep.length;
+  index = new Map(cols.WID.map((w, i) => [w, i]));
+  num = {};
+}
+
+// 完整資料（format=columns）：換掉整份資料，跟舊值比對標出變動
+function applyColumns(fields, columns){
+  const old = {cols, index}, hadData = nRows > 0;
+  resetStore();
+  const n = columns[fields[0]].length;
+  for (const k of COLS){
+    const src = columns[k] || [];
+    cols[k] = Array.from({length: n}, (_, i) => String(src[i] ?? ''));
+  }
+  nRows = n;
+  index = new Map(cols.WID.map((w, i) => [w, i]));
+  if (!hadData) return;
+  const now = Date.now();
+  for (let i = 0; i < n; i++){
+    const j = old.index.get(cols.WID[i]);
+    for (const k of COLS){
+      if (k === '抓取時間') continue;
+      if (j === undefined || old.cols[k][j] !== cols[k][i]){ flashAt.set(cols.WID[i] + '\\t' + k, now); changedCells++; }
+    }
+  }
+}
+
+// 差異：changed 只帶有變的欄位
+function applyDelta(d){
+  if (d.removed && d.removed.length) removeRows(d.removed);
+  for (const c of d.changed){
+    const i = index.get(c.WID);
+    if (i === undefined) continue;
+    for (const k in c) if (k in cols) setValue(i, k, c[k], true);
+  }
+  for (const r of d.added) upsert(r, true);
+}
+
+// 看板目前這組 WID（輸入框留空 = 預設清單，回 null）
+function viewWids(){
+  const w = document.getElementById('wids').value.split(',').map(x => x.trim()).filter(Boolean);
+  return w.length ? w : null;
+}
+
+// 推播的完整資料（一列一個 dict）：列的 WID 集合跟看板這組完全一樣才整份取代，
+// 否則（別組的快照、還沒抓齊）只依 WID 合併，不刪看板上的其他列
+function applyRows(items, wids){
+  const hadData = nRows > 0;
+  const seen = new Set(items.map(r => r.WID));
+  const view = new Set(viewWids() || wids || []);
+  if (view.size === seen.size && [...view].every(w => seen.has(w)))
+    removeRows(cols.WID.filter(w => !seen.has(w)));
+  for (const r of items) upsert(r, hadData);
+}
+
+// ====== 篩選 / 排序（都在瀏覽器裡做，不用重抓）======
+function parseFilter(text){
+  const out = [];
+  for (const tok of text.trim().split(/\\s+/).filter(Boolean)){
+    const m = tok.match(/^(.+?)(>=|<=|!=|>|<|=)(.*)$/);
+    if (m && COLS.includes(m[1])) out.push({k: m[1], op: m[2], v: m[3], n: toNum(m[3])});
+    else out.push({text: tok.toLowerCase()});
+  }
+  return out;
+}
+function matches(i, f){
+  if (f.text !== undefined){
+    for (const k of COLS) if (cols[k][i].toLowerCase().includes(f.text)) return true;
+    return false;
+  }
+  if (f.op === '=' ) return cols[f.k][i] === f.v || numCol(f.k)[i] === f.n;
+  if (f.op === '!=') return !(cols[f.k][i] === f.v || numCol(f.k)[i] === f.n);
+  const x = numCol(f.k)[i];
+  if (Number.isNaN(x) || Number.isNaN(f.n)) return false;
+  return f.op === '>' ? x > f.n : f.op === '<' ? x < f.n : f.op === '>=' ? x >= f.n : x <= f.n;
+}
+function rebuildView(){
+  let idx = [];
+  for (let i = 0; i < nRows; i++) if (filters.every(f => matches(i, f))) idx.push(i);
+  if (sortKey){
+    const a = numCol(sortKey), s = cols[sortKey];
+    const numeric = idx.some(i => !Number.isNaN(a[i]));
+    idx.sort(numeric
+      ? (x, y) => (Number.isNaN(a[x]) - Number.isNaN(a[y])) || sortDir * (a[x] - a[y])
+      : (x, y) => sortDir * s[x].localeCompare(s[y], 'zh-Hant'));
+  }
+  view = Int32Array.from(idx);
+  render();
+}
+
+// ====== 虛擬捲動：DOM 裡只有看得到的列（加上下緩衝）======
+const wrap = document.getElementById('wrap');
+const tbody = document.querySelector('#tbl tbody');
+const padTop = document.getElementById('padTop'), padBot = document.getElementById('padBot');
+const pool = [];
+let pending = false;
+
+function scheduleRender(){
+  if (pending) return;
+  pending = true;
+  requestAnimationFrame(() => { pending = false; render(); });
+}
+function render(){
+  const first = Math.max(0, Math.floor(wrap.scrollTop / ROW_H) - OVERSCAN);
+  const last = Math.min(view.length, first + Math.ceil(wrap.clientHeight / ROW_H) + 2 * OVERSCAN);
+  padTop.firstChild.style.height = (first * ROW_H) + 'px';
+  padBot.firstChild.style.height = ((view.length - last) * ROW_H) + 'px';
+  while (pool.length < last - first){
+    const tr = document.createElement('tr');
+    for (const k of COLS) tr.appendChild(document.createElement('td'));
+    tbody.insertBefore(tr, padBot);
+    pool.push(tr);
+  }
+  const now = Date.now();
+  let nextFlash = Infinity;
+  pool.forEach((tr, j) => {
+    const i = view[first + j];
+    if (first + j >= last){ tr.style.display = 'none'; return; }
+    tr.style.display = '';
+    tr.className = (first + j) % 2 ? 'odd' : '';
+    const wid = cols.WID[i];
+    COLS.forEach((k, c) => {
+      const td = tr.children[c], text = cols[k][i];
+      if (td.textContent !== text){ td.textContent = text; td.title = text; }
+      const t = flashAt.get(wid + '\\t' + k);
+      const on = t !== undefined && now - t < FLASH_MS;
+      if (on) nextFlash = Math.min(nextFlash, t + FLASH_MS);
+      td.classList.toggle('hl', on);
+    });
+  });
+  if (nextFlash < Infinity) setTimeout(scheduleRender, nextFlash - now + 20);
+  for (const [key, t] of flashAt) if (now - t >= FLASH_MS) flashAt.delete(key);
+}
+wrap.addEventListener('scroll', scheduleRender, {passive: true});
+window.addEventListener('resize', scheduleRender);
+
+const headRow = document.querySelector('#tbl thead tr');
+for (const k of COLS){
+  const th = document.createElement('th');
+  th.textContent = k;
+  th.title = '點一下排序';
+  th.onclick = () => {
+    sortDir = (sortKey === k) ? -sortDir : 1;
+    sortKey = k;
+    for (const h of headRow.children) h.className = '';
+    th.className = sortDir > 0 ? 'asc' : 'desc';
+    rebuildView();
+  };
+  headRow.appendChild(th);
+}
+let filterTimer = null;
+document.getElementById('filter').addEventListener('input', ev => {
+  clearTimeout(filterTimer);
+  filterTimer = setTimeout(() => { filters = parseFilter(ev.target.value); rebuildView(); }, 120);
+});
+
+// ====== 取資料 ======
+function showStatus(data, live){
+  let note = changedCells ? '（' + changedCells + ' 格有變動）' : '';
+  if (data.status === 'partial'){
+    note += '（期限內未完成 ' + (data.pending.length + data.timed_out.length) + ' 檔）';
+  }
+  document.getElementById('ts').textContent = '更新時間：' + (data.generated_at || new Date().toLocaleString()) +
+    note + (live ? '（即時）' : '') + '　顯示 ' + view.length + ' / ' + nRows + ' 檔';
+}
+
 async function loadData(){
   const w = document.getElementById('wids').value.trim();
-  const url = w ? '/api/warrants?wids=' + encodeURIComponent(w) : '/api/warrants';
-  const res = await fetch(url, {cache: 'no-store'});
+  if (w !== queryKey){ queryKey = w; version = null; resetStore(); }   // 換了清單就整份重拿
+  const params = new URLSearchParams();
+  if (w) params.set('wids', w);
+  if (version) params.set('since', version); else params.set('format', 'columns');
+  const res = await fetch('/api/warrants?' + params.toString(), {cache: 'no-cache'});
   const data = await res.json();
-  const tb = document.querySelector('#tbl tbody');
-  tb.innerHTML = '';
+  const ts = document.getElementById('ts');
   if (data.error){
-    const tr = document.createElement('tr');
-    const td = document.createElement('td');
-    td.colSpan = 24;
-    td.textContent = "後端錯誤：" + data.error + " - " + (data.message || "");
-    td.style.color = "crimson";
-    tr.appendChild(td);
-    tb.appendChild(tr);
-  } else {
-    for (const r of data.items){
-      const tr = document.createElement('tr');
-      const cols = [
-        'WID','狀態','成交價','買價','賣價','標的名稱','標的現價',
-        '上市日期','最後交易日','到期日期','發行型態','最新發行張數',
-        '流通在外張數/比例','最新履約價','最新行使比例',
-        '買價隱波','賣價隱波','Delta','Theta','剩餘天數','價內外程度','實質槓桿','買賣價差比',
-        '抓取時間'
-      ];
-      for (const k of cols){
-        const td = document.createElement('td');
-        td.textContent = (r[k] ?? '');
-        tr.appendChild(td);
-      }
-      tb.appendChild(tr);
-    }
+    ts.textContent = "後端錯誤：" + data.error + " - " + (data.message || "");
+    ts.style.color = "crimson";
+    return;
   }
-  document.getElementById('ts').textContent = '更新時間：' + (data.generated_at || new Date().toLocaleString());
+  ts.style.color = "";
+  changedCells = 0;
+  if (data.delta) applyDelta(data); else applyColumns(data.fields, data.columns);
+  version = data.version;
+  rebuildView();
+  showStatus(data, false);
+}
+
+// 推播：快照一更新就收到有變的列；瀏覽器不支援 SSE 才退回每 60 秒輪詢
+let stream = null;
+function startStream(){
+  if (stream) stream.close();
+  const w = document.getElementById('wids').value.trim();
+  stream = new EventSource('/api/stream' + (w ? '?wids=' + encodeURIComponent(w) : ''));
+  stream.addEventListener('snapshot', ev => {
+    const d = JSON.parse(ev.data);
+    if (d.items.length){ changedCells = 0; applyRows(d.items, d.wids); version = d.version; rebuildView(); }
+  });
+  stream.addEventListener('update', ev => {
+    const d = JSON.parse(ev.data);
+    changedCells = 0;
+    applyDelta({changed: d.changed, added: d.added, removed: []});
+    version = d.version;
+    rebuildView();
+    showStatus(d, true);
+  });
 }
-// 自動每 60 秒更新一次
-loadData();
-setInterval(loadData, 60000);
+function refresh(){
+  loadData();
+  if (window.EventSource) startStream();
+}
+refresh();
+if (!window.EventSource) setInterval(loadData, 60000);
 </script>
 </body>
 </html>
@@ -311,22 +551,251 @@ def api_warrants():
             wids = [x.strip() for x in q.split(",") if x.strip()]
         else:
             wids = DEFAULT_WIDS
+        deadline = parse_deadline()
+        fmt = request.args.get("format", "rows")
+        if fmt not in RESPONSE_FORMATS:
+            return make_response(jsonify({"error": "BadFormat", "message": f"format 可用 {', '.join(RESPONSE_FORMATS)}"}), 400)
+        fields = parse_fields(request.args.get("fields", ""))
+
+        snap = snapshots.fresh(wids)
+        if snap is None:
+            print(f"[API] Start scrape: {wids} (deadline={deadline or '-'})", flush=True)
+            with profiling.run("api"), metrics.stage("api_scrape"):
+                snap, _ = snapshots.get(wids, deadline=deadline)
+
+        # since=前端手上的版本：還留著那份快照就只回差異，找不到就回完整資料
+        since = request.args.get("since", "")
+        base = snapshots.find(wids, since) if since else None
+        etag = f'W/"{snap.digest}-{fmt}-{"-".join(fields) if fields else "all"}-{base.digest if base else "full"}"'
+        if etag_matches(request.headers.get("If-None-Match", ""), etag):
+            resp = make_response("", 304)
+        else:
+            enc = accepted_encoding(request.headers.get("Accept-Encoding", ""))
+            body = snap.encode((fmt, tuple(fields or ()), enc, base.digest if base else None),
+                               lambda: encode_snapshot(snap, fmt, fields, enc, base))
+            resp = make_response(body)
+            resp.headers["Content-Type"] = "application/json; charset=utf-8"
+            if enc:
+                resp.headers["Content-Encoding"] = enc
+        resp.headers["ETag"] = etag
+        resp.headers["Vary"] = "Accept-Encoding"
+        # 可以存，但每次都要帶 If-None-Match 回來問
+        resp.headers["Cache-Control"] = "no-cache"
+        return resp
 
-        print(f"[API] Start scrape: {wids}", flush=True)
-        items = scrape_batch(wids, batch_size=4)
-        payload = {
-            "generated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "count": len(items),
-            "items": items,
-        }
-        resp = make_response(jsonify(payload))
-        resp.headers["Cache-Control"] = "no-store"
+    except ValueError as e:
+        return make_response(jsonify({"error": type(e).__name__, "message": str(e)}), 400)
+    except Exception as e:
+        err = {"error": type(e).__name__, "message": str(e)}
+        print(f"[API] ERROR: {err}", flush=True)
+        metrics.inc("warrant_api_errors_total", kind=type(e).__name__)
+        return make_response(jsonify(err), 500)
+
+
+def export_response(items, fmt, fields, name, calc=True):
+    """列 → 串流下載的 Response（不設 Content-Length，WSGI 伺服器會用 chunked 送出）。"""
+    from sinks import stream_rows
+
+    # 網站的列只有標的現價，試算表讀的是標的股價
+    rows = ({**r, "標的股價": r.get("標的股價") or r.get("標的現價", "")} for r in items)
+    opts = {"calc_sheets": calc} if fmt == "xlsx" else {}
+    resp = Response(stream_rows(fmt, rows, fields or API_FIELDS, **opts), mimetype=EXPORT_MIMETYPES[fmt])
+    resp.headers["Content-Disposition"] = f'attachment; filename="{name}.{fmt}"'
+    return resp
+
+
+@app.route("/api/warrants.<fmt>")
+def api_warrants_export(fmt):
+    try:
+        if fmt not in EXPORT_MIMETYPES:
+            return make_response(jsonify({"error": "BadFormat", "message": f"可下載 {', '.join(EXPORT_MIMETYPES)}"}), 404)
+        q = request.args.get("wids", "")
+        wids = [x.strip() for x in q.split(",") if x.strip()] or DEFAULT_WIDS
+        deadline = parse_deadline()
+        fields = parse_fields(request.args.get("fields", ""))
+        calc = request.args.get("calc", "1") not in ("0", "false", "no")
+
+        snap = snapshots.fresh(wids)
+        if snap is None:
+            print(f"[API] Start scrape: {wids} (deadline={deadline or '-'})", flush=True)
+            with profiling.run("export"), metrics.stage("api_scrape"):
+                snap, _ = snapshots.get(wids, deadline=deadline)
+
+        etag = f'W/"{snap.digest}-{fmt}-{"-".join(fields) if fields else "all"}-{"calc" if calc else "plain"}"'
+        if etag_matches(request.headers.get("If-None-Match", ""), etag):
+            resp = make_response("", 304)
+        else:
+            resp = export_response(snap.items, fmt, fields, f"warrants_{snap.digest[:8]}", calc)
+        resp.headers["ETag"] = etag
+        resp.headers["Cache-Control"] = "no-cache"
         return resp
 
+    except ValueError as e:
+        return make_response(jsonify({"error": type(e).__name__, "message": str(e)}), 400)
+    except Exception as e:
+        err = {"error": type(e).__name__, "message": str(e)}
+        print(f"[API] ERROR: {err}", flush=True)
+        metrics.inc("warrant_api_errors_total", kind=type(e).__name__)
+        return make_response(jsonify(err), 500)
+
+
+MAX_BARS = 20000
+
+
+@app.route("/api/warrants/<wid>/history")
+def api_warrant_history(wid):
+    if hist is None:
+        return make_response(jsonify({"error": "Disabled", "message": "沒有設定 HISTORY_DB"}), 404)
+    from bars import parse_bar, to_json
+    from history import parse_time
+
+    try:
+        res = parse_bar(request.args.get("bar", "5m"))
+        t1 = parse_time(request.args.get("to")) or datetime.now().timestamp()
+        t0 = parse_time(request.args.get("from")) or t1 - 86400
+    except ValueError as e:
+        return make_response(jsonify({"error": "ValueError", "message": str(e)}), 400)
+    if t1 <= t0 or (t1 - t0) / res > MAX_BARS:
+        return make_response(jsonify({"error": "ValueError", "message": f"時間區間不合理或超過 {MAX_BARS} 根 K 棒"}), 400)
+    with metrics.stage("history_bars"):
+        data = to_json(hist.bars(wid, t0, t1, res))
+    resp = make_response(jsonify({"wid": wid, "bar": request.args.get("bar", "5m"), "from": t0, "to": t1,
+                                  "count": len(data["t"]), **data}))
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
+
+
+@app.route("/api/risk")
+def api_risk():
+    """部位風險；快照過期才重抓部位裡的 WID（SNAPSHOT_TTL），結果由 listener 增量併入。"""
+    if risk_book is None:
+        return make_response(jsonify({"error": "Disabled", "message": "沒有設定 RISK_POSITIONS"}), 404)
+    try:
+        deadline = parse_deadline()
+        snap, _ = snapshots.get(risk_book.wids, deadline=deadline)
+    except ValueError as e:
+        return make_response(jsonify({"error": type(e).__name__, "message": str(e)}), 400)
     except Exception as e:
         err = {"error": type(e).__name__, "message": str(e)}
         print(f"[API] ERROR: {err}", flush=True)
+        metrics.inc("warrant_api_errors_total", kind=type(e).__name__)
         return make_response(jsonify(err), 500)
+    with metrics.stage("risk"):
+        data = risk_book.summary()
+    resp = make_response(jsonify({"generated_at": snap.generated_at, "version": snap.digest, **data}))
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
+
+
+@app.route("/api/alerts")
+def api_alerts():
+    """最近觸發的警示（不觸發抓取）；since= 帶上次看到的最大 id 只拿新的。"""
+    if alert_engine is None:
+        return make_response(jsonify({"error": "Disabled", "message": "沒有設定 ALERT_RULES"}), 404)
+    items = alert_engine.since(request.args.get("since", type=int, default=0))
+    resp = make_response(jsonify({"count": len(items), "rules": len(alert_engine.rules), "items": items}))
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
+
+
+@app.route("/api/quotes")
+def api_quotes():
+    """共享報價表的內容（不觸發抓取）；數值欄位為 float，沒有值為 null。"""
+    if quotes is None:
+        return make_response(jsonify({"error": "Disabled", "message": "沒有設定 QUOTE_TABLE"}), 404)
+    from quotetable import FIELDS
+
+    q = request.args.get("wids", "")
+    wids = [x.strip() for x in q.split(",") if x.strip()] or None
+    fields = [f.strip() for f in request.args.get("fields", "").split(",") if f.strip()] or FIELDS
+    unknown = [f for f in fields if f not in FIELDS]
+    if unknown:
+        return make_response(jsonify({"error": "ValueError", "message": f"未知的欄位：{', '.join(unknown)}"}), 400)
+    with metrics.stage("quote_table_read"):
+        cols = quotes.columns(wids, fields)
+    resp = make_response(jsonify({"count": len(cols["updated"]), "fields": fields, "columns": cols}))
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
+
+
+@app.route("/api/stream")
+def api_stream():
+    q = request.args.get("wids", "")
+    wids = [x.strip() for x in q.split(",") if x.strip()] or DEFAULT_WIDS
+    sub = feed.subscribe(wids)
+    resp = Response(feed.stream(sub), mimetype="text/event-stream")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"  # nginx 不要緩衝
+    return resp
+
+
+@app.route("/api/jobs", methods=["POST"])
+def api_jobs_create():
+    body = request.get_json(silent=True) or {}
+    try:
+        if body.get("wids"):
+            wids = body["wids"]
+            if isinstance(wids, str):
+                wids = wids.split(",")
+            wids = [str(x).strip() for x in wids if str(x).strip()]
+        else:
+            wids = load_universe(body.get("universe", "default"), DEFAULT_WIDS)
+        wids = filter_wids(wids, body.get("prefix", ""), body.get("kind", ""))
+        deadline = float(body["deadline"]) if body.get("deadline") is not None else None
+        if deadline is not None and deadline <= 0:
+            raise ValueError("deadline 必須大於 0 秒")
+    except (OSError, TypeError, ValueError) as e:
+        return make_response(jsonify({"error": type(e).__name__, "message": str(e)}), 400)
+    if not wids:
+        return make_response(jsonify({"error": "EmptyJob", "message": "沒有符合條件的 WID"}), 400)
+
+    try:
+        job = job_manager.submit(wids, deadline=deadline)
+    except JobQueueFull as e:
+        resp = make_response(jsonify({"error": "TooManyJobs", "message": str(e)}), 429)
+        resp.headers["Retry-After"] = "30"
+        return resp
+    print(f"[JOB] {job.id} queued: {len(wids)} WIDs (deadline={deadline or '-'})", flush=True)
+    resp = make_response(jsonify({
+        "id": job.id,
+        "total": len(wids),
+        "status_url": f"/api/jobs/{job.id}",
+        "result_url": f"/api/jobs/{job.id}/result",
+    }), 202)
+    resp.headers["Location"] = f"/api/jobs/{job.id}"
+    return resp
+
+
+@app.route("/api/jobs/<job_id>")
+def api_jobs_status(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return make_response(jsonify({"error": "NotFound", "message": f"沒有這個 job：{job_id}"}), 404)
+    resp = make_response(jsonify(job.snapshot(with_items=request.args.get("items", "1") != "0")))
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
+
+
+@app.route("/api/jobs/<job_id>/result")
+def api_jobs_result(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return make_response(jsonify({"error": "NotFound", "message": f"沒有這個 job：{job_id}"}), 404)
+    if job.state in ("queued", "running"):
+        return make_response(jsonify(job.snapshot(with_items=False)), 409)
+
+    snap = job.snapshot()
+    fmt = request.args.get("format", "json")
+    if fmt not in EXPORT_MIMETYPES:
+        return jsonify({**snap, **deadline_summary(snap["items"])})
+    return export_response(snap["items"], fmt, None, f"warrants_{job.id}")
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    resp = make_response(metrics.render_prometheus())
+    resp.headers["Content-Type"] = "text/plain; version=0.0.4; charset=utf-8"
+    return resp
 
 
 if __name__ == "__main__":
@@ -0,0 +1,421 @@
+# -*- coding: utf-8 -*-
+"""
+分散式抓取：協調者 + 多台 worker，中間是一個 SQLite 工作佇列
+一台機器能開的 Chrome 有限，scrape_batch 也只在單一行程內分工；這裡把每個 WID 變成一筆任務：
+- 協調者（cli.py coordinator）持有佇列檔，提供 HTTP 介面；`--enqueue` / POST /queue/runs 放一輪 WID
+- worker（cli.py worker http://協調者:5100）在任何主機上跑：租任務（lease）→ 抓 → 回報列
+  同一台主機也可以直接給佇列檔路徑，不經 HTTP
+- 租約：租到的任務 QUEUE_LEASE_SEC 秒內要回報或續租（worker 背景每 1/3 租期續一次）；
+  過期（worker 當掉、斷線）就放回佇列重新派送，最多 QUEUE_MAX_ATTEMPTS 次，之後標為 failed
+- 每台主機同時持有的租約數有上限（預設 HOST_MAX_LEASES，可依主機調：--host-limit boxA=8），
+  避免某台把 Chrome 開到爆
+- 逾時 / 錯誤的列（Error、Timeout、Pending）視為失敗重派；其他狀態（OK、非權證…）算完成
+- 租約過期後才送到的結果：任務還沒被別人租走就照收，已經被別人租走就丟掉（以新租約為準）
+可用環境變數：
+  - QUEUE_LEASE_SEC=120、QUEUE_MAX_ATTEMPTS=3、HOST_MAX_LEASES=4
+  - WORKER_BATCH=4（每次租幾檔，跟 scrape_batch 一批開一個 driver 一致）、WORKER_POLL=2（秒）
+  - WORKER_REPORT_RETRIES=5   回報（complete / fail）失敗時重試幾次（1, 2, 4… 秒退避，最多 30 秒）；
+    都失敗才放棄，讓租約過期後重派，worker 本身繼續跑
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+QUEUE_LEASE_SEC = float(os.getenv("QUEUE_LEASE_SEC", "120"))
+QUEUE_MAX_ATTEMPTS = int(os.getenv("QUEUE_MAX_ATTEMPTS", "3"))
+HOST_MAX_LEASES = int(os.getenv("HOST_MAX_LEASES", "4"))
+WORKER_BATCH = int(os.getenv("WORKER_BATCH", "4"))
+WORKER_POLL = float(os.getenv("WORKER_POLL", "2"))
+WORKER_REPORT_RETRIES = int(os.getenv("WORKER_REPORT_RETRIES", "5"))
+
+STATES = ("queued", "leased", "done", "failed")
+RETRY_PREFIXES = ("Error", "Timeout", "Pending")
+
+
+def should_retry(row):
+    return str(row.get("狀態", "")).startswith(RETRY_PREFIXES)
+
+
+class WorkQueue:
+    def __init__(self, path):
+        self.path = path
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS runs (id TEXT PRIMARY KEY, created REAL NOT NULL, total INTEGER NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS tasks ("
+            " id INTEGER PRIMARY KEY, run TEXT NOT NULL, wid TEXT NOT NULL, state TEXT NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0, owner TEXT, host TEXT, lease_until REAL,"
+            " row TEXT, error TEXT, updated REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state, id);"
+            "CREATE INDEX IF NOT EXISTS tasks_run ON tasks (run, id);"
+            "CREATE TABLE IF NOT EXISTS hosts (host TEXT PRIMARY KEY, max_leases INTEGER NOT NULL);"
+        )
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _tx(self):
+        """BEGIN IMMEDIATE：多個行程共用同一個檔時，租約的「查 + 改」也是原子的。"""
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            yield self._db
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
+
+    # ====== 協調者 ======
+    def enqueue(self, wids, run_id=None):
+        run_id = run_id or uuid.uuid4().hex[:12]
+        now = time.time()
+        with self._lock, self._tx() as db:
+            db.execute("INSERT INTO runs (id, created, total) VALUES (?, ?, ?)", (run_id, now, len(wids)))
+            db.executemany(
+                "INSERT INTO tasks (run, wid, state, updated) VALUES (?, ?, 'queued', ?)",
+                [(run_id, w, now) for w in wids],
+            )
+        return run_id
+
+    def set_host_limit(self, host, max_leases):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO hosts (host, max_leases) VALUES (?, ?)", (host, int(max_leases)))
+
+    def _reap(self, db, now):
+        """過期的租約放回佇列；次數用完的標 failed。"""
+        db.execute(
+            "UPDATE tasks SET state = 'failed', error = 'lease expired', owner = NULL, updated = ?"
+            " WHERE state = 'leased' AND lease_until < ? AND attempts >= ?",
+            (now, now, QUEUE_MAX_ATTEMPTS),
+        )
+        n = db.execute(
+            "UPDATE tasks SET state = 'queued', owner = NULL, host = NULL, updated = ?"
+            " WHERE state = 'leased' AND lease_until < ?",
+            (now, now),
+        ).rowcount
+        if n:
+            print(f"[QUEUE] {n} expired leases re-queued", flush=True)
+
+    # ====== worker ======
+    def lease(self, worker, host, n=WORKER_BATCH, lease_sec=QUEUE_LEASE_SEC):
+        """租最多 n 筆；受該主機的租約上限限制。回傳 [{"id", "wid"}]。"""
+        now = time.time()
+        with self._lock, self._tx() as db:
+            self._reap(db, now)
+            limit = db.execute("SELECT max_leases FROM hosts WHERE host = ?", (host,)).fetchone()
+            limit = HOST_MAX_LEASES if limit is None else limit[0]
+            (held,), = db.execute("SELECT COUNT(*) FROM tasks WHERE state = 'leased' AND host = ?", (host,))
+            take = min(n, limit - held)
+            if take <= 0:
+                return []
+            rows = db.execute("SELECT id, wid FROM tasks WHERE state = 'queued' ORDER BY id LIMIT ?", (take,)).fetchall()
+            db.executemany(
+                "UPDATE tasks SET state = 'leased', owner = ?, host = ?, lease_until = ?,"
+                " attempts = attempts + 1, updated = ? WHERE id = ?",
+                [(worker, host, now + lease_sec, now, i) for i, _ in rows],
+            )
+        return [{"id": i, "wid": w} for i, w in rows]
+
+    def heartbeat(self, worker, ids, lease_sec=QUEUE_LEASE_SEC):
+        """續租；回傳仍屬於這個 worker 的任務 id。"""
+        now = time.time()
+        with self._lock, self._tx() as db:
+            kept = []
+            for i in ids:
+                if db.execute(
+                    "UPDATE tasks SET lease_until = ?, updated = ? WHERE id = ? AND state = 'leased' AND owner = ?",
+                    (now + lease_sec, now, i, worker),
+                ).rowcount:
+                    kept.append(i)
+        return kept
+
+    def complete(self, worker, task_id, row):
+        """回報一筆結果；被別人接手的任務回傳 False。"""
+        now = time.time()
+        body = json.dumps(row, ensure_ascii=False, default=str)
+        with self._lock, self._tx() as db:
+            return bool(db.execute(
+                "UPDATE tasks SET state = 'done', row = ?, error = NULL, owner = ?, lease_until = NULL, updated = ?"
+                " WHERE id = ? AND ((state = 'leased' AND owner = ?) OR state = 'queued')",
+                (body, worker, now, task_id, worker),
+            ).rowcount)
+
+    def fail(self, worker, task_id, error, row=None):
+        """這次沒抓到：次數還沒用完就放回佇列，否則標 failed（留下最後一次的列）。"""
+        now = time.time()
+        body = None if row is None else json.dumps(row, ensure_ascii=False, default=str)
+        with self._lock, self._tx() as db:
+            return bool(db.execute(
+                "UPDATE tasks SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END,"
+                " owner = NULL, host = NULL, lease_until = NULL, error = ?, row = COALESCE(?, row), updated = ?"
+                " WHERE id = ? AND state = 'leased' AND owner = ?",
+                (QUEUE_MAX_ATTEMPTS, str(error), body, now, task_id, worker),
+            ).rowcount)
+
+    # ====== 查詢 ======
+    def status(self, run_id=None):
+        with self._lock:
+            where, args = ("WHERE run = ?", (run_id,)) if run_id else ("", ())
+            counts = {s: 0 for s in STATES}
+            counts.update(dict(self._db.execute(f"SELECT state, COUNT(*) FROM tasks {where} GROUP BY state", args)))
+            hosts = dict(self._db.execute(
+                f"SELECT host, COUNT(*) FROM tasks WHERE state = 'leased'{' AND run = ?' if run_id else ''} GROUP BY host",
+                args))
+            limits = dict(self._db.execute("SELECT host, max_leases FROM hosts"))
+            runs = [
+                {"id": r, "created_at": datetime.fromtimestamp(c).strftime("%Y-%m-%d %H:%M:%S"), "total": t}
+                for r, c, t in self._db.execute(
+                    f"SELECT id, created, total FROM runs {'WHERE id = ?' if run_id else ''} ORDER BY created DESC LIMIT 20",
+                    args)
+            ]
+        total = sum(counts.values())
+        return {
+            "counts": counts,
+            "progress": round((counts["done"] + counts["failed"]) / total, 4) if total else 1.0,
+            "leases_by_host": hosts,
+            "host_limits": {**limits, "*": HOST_MAX_LEASES},
+            "runs": runs,
+        }
+
+    def rows(self, run_id):
+        """依放進佇列的順序回傳列；失敗的用最後一次的列（沒有就給錯誤列）。"""
+        with self._lock:
+            cur = self._db.execute("SELECT wid, state, row, error FROM tasks WHERE run = ? ORDER BY id", (run_id,))
+            out = []
+            for wid, state, row, error in cur:
+                if row is not None:
+                    out.append(json.loads(row))
+                elif state == "failed":
+                    out.append({"WID": wid, "狀態": f"Error: {error}"})
+        return out
+
+    def close(self):
+        self._db.close()
+
+
+class RemoteQueue:
+    """WorkQueue 的 HTTP 版本（worker 端用），介面相同。"""
+
+    def __init__(self, url, timeout=30):
+        import requests
+
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self._http = requests.Session()
+
+    def _post(self, path, body):
+        r = self._http.post(f"{self.url}{path}", json=body, timeout=self.timeout)
+        r.raise_for_status()
+        return r.json()
+
+    def lease(self, worker, host, n=WORKER_BATCH, lease_sec=QUEUE_LEASE_SEC):
+        return self._post("/queue/lease", {"worker": worker, "host": host, "n": n, "lease_sec": lease_sec})["tasks"]
+
+    def heartbeat(self, worker, ids, lease_sec=QUEUE_LEASE_SEC):
+        return self._post("/queue/heartbeat", {"worker": worker, "ids": ids, "lease_sec": lease_sec})["ids"]
+
+    def complete(self, worker, task_id, row):
+        return self._post("/queue/complete", {"worker": worker, "id": task_id, "row": row})["ok"]
+
+    def fail(self, worker, task_id, error, row=None):
+        return self._post("/queue/fail", {"worker": worker, "id": task_id, "error": error, "row": row})["ok"]
+
+    def enqueue(self, wids, run_id=None):
+        return self._post("/queue/runs", {"wids": list(wids), "run": run_id})["run"]
+
+    def status(self, run_id=None):
+        path = f"/queue/runs/{run_id}" if run_id else "/queue/status"
+        r = self._http.get(f"{self.url}{path}", timeout=self.timeout)
+        r.raise_for_status()
+        return r.json()
+
+
+def open_queue(target):
+    """http(s):// 開頭走 HTTP，其他當成佇列檔路徑。"""
+    if target.startswith(("http://", "https://")):
+        return RemoteQueue(target)
+    return WorkQueue(target)
+
+
+# ====== 協調者 HTTP 介面 ======
+def create_app(queue, default_wids=()):
+    from flask import Flask, jsonify, make_response, request
+
+    from jobs import filter_wids, load_universe
+
+    app = Flask("workqueue")
+
+    def bad(msg, code=400):
+        return make_response(jsonify({"error": "ValueError", "message": msg}), code)
+
+    @app.route("/queue/runs", methods=["POST"])
+    def runs_create():
+        body = request.get_json(silent=True) or {}
+        try:
+            wids = body.get("wids") or load_universe(body.get("universe", "default"), default_wids)
+            wids = filter_wids([str(w).strip() for w in wids if str(w).strip()],
+                               body.get("prefix", ""), body.get("kind", ""))
+        except ValueError as e:
+            return bad(str(e))
+        if not wids:
+            return bad("沒有要抓的 WID")
+        run_id = queue.enqueue(wids, body.get("run"))
+        print(f"[QUEUE] run {run_id}: {len(wids)} WIDs queued", flush=True)
+        return make_response(jsonify({"run": run_id, "total": len(wids), "status_url": f"/queue/runs/{run_id}"}), 202)
+
+    @app.route("/queue/runs/<run_id>")
+    def runs_status(run_id):
+        out = queue.status(run_id)
+        if not out["runs"]:
+            return bad(f"找不到 run：{run_id}", 404)
+        if request.args.get("items", "0") not in ("0", "false", ""):
+            out["items"] = queue.rows(run_id)
+        return jsonify(out)
+
+    @app.route("/queue/status")
+    def status():
+        return jsonify(queue.status())
+
+    @app.route("/queue/lease", methods=["POST"])
+    def lease():
+        b = request.get_json(force=True)
+        tasks = queue.lease(b["worker"], b["host"], int(b.get("n", WORKER_BATCH)),
+                            float(b.get("lease_sec", QUEUE_LEASE_SEC)))
+        return jsonify({"tasks": tasks})
+
+    @app.route("/queue/heartbeat", methods=["POST"])
+    def heartbeat():
+        b = request.get_json(force=True)
+        return jsonify({"ids": queue.heartbeat(b["worker"], b["ids"], float(b.get("lease_sec", QUEUE_LEASE_SEC)))})
+
+    @app.route("/queue/complete", methods=["POST"])
+    def complete():
+        b = request.get_json(force=True)
+        return jsonify({"ok": queue.complete(b["worker"], b["id"], b["row"])})
+
+    @app.route("/queue/fail", methods=["POST"])
+    def fail():
+        b = request.get_json(force=True)
+        return jsonify({"ok": queue.fail(b["worker"], b["id"], b.get("error", ""), b.get("row"))})
+
+    return app
+
+
+# ====== worker ======
+def run_worker(queue, scrape_fn, slots=1, host=None, batch=WORKER_BATCH, lease_sec=QUEUE_LEASE_SEC,
+               stop=None, idle_exit=False):
+    """slots 個執行緒各自 租 → 抓 → 回報；scrape_fn(wids, batch_size, deadline=) -> rows（同 scrape_batch）。
+    idle_exit=True 時佇列裡沒有待辦也沒有租出中的任務就結束（跑完一輪用）。"""
+    host = host or socket.gethostname()
+    batch = batch or WORKER_BATCH
+    worker = f"{host}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+    stop = stop or threading.Event()
+    held = set()
+    held_lock = threading.Lock()
+
+    def beat():
+        while not stop.wait(lease_sec / 3):
+            with held_lock:
+                ids = list(held)
+            if ids:
+                try:
+                    lost = set(ids) - set(queue.heartbeat(worker, ids, lease_sec))
+                except Exception as e:
+                    print(f"[WORKER] heartbeat failed: {e}", flush=True)
+                    continue
+                if lost:
+                    print(f"[WORKER] lost leases: {sorted(lost)}", flush=True)
+
+    def slot():
+        while not stop.is_set():
+            try:
+                tasks = queue.lease(worker, host, batch, lease_sec)
+            except Exception as e:
+                print(f"[WORKER] lease failed: {e}", flush=True)
+                stop.wait(WORKER_POLL)
+                continue
+            # 沒租到可能是佇列空了，也可能是這台已達上限：只有真的沒有待辦 / 租出中的任務才結束
+            if not tasks:
+                if idle_exit and _drained(queue):
+                    return
+                stop.wait(WORKER_POLL)
+                continue
+            with held_lock:
+                held.update(t["id"] for t in tasks)
+            try:
+                _scrape_tasks(queue, worker, scrape_fn, tasks, lease_sec)
+            except Exception as e:  # 不讓一批的意外錯誤收掉整個 slot；沒回報的任務等租約過期重派
+                print(f"[WORKER] batch aborted: {type(e).__name__}: {e}", flush=True)
+            finally:
+                with held_lock:
+                    held.difference_update(t["id"] for t in tasks)
+
+    threading.Thread(target=beat, daemon=True, name="lease-heartbeat").start()
+    threads = [threading.Thread(target=slot, name=f"worker-{i}") for i in range(slots)]
+    print(f"[WORKER] {worker}: {slots} slot(s) x {batch} WIDs", flush=True)
+    for t in threads:
+        t.start()
+    try:
+        for t in threads:
+            t.join()
+    finally:
+        stop.set()
+
+
+def _drained(queue):
+    try:
+        counts = queue.status()["counts"]
+    except Exception as e:
+        print(f"[WORKER] status failed: {e}", flush=True)
+        return False
+    return not (counts.get("queued") or counts.get("leased"))
+
+
+def _report(fn, *args, retries=None):
+    """回報協調者，暫時性錯誤就退避重試；重試用完回傳 None（任務留給租約過期後重派）。"""
+    retries = WORKER_REPORT_RETRIES if retries is None else retries
+    for attempt in range(retries + 1):
+        try:
+            return fn(*args)
+        except Exception as e:
+            if attempt == retries:
+                print(f"[WORKER] {fn.__name__} gave up after {retries + 1} tries: {type(e).__name__}: {e}", flush=True)
+                return None
+            delay = min(2 ** attempt, 30)
+            print(f"[WORKER] {fn.__name__} failed ({type(e).__name__}: {e}), retry in {delay}s", flush=True)
+            time.sleep(delay)
+
+
+def _scrape_tasks(queue, worker, scrape_fn, tasks, lease_sec):
+    by_wid = {}
+    for t in tasks:
+        by_wid.setdefault(t["wid"], []).append(t["id"])
+    wids = list(by_wid)
+    t0 = time.perf_counter()
+    try:
+        # 期限留一點給回報，過了租期就算抓完也可能被別人接手
+        rows = scrape_fn(wids, len(wids), deadline=lease_sec * 0.8)
+    except Exception as e:
+        for t in tasks:
+            _report(queue.fail, worker, t["id"], f"{type(e).__name__}: {e}")
+        print(f"[WORKER] batch failed: {type(e).__name__}: {e}", flush=True)
+        return
+    got = {r.get("WID"): r for r in rows}
+    ok = 0
+    for wid, ids in by_wid.items():
+        row = got.get(wid)
+        for i in ids:
+            if row is None:
+                _report(queue.fail, worker, i, "沒有回傳這檔")
+            elif should_retry(row):
+                _report(queue.fail, worker, i, row.get("狀態", ""), row)
+            elif _report(queue.complete, worker, i, row):
+                ok += 1
+    print(f"[WORKER] {ok}/{len(tasks)} done in {time.perf_counter() - t0:.1f}s: {', '.join(wids)}", flush=True)
@@ -1,14 +1,18 @@
 from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
-from webdriver_manager.chrome import ChromeDriverManager
 from datetime import datetime
-import openpyxl, os, re, time
-import requests 
-import math
+import os, re, time
+
+import driver_factory
+import metrics
+import orderbook
+import profiling
+from core import BASIC_LABELS, ensure_all_keys, get_udly_best_ask_from_api, warrant_url
+from checkpoint import Checkpoint, assemble
+from sinks import open_sinks
 
 # ======= 設定 =======
 wid_list = [
@@ -17,19 +21,6 @@ wid_list = [
     "07879P", "079683", "08700P", "08769P", "08992P", "71974U"
 ]
 
-BASIC_LABELS = [
-    "上市日期","最後交易日","到期日期","發行型態","最新發行張數",
-    "流通在外張數/比例","最新履約價","最新行使比例",
-    "買價隱波","賣價隱波","Delta","Theta",
-    "剩餘天數","價內外程度","實質槓桿","買賣價差比"
-]
-
-HEADER_ORDER = [
-    "WID","狀態","成交價","買價","賣價",
-    "標的名稱","標的股價","標的代碼",
-    *BASIC_LABELS, "抓取時間","來源網址"
-]
-
 # ======= 啟動 Driver =======
 def launch_driver(headless=False):
     options = webdriver.ChromeOptions()
@@ -38,8 +29,7 @@ def launch_driver(headless=False):
     options.add_argument("--disable-blink-features=AutomationControlled")
     options.add_argument("--no-sandbox")
     options.add_argument("--disable-dev-shm-usage")
-    service = Service(ChromeDriverManager().install())
-    return webdriver.Chrome(service=service, options=options)
+    return driver_factory.create_driver(options)
 
 # ======= 抓資料輔助 =======
 def text_or_blank(driver, by, sel):
@@ -96,36 +86,6 @@ def get_target_name_code(driver):
 
     return name, code
 
-# ======= NEW：從 Yuanta API 取「標的股價＝賣一(ask1)」 =======
-def get_udly_best_ask_from_api(udly_code: str, timeout=8):
-    """
-    /ws/Quote.ashx?type=mem_ta5&symbol={udly_code}
-    鍵位：
-      101=買一, 102=賣一, 103=買二, 104=賣二, ..., 110=賣五
-      113..117=買一~買五量, 118..122=賣一~賣五量
-    回傳 float 或 None
-    """
-    if not udly_code:
-        return None
-    url = f"https://www.warrantwin.com.tw/eyuanta/ws/Quote.ashx?type=mem_ta5&symbol={udly_code}"
-    try:
-        r = requests.get(url, timeout=timeout)
-        r.raise_for_status()
-        data = r.json()
-        items = data.get("items", {})
-        ask1 = items.get("102") if isinstance(items, dict) else None
-        if ask1 is None and isinstance(items, dict):  # 保險：整數鍵
-            ask1 = items.get(102)
-        if ask1 is None:
-            return None
-        try:
-            return float(str(ask1).replace(",", ""))
-        except Exception:
-            return None
-    except Exception as e:
-        print("⚠️ get_udly_best_ask_from_api error:", e)
-        return None
-
 # （可留作備援）從 DOM 五檔表抓第一列賣價
 def get_target_best_ask_from_dom(driver):
     try:
@@ -139,21 +99,18 @@ def get_target_best_ask_from_dom(driver):
     except Exception:
         return ""
 
-def ensure_all_keys(row: dict) -> dict:
-    for k in HEADER_ORDER:
-        row.setdefault(k, "")
-    return row
-
 # ======= 抓單筆 =======
 def scrape_one_wid(driver, wid):
-    url = f"https://www.warrantwin.com.tw/eyuanta/Warrant/Info.aspx?WID={wid}"
-    driver.get(url)
+    url = warrant_url(wid)
+    with metrics.stage("drv_get", wid):
+        driver.get(url)
 
     try:
         # 等待頁面顯示正確的 WID，避免殘留舊頁
-        WebDriverWait(driver, 12).until(
-            EC.text_to_be_present_in_element((By.XPATH, "//*[contains(@ng-bind, 'WAR_ID') or contains(@id,'lblWID')]"), wid)
-        )
+        with metrics.stage("wait_wid", wid):
+            WebDriverWait(driver, 12).until(
+                EC.text_to_be_present_in_element((By.XPATH, "//*[contains(@ng-bind, 'WAR_ID') or contains(@id,'lblWID')]"), wid)
+            )
     except TimeoutException:
         return ensure_all_keys({
             "WID": wid, "狀態": "Timeout", "來源網址": url,
@@ -162,22 +119,25 @@ def scrape_one_wid(driver, wid):
 
     # 三價（成交/買/賣）
     try:
-        WebDriverWait(driver, 8).until(
-            EC.presence_of_element_located((By.XPATH, "//*[contains(@ng-bind, 'WAR_DEAL_PRICE')]"))
-        )
+        with metrics.stage("wait_deal_price", wid):
+            WebDriverWait(driver, 8).until(
+                EC.presence_of_element_located((By.XPATH, "//*[contains(@ng-bind, 'WAR_DEAL_PRICE')]"))
+            )
     except TimeoutException:
         pass
 
-    deal = text_or_blank(driver, By.XPATH, "//*[contains(@ng-bind, 'WAR_DEAL_PRICE')]")
-    buy  = text_or_blank(driver, By.XPATH, "//*[contains(@ng-bind, 'WAR_BUY_PRICE')]")
-    sell = text_or_blank(driver, By.XPATH, "//*[contains(@ng-bind, 'WAR_SELL_PRICE')]")
+    with metrics.stage("extract_prices", wid):
+        deal = text_or_blank(driver, By.XPATH, "//*[contains(@ng-bind, 'WAR_DEAL_PRICE')]")
+        buy  = text_or_blank(driver, By.XPATH, "//*[contains(@ng-bind, 'WAR_BUY_PRICE')]")
+        sell = text_or_blank(driver, By.XPATH, "//*[contains(@ng-bind, 'WAR_SELL_PRICE')]")
 
     # 備援：用 class="tBig"
     if not (deal and buy and sell):
         try:
-            WebDriverWait(driver, 5).until(
-                EC.presence_of_all_elements_located((By.CLASS_NAME, "tBig"))
-            )
+            with metrics.stage("wait_tbig", wid):
+                WebDriverWait(driver, 5).until(
+                    EC.presence_of_all_elements_located((By.CLASS_NAME, "tBig"))
+                )
             prices = [e.text.strip() for e in driver.find_elements(By.CLASS_NAME, "tBig")]
             if len(prices) >= 3:
                 deal = deal or prices[0]
@@ -187,13 +147,17 @@ def scrape_one_wid(driver, wid):
             pass
 
     # 標的名稱與代碼
-    tgt_name, tgt_code = get_target_name_code(driver)
+    with metrics.stage("extract_target", wid):
+        tgt_name, tgt_code = get_target_name_code(driver)
 
     # 標的股價（優先 API → DOM 備援）
     tgt_stock_price = get_udly_best_ask_from_api(tgt_code)
     if tgt_stock_price is None:
-        dom_price = get_target_best_ask_from_dom(driver)
+        with metrics.stage("wait_dom_ask", wid):
+            dom_price = get_target_best_ask_from_dom(driver)
         tgt_stock_price = float(dom_price) if dom_price else ""
+    if orderbook.capturing():
+        orderbook.fetch_ta5(wid, kind="warrant")  # 權證本身的五檔
 
     row = {
         "WID": wid,
@@ -208,8 +172,9 @@ def scrape_one_wid(driver, wid):
         "抓取時間": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
     }
 
-    for label in BASIC_LABELS:
-        row[label] = find_basic_value_by_label(driver, label)
+    with metrics.stage("extract_basic", wid):
+        for label in BASIC_LABELS:
+            row[label] = find_basic_value_by_label(driver, label)
 
     return ensure_all_keys(row)
 
@@ -261,97 +226,71 @@ def scrape_one_wid(driver, wid):
 
     return ensure_all_keys(row)
 
-# ======= 寫 Excel + 試算 =======
-def clean_number(val):
-    """把文字轉成純數字字串，去掉 %, 天, 逗號等雜字"""
-    if val is None:
-        return ""
-    s = str(val).strip()
-    s = s.replace(",", "")
-    s = s.replace("%", "")
-    s = re.sub(r"[^\d.]", "", s)  # 保留數字和小數點
-    return s
-
-def save_rows_to_excel(rows, filename="yuanta_warrants.xlsx"):
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "元大權證"
-    ws.append(HEADER_ORDER)
-
-    # 主表
-    for r in rows:
-        ws.append([r.get(k, "") for k in HEADER_ORDER])
-
-    # 每個 WID 各做一張試算表
-    for r in rows:
-        wid = r.get("WID", "")
-        calc = wb.create_sheet(f"試算_{wid}")
-
-        # ===== 標籤與輸入 =====
-        calc["A1"] = "WID"; calc["B1"] = wid
-        calc["A2"] = "標的股價"; calc["B2"] = clean_number(r.get("標的股價", ""))
-        calc["A3"] = "買價隱波（％）"; calc["B3"] = clean_number(r.get("買價隱波", ""))
-        calc["A4"] = "評價日"; calc["B4"] = datetime.now().strftime("%Y/%m/%d")
-        calc["A6"] = "無風險利率 r（年化）"; calc["B6"] = 0.02
-
-        calc["F1"] = "（以下自動帶入）"
-        calc["F2"] = "履約價 K"; calc["G2"] = clean_number(r.get("最新履約價", ""))
-        calc["F3"] = "剩餘天數"; calc["G3"] = clean_number(r.get("剩餘天數", ""))
-        calc["F4"] = "行使比例（數值）"; calc["G4"] = clean_number(r.get("最新行使比例", ""))
-
-        # ===== Excel 公式 =====
-        def call_formula_str(S="B2", K="G2", DAYS="G3", R="B6", IV="B3", CR="G4"):
-            d1 = f"(LN({S}/{K}) + ({R} + (({IV}/100)^2)/2)*({DAYS}/365)) / (({IV}/100)*SQRT({DAYS}/365))"
-            d2 = f"{d1} - ({IV}/100)*SQRT({DAYS}/365)"
-            return (f"=({S}*NORMDIST({d1},0,1,TRUE) - {K}*EXP(-{R}*({DAYS}/365))*NORMDIST({d2},0,1,TRUE))*{CR}")
-
-        def put_formula_str(S="B2", K="G2", DAYS="G3", R="B6", IV="B3", CR="G4"):
-            d1 = f"(LN({S}/{K}) + ({R} + (({IV}/100)^2)/2)*({DAYS}/365)) / (({IV}/100)*SQRT({DAYS}/365))"
-            d2 = f"{d1} - ({IV}/100)*SQRT({DAYS}/365)"
-            return (f"=({K}*EXP(-{R}*({DAYS}/365))*NORMDIST(-({d2}),0,1,TRUE) - {S}*NORMDIST(-({d1}),0,1,TRUE))*{CR}")
-
-        issue_type = str(r.get("發行型態", "")) + str(r.get("認購/認售", ""))
-        is_put = "認售" in issue_type
-
-        calc["A8"] = "理論價 (BS)"
-        calc["B8"] = put_formula_str() if is_put else call_formula_str()
-
-        # 成交價顯示
-        calc["C10"] = f"成交價: {r.get('成交價', '')}"
-
-        # 格式化
-        for cell in ["A1","A2","A3","A4","A6","F2","F3","F4","A8"]:
-            calc[cell].font = openpyxl.styles.Font(bold=True)
-        for col, width in [("A",16),("B",14),("C",28),("F",22),("G",18)]:
-            calc.column_dimensions[col].width = width
-
-    # 儲存到桌面
-    desktop = os.path.join(os.path.expanduser("~"), "Desktop")
-    out_path = os.path.join(desktop, filename)
-    wb.save(out_path)
-    print(f"✅ 已寫入 Excel：{out_path}")
-
 # ======= 主流程 =======
-def main():
-    driver = launch_driver(headless=False)
+def default_output():
+    return os.path.join(os.path.expanduser("~"), "Desktop", "yuanta_warrants.xlsx")
+
+def run(wids, headless=False, outputs=None, checkpoint=None, resume=False, fresh_within=None, books=None):
+    """抓一串 WID，每抓完一列就寫進所有輸出（xlsx/csv/jsonl/parquet）；回傳資料列。
+    cli.py 的 scrape 子命令也走這裡。outputs 沒給就只寫桌面的 xlsx。
+    checkpoint=路徑 時每列先寫進檢查點，全部跑完再從檢查點組出輸出；
+    resume=True 會跳過檢查點裡 fresh_within 秒內已成功的 WID。
+    books=路徑.npz 時標的與權證的完整五檔一併記下，結束時存檔（見 orderbook.py）。
+    """
+    outputs = outputs or [default_output()]
+    ckpt = Checkpoint(checkpoint) if checkpoint else None
+    todo = list(wids)
+    if ckpt and resume:
+        done = ckpt.completed(wids, fresh_within)
+        todo = [w for w in wids if w not in done]
+        print(f"⏩ 檢查點已有 {len(done)} 檔可沿用，剩 {len(todo)} 檔要抓")
+
+    profiling.start_run("yuanta")
+    if books:
+        orderbook.start_capture(capacity=2 * len(todo) or 1)
+    sink = None if ckpt else open_sinks(outputs)
+    driver = launch_driver(headless=headless) if todo else None
     rows = []
     try:
-        for wid in wid_list:
+        for wid in todo:
             print(f"🔎 抓取 {wid} 中...")
-            row = scrape_one_wid(driver, wid)
+            with profiling.wid_span(wid), metrics.stage("scrape_one", wid):
+                row = scrape_one_wid(driver, wid)
+            metrics.inc("warrant_rows_total", status="ok" if row["狀態"] == "OK" else "degraded")
             print(
                 f"→ 成交:{row.get('成交價','')} 買:{row.get('買價','')} 賣:{row.get('賣價','')} | "
                 f"標的代碼:{row.get('標的代碼','')} 標的股價(賣一):{row.get('標的股價','')}"
             )
             rows.append(row)
+            if ckpt:
+                ckpt.save(row)
+            else:
+                sink.write(row)
             time.sleep(0.3)
     finally:
-        driver.quit()
-
+        if driver:
+            driver.quit()
+        if sink:
+            sink.close()
+        if books:
+            orderbook.stop_capture().save(books)
+        metrics.print_summary()
+        profiling.finish_run()
+
+    if ckpt:
+        rows = ckpt.rows(wids)
+        if rows:
+            assemble(ckpt, outputs, wids)
+        ckpt.close()
     if rows:
-        save_rows_to_excel(rows)
+        if sink:
+            print(f"✅ 已寫入：{', '.join(sink.paths)}")
     else:
         print("⚠️ 沒有資料可寫入")
+    return rows
+
+def main():
+    run(wid_list)
 
 if __name__ == "__main__":
     main()